@@ -0,0 +1,93 @@
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures chopping a plan of stop actions into related chunks. The services
+form chains of ten, each service having to be stopped before the next one.
+The relabeling of earlier versions is measured on small plans only, since
+it touches every component on every merge.
+
+Usage: PYTHONPATH=src/main/python python src/benchmark/python/chunking_benchmark.py [NR_ACTIONS]
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+from yadtshell.actions import Action, ActionPlan, TargetState
+from yadtshell.metalogic import chop_minimal_related_chunks
+
+CHAIN_LENGTH = 10
+
+
+def stop_plan(nr_actions):
+    actions = []
+    for nr in range(nr_actions):
+        action = Action('stop', 'service://host%i/service%i' % (nr / CHAIN_LENGTH, nr % CHAIN_LENGTH),
+                        'state', 'down')
+        if nr % CHAIN_LENGTH:
+            action.preconditions.add(TargetState(actions[-1].uri, 'state', 'down'))
+        actions.append(action)
+    return ActionPlan('stop', actions)
+
+
+def legacy_chop_minimal_related_chunks(plan):
+    def merge_chunks(component_to_chunk, old, new):
+        if old == new:
+            return
+        for uri, old_chunk_nr in component_to_chunk.iteritems():
+            if old_chunk_nr == old:
+                component_to_chunk[uri] = new
+
+    component_to_chunk = {}
+    for nr, action in enumerate(plan.actions):
+        if action.uri not in component_to_chunk:
+            component_to_chunk[action.uri] = nr + 1
+    for action in plan.actions:
+        chunk_nr = component_to_chunk[action.uri]
+        for precond in action.preconditions:
+            if precond.uri in component_to_chunk:
+                chunk_nr = min(component_to_chunk[precond.uri], chunk_nr)
+        merge_chunks(component_to_chunk, component_to_chunk[action.uri], chunk_nr)
+        for precond in action.preconditions:
+            if precond.uri in component_to_chunk:
+                merge_chunks(component_to_chunk, component_to_chunk[precond.uri], chunk_nr)
+
+    chunk_plans = set()
+    for nr, chunk_nr in enumerate(set(component_to_chunk.values())):
+        chunk_actions = set(action for action in plan.actions if component_to_chunk[action.uri] == chunk_nr)
+        chunk_plans.add(ActionPlan('chunk_%s' % nr, chunk_actions))
+    return ActionPlan(plan.name, chunk_plans)
+
+
+def report(label, chop, plan):
+    started = time.time()
+    chunked = chop(plan)
+    print('%-40s %8.3f s (%i chunks)' % (label, time.time() - started, len(chunked.actions)))
+    return sorted((chunk.name, [action.uri for action in chunk.actions]) for chunk in chunked.actions)
+
+
+if __name__ == '__main__':
+    nr_actions = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    for small in (1000, 2000, 5000):
+        plan = stop_plan(small)
+        legacy = report('%i actions, relabeling' % small, legacy_chop_minimal_related_chunks, plan)
+        current = report('%i actions, union-find' % small, chop_minimal_related_chunks, plan)
+        assert legacy == current, 'chunks differ'
+
+    report('%i actions, union-find' % nr_actions, chop_minimal_related_chunks, stop_plan(nr_actions))
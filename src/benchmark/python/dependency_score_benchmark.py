@@ -0,0 +1,83 @@
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the computation of the dependency scores on a wide diamond graph:
+layers of services on one host, each service needing two services of the
+next layer. The recursive listing of all dependencies is measured on
+shallow graphs only, since its cost doubles with every layer.
+
+Usage: PYTHONPATH=src/main/python python src/benchmark/python/dependency_score_benchmark.py [WIDTH] [DEPTH]
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+import yadtshell
+from yadtshell.util import (compute_dependency_scores,
+                            inbound_deps_on_same_host,
+                            outbound_deps_on_same_host)
+
+
+def diamond_components(width, depth):
+    components = yadtshell.components.ComponentDict()
+    host = yadtshell.components.Host('diamond.acme.com')
+    layers = []
+    for layer in range(depth):
+        services = [yadtshell.components.Service(host, 'service%i_%i' % (layer, nr), {})
+                    for nr in range(width)]
+        for service in services:
+            service.needs = set()
+            components[service.uri] = service
+        layers.append(services)
+    for upper, lower in zip(layers, layers[1:]):
+        for nr, service in enumerate(upper):
+            for needed in (lower[nr], lower[(nr + 1) % width]):
+                service.needs.add(needed.uri)
+                needed.needed_by.add(service.uri)
+    return components
+
+
+def legacy_scores(components):
+    for service in components.values():
+        outbound = len(outbound_deps_on_same_host(service, components))
+        inbound = len(inbound_deps_on_same_host(service, components))
+        service.dependency_score = inbound - outbound
+
+
+def report(label, fun, components):
+    started = time.time()
+    fun(components)
+    print('%-48s %8.3f s' % (label, time.time() - started))
+    return dict((uri, service.dependency_score) for uri, service in components.items())
+
+
+if __name__ == '__main__':
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    for shallow_depth in (6, 8, 10, 12):
+        components = diamond_components(width, shallow_depth)
+        label = '%i services (%i x %i)' % (len(components), width, shallow_depth)
+        legacy = report(label + ', recursive listing', legacy_scores, components)
+        current = report(label + ', memoized', compute_dependency_scores, components)
+        assert legacy == current, 'scores differ'
+
+    components = diamond_components(width, depth)
+    report('%i services (%i x %i), memoized' % (len(components), width, depth),
+           compute_dependency_scores, components)
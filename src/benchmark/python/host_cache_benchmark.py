@@ -0,0 +1,110 @@
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the CPU bound part of status (building the components of every
+host from its status data and wiring the dependencies tree) on a synthetic
+target, once without and once with unchanged hosts in the host cache.
+
+Usage: PYTHONPATH=src/main/python python src/benchmark/python/host_cache_benchmark.py [NR_HOSTS]
+"""
+
+from __future__ import print_function
+
+import gc
+import sys
+import time
+
+import simplejson as json
+
+import yadtshell
+from yadtshell.dependency_tree import DependencyTreeBuilder
+from yadtshell.host_cache import HostCache
+
+NR_SERVICES_PER_HOST = 10
+NR_ARTEFACTS_PER_HOST = 20
+
+
+class StatusProtocol(object):
+
+    def __init__(self, component, data):
+        self.component = component
+        self.data = data
+
+
+def status_data(nr):
+    services = {}
+    for i in range(NR_SERVICES_PER_HOST):
+        services['daemon%i' % i] = {
+            'needs_services': ['daemon%i' % (i - 1)] if i else [],
+            'needs_artefacts': ['artefact%i' % i],
+            'state': 'up',
+        }
+    return json.dumps({
+        'fqdn': 'host%04i.acme.com' % nr,
+        'hostname': 'host%04i' % nr,
+        'current_artefacts': ['artefact%i/1.%i' % (i, nr) for i in range(NR_ARTEFACTS_PER_HOST)],
+        'next_artefacts': [],
+        'services': services,
+        'lockstate': None,
+    })
+
+
+def build_components(protocols, host_cache):
+    components = yadtshell.components.ComponentDict()
+    tree = DependencyTreeBuilder(components)
+    started = time.time()
+    for protocol in protocols:
+        host = yadtshell._status.create_host_with_components(protocol, components, host_cache)
+        tree.add_host(host)
+    built = time.time()
+    tree.finish()
+    return components, built - started, time.time() - started
+
+
+def report(label, protocols, host_cache=None):
+    durations = []
+    for _ in range(3):
+        gc.collect()
+        gc.disable()
+        try:
+            components, build_duration, total_duration = build_components(protocols, host_cache)
+        finally:
+            gc.enable()
+        durations.append((build_duration, total_duration))
+    build_duration, total_duration = min(durations)
+    print('%-36s build %7.3f s, incl. tree %7.3f s (%i components)' % (
+        label, build_duration, total_duration, len(components)))
+
+
+if __name__ == '__main__':
+    nr_hosts = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    yadtshell._status.write_host_data_to_file = lambda host, data: None
+    protocols = [StatusProtocol('host%04i.acme.com' % nr, status_data(nr))
+                 for nr in range(nr_hosts)]
+
+    report('%i hosts, no host cache' % nr_hosts, protocols)
+
+    host_cache = HostCache()
+    build_components(protocols, host_cache)
+    report('%i hosts, unchanged in host cache' % nr_hosts, protocols, host_cache)
+
+    changed = [StatusProtocol(p.component, p.data.replace('"up"', '"down"'))
+               if nr % 10 == 0 else p for nr, p in enumerate(protocols)]
+    host_cache = HostCache()
+    build_components(protocols, host_cache)
+    host_cache.store = lambda *args: None
+    report('%i hosts, 10%% changed' % nr_hosts, changed, host_cache)
@@ -0,0 +1,88 @@
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the search for the components touched by stopping the first
+service of chains of services, once with the rounds over all touched
+components of earlier versions and once with the worklist.
+
+Usage: PYTHONPATH=src/main/python python src/benchmark/python/metalogic_closure_benchmark.py [NR_CHAINS] [LENGTH]
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+import yadtshell
+from yadtshell.dependency_graph import DependencyGraph
+from yadtshell.metalogic import touched_closure
+
+
+def chain_components(nr_chains, length):
+    components = yadtshell.components.ComponentDict()
+    host = yadtshell.components.Host('chain.acme.com')
+    components[host.uri] = host
+    first_services = []
+    for chain in range(nr_chains):
+        previous = None
+        for nr in range(length):
+            service = yadtshell.components.Service(host, 'service%i_%i' % (chain, nr), {})
+            components[service.uri] = service
+            if previous:
+                service.needs.add(previous.uri)
+                previous.needed_by.add(service.uri)
+            else:
+                first_services.append(service.uri)
+            previous = service
+    return components, first_services
+
+
+def legacy_closure(graph, components, nodes, key):
+    touched = set(nodes)
+    new_nodes = True
+    while new_nodes:
+        new_nodes = set()
+        for node in touched:
+            component = components[graph.keys[node]]
+            for dependent_node in graph.adjacent(node, key):
+                if dependent_node in touched:
+                    continue
+                if components[graph.keys[dependent_node]].is_touched_also(component):
+                    new_nodes.add(dependent_node)
+        touched.update(new_nodes)
+    return touched
+
+
+def report(label, closure, graph, components, nodes):
+    started = time.time()
+    result = closure(graph, components, nodes, 'needed_by')
+    print('%-48s %8.3f s' % (label, time.time() - started))
+    return result
+
+
+if __name__ == '__main__':
+    nr_chains = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    components, first_services = chain_components(nr_chains, length)
+    graph = DependencyGraph(components)
+    nodes = [graph.node(uri) for uri in first_services]
+    label = '%i services (%i x %i)' % (len(components), nr_chains, length)
+
+    legacy = report(label + ', rounds', legacy_closure, graph, components, nodes)
+    current = report(label + ', worklist', touched_closure, graph, components, nodes)
+    assert legacy == current, 'closures differ'
@@ -0,0 +1,61 @@
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the cost of resolving the service class of one service.
+
+Usage: PYTHONPATH=src/main/python python src/benchmark/python/service_class_lookup_benchmark.py
+"""
+
+from __future__ import print_function
+
+import inspect
+import sys
+import timeit
+
+import yadtshell
+from yadtshell.service_registry import ServiceClassRegistry
+
+
+class BenchmarkService(yadtshell.components.Service):
+    pass
+
+
+def scan_loaded_modules(service_class_name):
+    """The lookup as it was before the registry existed."""
+    for module_name in sys.modules.keys()[:]:
+        if module_name.startswith("six.moves"):
+            continue
+        try:
+            for classname, service_class in inspect.getmembers(sys.modules[module_name], inspect.isclass):
+                if classname == service_class_name:
+                    return service_class
+        except:
+            pass
+    return None
+
+
+def report(label, fun, number):
+    seconds = min(timeit.repeat(fun, number=number, repeat=3))
+    print('%-40s %10.2f us/service' % (label, seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    registry = ServiceClassRegistry()
+    print('%i modules loaded' % len(sys.modules))
+    report('scan of sys.modules per service', lambda: scan_loaded_modules('BenchmarkService'), 100)
+    report('registry, custom class', lambda: registry.lookup('BenchmarkService'), 100000)
+    report('registry, standard Service', lambda: yadtshell.service_registry.registry.lookup('Service'), 100000)
@@ -0,0 +1,96 @@
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures how long it takes to load the current state of a synthetic target,
+once from the monolithic pickle of earlier versions and once from the state
+store, completely and for a single host.
+
+Usage: PYTHONPATH=src/main/python python src/benchmark/python/state_store_benchmark.py [NR_HOSTS]
+"""
+
+from __future__ import print_function
+
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import yadtshell
+from yadtshell.dependency_tree import DependencyTreeBuilder
+from yadtshell.state_store import StateStore
+
+from host_cache_benchmark import StatusProtocol, status_data
+
+
+def build_components(nr_hosts):
+    components = yadtshell.components.ComponentDict()
+    tree = DependencyTreeBuilder(components)
+    for nr in range(nr_hosts):
+        protocol = StatusProtocol('host%04i.acme.com' % nr, status_data(nr))
+        tree.add_host(yadtshell._status.create_host_with_components(protocol, components))
+    tree.finish()
+    for component in components.values():
+        if hasattr(component, 'logger'):
+            component.logger = None
+    return components
+
+
+def report(label, load):
+    durations = []
+    for _ in range(3):
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.time()
+            components = load()
+            durations.append(time.time() - started)
+        finally:
+            gc.enable()
+    print('%-36s load %7.3f s (%i components)' % (label, min(durations), len(components)))
+
+
+def load_pickle(filename):
+    with open(filename) as f:
+        return pickle.load(f)
+
+
+if __name__ == '__main__':
+    nr_hosts = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    yadtshell._status.write_host_data_to_file = lambda host, data: None
+    components = build_components(nr_hosts)
+
+    out_dir = tempfile.mkdtemp()
+    try:
+        legacy_filename = os.path.join(out_dir, 'current_state.components')
+        with open(legacy_filename, 'w') as f:
+            pickle.dump(components, f, pickle.HIGHEST_PROTOCOL)
+        store = StateStore(os.path.join(out_dir, 'current_state.db'))
+        store.save(components)
+
+        report('%i hosts, pickle' % nr_hosts, lambda: load_pickle(legacy_filename))
+        report('%i hosts, state store' % nr_hosts, store.load)
+        report('%i hosts, state store, one host' % nr_hosts, lambda: store.load(hosts=['host0000']))
+        report('%i hosts, state store, uri index' % nr_hosts, lambda: store.uris(types=['service']))
+    finally:
+        shutil.rmtree(out_dir)
@@ -0,0 +1,71 @@
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import subprocess
+import time
+import unittest
+from os.path import join
+
+import integrationtest_support
+
+import yadt_status_answer
+
+
+class Test (integrationtest_support.IntegrationTestSupport):
+
+    def start_statusd(self):
+        statusd_output = join(self.base_dir, 'statusd.out')
+        statusd = subprocess.Popen(['yadtshell', 'statusd', '-v'],
+                                   stdout=open(statusd_output, 'w'),
+                                   stderr=subprocess.STDOUT,
+                                   cwd=self.base_dir,
+                                   env=self.env)
+        for _ in range(100):
+            if 'statusd serving' in open(statusd_output).read():
+                break
+            time.sleep(0.1)
+        return statusd, statusd_output
+
+    def test(self):
+        self.write_target_file('it01.domain')
+
+        with self.fixture() as when:
+            when.calling('ssh').at_least_with_arguments('it01.domain').and_input('/usr/bin/yadt-status') \
+                .then_write(yadt_status_answer.stdout('it01.domain'))
+            when.calling('ssh').at_least_with_arguments('-O', 'check', 'it01.domain') \
+                .then_return(0)
+
+        status_return_code = self.execute_command('yadtshell status')
+        statusd, statusd_output = self.start_statusd()
+        try:
+            info_return_code, info_stdout, _ = self.execute_command_and_capture_output('yadtshell info')
+        finally:
+            statusd.terminate()
+            statusd.wait()
+
+        self.assertEqual(0, status_return_code)
+        self.assertEqual(0, info_return_code)
+        self.assertTrue('it01' in info_stdout)
+        self.assertTrue('request info' in open(statusd_output).read())
+
+        with self.verify() as verify:
+            verify.called('ssh').at_least_with_arguments('it01.domain').and_input('/usr/bin/yadt-status')
+            verify.called('ssh').at_least_with_arguments('-O', 'check', 'it01.domain')
+            verify.finished()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -99,14 +99,11 @@ class Test (integrationtest_support.IntegrationTestSupport):
                     'it01.domain', 'yadt-command yadt-service-stop frontend-service')
                 verify.called('ssh').at_least_with_arguments(
                     'it01.domain', 'yadt-command yadt-service-status frontend-service')
-                verify.called('ssh').at_least_with_arguments(
-                    'it01.domain').and_input('/usr/bin/yadt-status')
+                # the final status of each stop is scoped to its host
                 verify.called('ssh').at_least_with_arguments(
                     'it01.domain').and_input('/usr/bin/yadt-status')
 
             with complete_verify.filter_by_argument('it02.domain') as verify:
-                verify.called('ssh').at_least_with_arguments(
-                    'it02.domain').and_input('/usr/bin/yadt-status')
                 verify.called('ssh').at_least_with_arguments(
                     'it02.domain').and_input('/usr/bin/yadt-status')
                 verify.called('ssh').at_least_with_arguments(
@@ -0,0 +1,48 @@
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import integrationtest_support
+
+import yadt_status_answer
+
+
+class Test (integrationtest_support.IntegrationTestSupport):
+
+    def test(self):
+        self.write_target_file('it01.domain')
+
+        with self.fixture() as when:
+            when.calling('ssh').at_least_with_arguments('it01.domain').and_input('/usr/bin/yadt-status') \
+                .then_write(yadt_status_answer.stdout('it01.domain'))
+
+        first_return_code = self.execute_command('yadtshell status')
+        second_return_code = self.execute_command('yadtshell status --max-age 600')
+        third_return_code, dump_output, _ = self.execute_command_and_capture_output(
+            'yadtshell dump host://it01 --attribute status_snapshot')
+
+        self.assertEqual(0, first_return_code)
+        self.assertEqual(0, second_return_code)
+        self.assertEqual(0, third_return_code)
+        self.assertEqual(40, len(dump_output.strip()))
+
+        with self.verify() as verify:
+            verify.called('ssh').at_least_with_arguments('it01.domain').and_input('/usr/bin/yadt-status')
+            verify.finished()
+
+
+if __name__ == '__main__':
+    unittest.main()
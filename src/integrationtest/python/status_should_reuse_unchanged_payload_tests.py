@@ -0,0 +1,54 @@
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import unittest
+import integrationtest_support
+
+import yadt_status_answer
+
+
+class Test (integrationtest_support.IntegrationTestSupport):
+
+    def test(self):
+        self.write_target_file('it01.test.domain')
+        payload = yadt_status_answer.stdout('it01.test.domain')
+        payload_hash = hashlib.sha1(payload).hexdigest()
+
+        with self.fixture() as when:
+            when.calling('ssh').at_least_with_arguments(
+                'it01.test.domain', 'YADT_STATUS_IF_NONE_MATCH=%s sh' % payload_hash) \
+                .and_input('/usr/bin/yadt-status') \
+                .then_write('{"yadt_status": "unchanged", "hash": "%s"}' % payload_hash)
+            when.calling('ssh').at_least_with_arguments('it01.test.domain').and_input('/usr/bin/yadt-status') \
+                .then_write(payload)
+
+        first_return_code = self.execute_command('yadtshell status -v')
+        second_return_code = self.execute_command('yadtshell status -v')
+
+        self.assertEqual(0, first_return_code)
+        self.assertEqual(0, second_return_code)
+
+        with self.verify() as verify:
+            verify.called('ssh').at_least_with_arguments(
+                'it01.test.domain').and_input('/usr/bin/yadt-status')
+            verify.called('ssh').at_least_with_arguments(
+                'it01.test.domain', 'YADT_STATUS_IF_NONE_MATCH=%s sh' % payload_hash) \
+                .and_input('/usr/bin/yadt-status')
+
+
+if __name__ == '__main__':
+    unittest.main()
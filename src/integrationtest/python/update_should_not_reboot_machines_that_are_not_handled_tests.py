@@ -44,17 +44,13 @@ class Test (integrationtest_support.IntegrationTestSupport):
         with self.verify() as verify:
 
             with verify.filter_by_argument('it01.domain') as filtered_verify:
-                #  double status due to `status` before `update`
-                filtered_verify.called('ssh').at_least_with_arguments(
-                    'it01.domain').and_input('/usr/bin/yadt-status')
+                # the status before and after `update` is scoped to it02.domain
                 filtered_verify.called('ssh').at_least_with_arguments(
                     'it01.domain').and_input('/usr/bin/yadt-status')
 
                 filtered_verify.called('ssh').at_least_with_arguments(
                     'it01.domain', '-O', 'check')
 
-                filtered_verify.called('ssh').at_least_with_arguments('it01.domain').and_input('/usr/bin/yadt-status')
-
             with verify.filter_by_argument('it02.domain') as filtered_verify:
                 filtered_verify.called('ssh').at_least_with_arguments(
                     'it02.domain').and_input('/usr/bin/yadt-status')
@@ -46,9 +46,9 @@ class Test (integrationtest_support.IntegrationTestSupport):
             verify.called('ssh').with_input('/usr/bin/yadt-status')
 
             self.assertEqual(0, update_return_code)
-            # status before update
-            verify.called('ssh').with_input('/usr/bin/yadt-status')
-            verify.called('ssh').with_input('/usr/bin/yadt-status')
+            # status before update, scoped to it01.domain
+            verify.called('ssh').at_least_with_arguments(
+                'it01.domain').and_input('/usr/bin/yadt-status')
 
             verify.called('ssh').at_least_with_arguments(
                 '-O', 'check')
@@ -23,16 +23,12 @@ try:
     from yaml import CLoader as yaml_loader
 except ImportError:
     from yaml import Loader as yaml_loader
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle
 
+import heapq
 import logging
 import os.path
 import re
 import shlex
-import copy
 import sys
 
 import twisted.internet.reactor as reactor
@@ -42,6 +38,8 @@ from twisted.internet.task import deferLater
 import yaml
 
 import yadtshell
+from yadtshell.flat_plan import FlatPlan
+from yadtshell.state_store import StateJournal
 from yadtshell.commandline import (confirm_transaction_by_user,
                                    EXIT_CODE_CANCELED_BY_USER)
 
@@ -49,8 +47,207 @@ YADT_MINION_EXIT_CODE_HOST_LOCKED = 150
 YADT_MINION_EXIT_CODE_SERVICE_IGNORED = 151
 
 
+def _uri_of(component_or_uri):
+    return getattr(component_or_uri, 'uri', component_or_uri)
+
+
+class ReadyQueue(object):
+
+    """The tasks of a plan, handing out those whose preconditions are all
+    met, ordered by `priority(task)` or else by their position.
+
+    Each task counts its unmet preconditions. The count is updated by
+    `changed` for the preconditions referring to the changed attribute,
+    and a task enters the ready heap when its count drops to zero, so
+    handing out a task takes O(log n).
+    """
+
+    def __init__(self, tasks, components, priority=None):
+        self.components = components
+        self.priority = priority
+        self.pending = {}
+        self.unmet = {}
+        self.watchers = {}
+        self.ready = []
+        for position, task in enumerate(tasks):
+            self.pending[position] = task
+            self.unmet[position] = self._waiting_for(position)
+            for precondition in self._preconditions_of(task):
+                met = precondition.is_reached(components)
+                key = (_uri_of(precondition.uri), precondition.attr)
+                self.watchers.setdefault(key, []).append([position, precondition, met])
+                if not met:
+                    self.unmet[position] += 1
+            if not self.unmet[position]:
+                self._push(position)
+
+    def _waiting_for(self, position):
+        return 0
+
+    def _preconditions_of(self, task):
+        if isinstance(task.action, yadtshell.actions.ActionPlan):
+            return ()
+        return task.action.preconditions
+
+    def _push(self, position):
+        task = self.pending[position]
+        rank = self.priority(task) if self.priority else position
+        heapq.heappush(self.ready, (rank, position))
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __iter__(self):
+        for position in sorted(self.pending):
+            yield self.pending[position]
+
+    def changed(self, uri, attribute):
+        """Updates the counts of the tasks having a precondition on
+        `attribute` of the component `uri`.
+        """
+        for watcher in self.watchers.get((uri, attribute), ()):
+            position, precondition, met = watcher
+            if position not in self.pending:
+                continue
+            now_met = precondition.is_reached(self.components)
+            if now_met == met:
+                continue
+            watcher[2] = now_met
+            self.unmet[position] += -1 if now_met else 1
+            if not self.unmet[position]:
+                self._push(position)
+
+    def pop_ready(self):
+        """Removes and returns the first ready task, or returns None."""
+        while self.ready:
+            _, position = heapq.heappop(self.ready)
+            task = self.pending.get(position)
+            if task is None or self.unmet[position]:
+                continue
+            action = task.action
+            if (not isinstance(action, yadtshell.actions.ActionPlan) and
+                    action.state != yadtshell.actions.State.PENDING):
+                continue
+            if self._held_back(position):
+                continue
+            del self.pending[position]
+            self._started(position)
+            return task
+        return None
+
+    def _held_back(self, position):
+        return False
+
+    def _started(self, position):
+        pass
+
+
+class FlatReadyQueue(ReadyQueue):
+
+    """The tasks of the actions of a FlatPlan, in the same order.
+
+    Besides its preconditions, a task waits for the groups it is ordered
+    after, see FlatPlan. While a component is changed by one task, the
+    other tasks changing it are held back, as are the tasks starting a
+    further group of a plan already running as many groups as it has
+    workers.
+
+    The errors of the tasks count against the plans they are part of.
+    When a plan gets more errors than it tolerates, its pending tasks are
+    dropped and the error counts against the plan containing it.
+    """
+
+    def __init__(self, flat_plan, tasks, components, priority=None):
+        self.flat_plan = flat_plan
+        self.positions = dict((id(task.action), position)
+                              for position, task in enumerate(tasks))
+        self.remaining = [end - first for first, end in zip(flat_plan.group_first, flat_plan.group_end)]
+        self.started_groups = [False] * len(self.remaining)
+        self.running_groups = [0] * len(flat_plan.plan_names)
+        self.errors = [0] * len(flat_plan.plan_names)
+        self.failed_plans = [False] * len(flat_plan.plan_names)
+        self.busy_uris = set()
+        self.held_back = []
+        ReadyQueue.__init__(self, tasks, components, priority)
+
+    def position_of(self, action):
+        return self.positions[id(action)]
+
+    def _waiting_for(self, position):
+        return self.flat_plan.waiting_for(position)
+
+    def _held_back(self, position):
+        flat_plan = self.flat_plan
+        held_back = _uri_of(flat_plan.actions[position].uri) in self.busy_uris
+        for group in flat_plan.chains[position]:
+            plan_id = flat_plan.group_plan[group]
+            capacity = flat_plan.plan_capacity[plan_id]
+            if (capacity and not self.started_groups[group] and
+                    self.running_groups[plan_id] >= capacity):
+                held_back = True
+        if held_back:
+            self.held_back.append(position)
+        return held_back
+
+    def _started(self, position):
+        self.busy_uris.add(_uri_of(self.flat_plan.actions[position].uri))
+        for group in self.flat_plan.chains[position]:
+            if not self.started_groups[group]:
+                self.started_groups[group] = True
+                self.running_groups[self.flat_plan.group_plan[group]] += 1
+
+    def finished(self, position):
+        """Lets go the tasks waiting for the task at `position`, which
+        finished successfully or not.
+        """
+        self.busy_uris.discard(_uri_of(self.flat_plan.actions[position].uri))
+        self._done(position)
+        held_back, self.held_back = self.held_back, []
+        for other in held_back:
+            if other in self.pending:
+                self._push(other)
+
+    def _done(self, position):
+        flat_plan = self.flat_plan
+        for group in flat_plan.chains[position]:
+            self.remaining[group] -= 1
+            if self.remaining[group]:
+                continue
+            if self.started_groups[group]:
+                self.running_groups[flat_plan.group_plan[group]] -= 1
+            for follower in flat_plan.group_followers[group]:
+                for other in range(flat_plan.group_first[follower], flat_plan.group_end[follower]):
+                    if other not in self.pending:
+                        continue
+                    self.unmet[other] -= 1
+                    if not self.unmet[other]:
+                        self._push(other)
+
+    def failed(self, position):
+        """Counts the failure of the task at `position`. Returns the plan
+        tolerating it, or None when the outermost plan failed.
+        """
+        flat_plan = self.flat_plan
+        plan_id = flat_plan.innermost_plan(position)
+        while plan_id is not None:
+            if self.failed_plans[plan_id]:
+                return plan_id
+            self.errors[plan_id] += 1
+            if self.errors[plan_id] <= flat_plan.plan_nr_errors_tolerated[plan_id]:
+                return plan_id
+            self.failed_plans[plan_id] = True
+            for other in range(flat_plan.plan_first[plan_id], flat_plan.plan_end[plan_id]):
+                if self.pending.pop(other, None) is not None:
+                    self._done(other)
+            plan_id = flat_plan.parent_plan(plan_id)
+        return None
+
+
 class ActionManager(object):
 
+    # orders the ready tasks of a plan, see ReadyQueue
+    task_priority = None
+
     class Task(object):
 
         def __init__(self, fun, action, path=None):
@@ -61,6 +258,7 @@ class ActionManager(object):
     def __init__(self):
         self.logger = logging.getLogger('actionmanager')
         self.finish_fun = self.log_host_finished
+        self.ready_queues = []
         self.logger.info('log file: "{0}"'.format(yadtshell.settings.log_file))
 
     def get_state_info(self, action):
@@ -78,8 +276,8 @@ class ActionManager(object):
                 result = result.value.exitCode
             else:
                 result = 0
-            component.state = yadtshell.constants.HOST_STATE_DESCRIPTIONS.get(
-                result, result)
+            self.overlay.set(component, 'state',
+                             yadtshell.constants.HOST_STATE_DESCRIPTIONS.get(result, result))
             self.logger.info(
                 yadtshell.util.render_component_state(component.uri, component.state))
             self.pi.update(('status', component), '%s' % result)
@@ -95,8 +293,8 @@ class ActionManager(object):
                     result = result.value.exitCode
                 else:
                     result = 0
-            component.state = yadtshell.settings.STATE_DESCRIPTIONS.get(
-                result, component.state)
+            self.overlay.set(component, 'state',
+                             yadtshell.settings.STATE_DESCRIPTIONS.get(result, component.state))
             self.logger.info(
                 yadtshell.util.render_component_state(component.uri, component.state))
             self.pi.update(('status', component), '%s' % result)
@@ -104,7 +302,7 @@ class ActionManager(object):
                 [{'uri': component.uri, 'state': component.state}], tracking_id=yadtshell.settings.tracking_id)
             self.logger.debug("storing new state for %s: %s" %
                               (component.uri, component.state))
-            self.orig_components[component.uri].state = component.state
+            self.overlay.keep(component, 'state')
             return
         if isinstance(component, yadtshell.components.Service) or isinstance(
                 component, yadtshell.components.ReadonlyService):
@@ -121,7 +319,7 @@ class ActionManager(object):
                              (component.uri, type(component)))
 
     def set_probed_state(self, protocol, component):
-        setattr(component, 'recheck', yadtshell.constants.PROBED)
+        self.overlay.set(component, 'recheck', yadtshell.constants.PROBED)
         return protocol
 
     def mark_action_as_finished(self, ignored, action):
@@ -150,7 +348,7 @@ class ActionManager(object):
             if action.attr:
                 self.logger.debug(
                     '        dryrun %(cmd)s, setting %(attr)s to %(target_value)s on %(uri)s' % vars(action))
-                setattr(component, action.attr, action.target_value)
+                self.overlay.set(component, action.attr, action.target_value)
             else:
                 self.logger.debug(
                     '        dryrun %(cmd)s on %(uri)s' % vars(action))
@@ -202,7 +400,7 @@ class ActionManager(object):
         if exitCode == YADT_MINION_EXIT_CODE_SERVICE_IGNORED:
             self.logger.info(
                 '%s is ignored, assuming successfull %s' % (component.uri, cmd))
-            component.state = target_state
+            self.overlay.set(component, 'state', target_state)
             self.pi.update((cmd, component), 'i')
             return
         if exitCode == YADT_MINION_EXIT_CODE_HOST_LOCKED:
@@ -217,7 +415,7 @@ class ActionManager(object):
                 self.logger.debug(
                     'successfully %sed %s' % (cmd, component.uri))
             elif target_state in [yadtshell.settings.UPTODATE, 'rebooted']:
-                component.state = target_state
+                self.overlay.set(component, 'state', target_state)
                 self.logger.debug('successfully %sed %s' % (target_state, component.uri))
             else:
                 max_tries = getattr(component, 'status_max_tries', 1)
@@ -301,17 +499,17 @@ class ActionManager(object):
         self.logger.info(yadtshell.settings.term.render(
             '    ${BOLD}%(uri)s finished successfully${NORMAL}' % vars(action)))
 
+    def wake_up_workers(self, component, attribute):
+        for ready_queue in self.ready_queues:
+            ready_queue.changed(component.uri, attribute)
+        yadtshell.defer.wakeups.notify()
+
     def next_with_preconditions(self, queue):
-        for task in queue:
-            action = task.action
-            if not isinstance(action, yadtshell.actions.ActionPlan):
-                if action.state != yadtshell.actions.State.PENDING:
-                    continue
-                if not action.are_all_preconditions_met(self.components):
-                    continue
-            queue.remove(task)
-            return task
-        return None
+        return queue.pop_ready()
+
+    def forget_ready_queue(self, result, ready_queue):
+        self.ready_queues.remove(ready_queue)
+        return result
 
     def calc_nr_workers(self, plan):
         if not self.parallel:
@@ -330,6 +528,9 @@ class ActionManager(object):
     def handle_cb(self, protocol, plan, path=[]):
         return self.handle(plan, path)
 
+    def handle_flat_cb(self, protocol, plan):
+        return self.handle_flat(plan)
+
     def handle(self, plan, path=[]):
         queue = []
         if isinstance(plan, yadtshell.actions.Action):
@@ -356,28 +557,87 @@ class ActionManager(object):
         plan.nr_workers = min(plan.nr_workers, len(queue))
         self.logger.debug('%s : %s' % (plan_name, plan.meta_info()))
 
+        ready_queue = ReadyQueue(queue, self.components, self.task_priority)
+        self.ready_queues.append(ready_queue)
         pool = yadtshell.defer.DeferredPool(
             plan_name,
-            queue,
+            ready_queue,
             nr_workers=plan.nr_workers,
             next_task_fun=self.next_with_preconditions,
             nr_errors_tolerated=plan.nr_errors_tolerated)
+        pool.addBoth(self.forget_ready_queue, ready_queue)
         pool.addCallback(self.report_plan_finished, plan, plan_name)
         return pool
 
+    def handle_flat(self, plan):
+        """Runs all actions of `plan` in one pool, see FlatPlan."""
+        flat_plan = FlatPlan(plan)
+        if not len(flat_plan):
+            deferred = defer.Deferred()
+            reactor.callLater(0, deferred.callback, None)
+            return deferred
+
+        plan_name = '/' + plan.name
+        queue = []
+        for action, path in zip(flat_plan.actions, flat_plan.paths):
+            queue.append(yadtshell.ActionManager.Task(
+                fun=self.handle_flat_action, action=action, path=path))
+        nr_workers = max([self.calc_nr_workers(flat_plan)] +
+                         [capacity for capacity in flat_plan.plan_capacity if capacity])
+        nr_workers = min(nr_workers, len(queue))
+        self.logger.debug('%s : %i actions, %i workers, flat' % (plan_name, len(queue), nr_workers))
+
+        ready_queue = FlatReadyQueue(flat_plan, queue, self.components, self.task_priority)
+        self.flat_queue = ready_queue
+        self.ready_queues.append(ready_queue)
+        pool = yadtshell.defer.DeferredPool(
+            plan_name,
+            ready_queue,
+            nr_workers=nr_workers,
+            next_task_fun=self.next_with_preconditions)
+        pool.addBoth(self.forget_ready_queue, ready_queue)
+        pool.addCallback(self.report_plan_finished, plan, plan_name)
+        return pool
+
+    def handle_flat_action(self, protocol=None, plan=None, path=None):
+        position = self.flat_queue.position_of(plan)
+        deferred = defer.maybeDeferred(self.handle_action, plan=plan, path=path)
+        deferred.addCallbacks(self.flat_action_finished, self.flat_action_failed,
+                              callbackArgs=(position,), errbackArgs=(position,))
+        return deferred
+
+    def flat_action_finished(self, result, position):
+        self.flat_queue.finished(position)
+        return result
+
+    def flat_action_failed(self, failure, position):
+        self.flat_queue.finished(position)
+        plan_id = self.flat_queue.failed(position)
+        if plan_id is None:
+            return failure
+        self.logger.warn('error encountered, tolerated by %s, continuing...' %
+                         self.flat_queue.flat_plan.plan_names[plan_id])
+        return None
+
     def action(self,
                flavor,
                info_mode=False,
                dryrun=False,
                parallel=None,
                forcedyes=False,
+               flat=False,
+               components=None,
                **kwargs):
         if not parallel:
             parallel = 1
         self.parallel = parallel
         self.dryrun = dryrun
-        self.components = yadtshell.util.restore_current_state()
-        self.orig_components = copy.deepcopy(self.components)
+        if components is None:
+            components = yadtshell.util.restore_current_state()
+        self.components = components
+        self.overlay = yadtshell.components.ComponentOverlay(
+            journal=None if dryrun else StateJournal(),
+            on_change=self.wake_up_workers)
         action_plan_file = os.path.join(
             yadtshell.settings.OUT_DIR, flavor + '-action.plan')
         self.logger.debug('using action plan %s' % action_plan_file)
@@ -402,10 +662,10 @@ class ActionManager(object):
             self.logger.info('dryrun ' * 10)
 
         for service in [s for s in self.components.values() if s.type == yadtshell.settings.SERVICE]:
-            service.state = yadtshell.settings.UNKNOWN
+            self.overlay.set(service, 'state', yadtshell.settings.UNKNOWN)
         for host in [h for h in self.components.values() if isinstance(h, yadtshell.components.Host)]:
-            host.state = yadtshell.settings.UNKNOWN
-            host.probed = yadtshell.settings.UNKNOWN
+            self.overlay.set(host, 'state', yadtshell.settings.UNKNOWN)
+            self.overlay.set(host, 'probed', yadtshell.settings.UNKNOWN)
 
         if dryrun:
             log_plan_fun = self.logger.info
@@ -424,10 +684,8 @@ class ActionManager(object):
                     os.remove(action_plan_file)
                 except Exception:
                     pass
-            f = open(
-                os.path.join(yadtshell.settings.OUT_DIR, 'current_state.components'), "w")
-            pickle.dump(self.orig_components, f, pickle.HIGHEST_PROTOCOL)
-            f.close()
+            with self.overlay.persisted():
+                yadtshell.util.store_current_state(self.components)
             return result
 
         def finish_progress_indicator(result, pi):
@@ -452,7 +710,9 @@ class ActionManager(object):
             deferred = yadtshell.util.start_ssh_multiplexed()
         try:
             if deferred:
-                deferred.addCallback(self.handle_cb, action_plan)
+                deferred.addCallback(self.handle_flat_cb if flat else self.handle_cb, action_plan)
+            elif flat:
+                deferred = self.handle_flat(action_plan)
             else:
                 deferred = self.handle(action_plan)
         except ValueError, ve:
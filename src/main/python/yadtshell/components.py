@@ -18,12 +18,14 @@
 
 from __future__ import (absolute_import, print_function)
 
+from contextlib import contextmanager
 import logging
 import os
 import subprocess
 import sys
 import yaml
 import shlex
+import pipes
 
 from twisted.internet import reactor, task
 import twisted.internet.defer as defer
@@ -31,6 +33,7 @@ import twisted.internet.defer as defer
 from yadtshell.util import calculate_max_tries_for_interval_and_delay
 from yadtshell.helper import get_user_info
 from yadtshell.twisted import YadtProcessProtocol
+from yadtshell.service_registry import register_service_class
 import yadtshell
 
 
@@ -166,6 +169,7 @@ class MissingComponent(Component):
         self.state = yadtshell.settings.MISSING
 
 
+@register_service_class
 class ReadonlyService(Component):
 
     def __init__(self, host, name, settings=None):
@@ -208,6 +212,67 @@ class ReadonlyService(Component):
         return 'yadt-service-%s %s' % (action, self.name)
 
 
+class ReadonlyServiceStatus(object):
+
+    def __init__(self, component, exitCode):
+        self.component = component
+        self.exitCode = exitCode
+
+
+class ReadonlyServiceStatusFailed(Exception):
+
+    def __init__(self, component, exitCode):
+        Exception.__init__(self, 'status of %s failed with exit code %s' % (component, exitCode))
+        self.component = component
+        self.exitCode = exitCode
+
+
+def readonly_services_status(services):
+    """Queries the states of `services`, which all live on the same host,
+    with a single ssh call.
+
+    Returns one deferred per service, firing like ReadonlyService.status:
+    with a ReadonlyServiceStatus when the service is up or failing with
+    a ReadonlyServiceStatusFailed otherwise.
+    """
+    services = list(services)
+    deferreds = [defer.Deferred() for service in services]
+    if not services:
+        return deferreds
+    host = services[0].fqdn or services[0].host
+    status_script = ('export WHO=%s YADT_LOG_FILE=%s; for service in %s; do '
+                     'yadt-command yadt-service-%s "$service" >/dev/null 2>&1; '
+                     'echo "$service $?"; done') % (
+        pipes.quote(get_user_info()['owner']),
+        pipes.quote(services[0].create_remote_log_filename(tag='readonly_services_status')),
+        ' '.join([pipes.quote(service.name) for service in services]),
+        yadtshell.settings.STATUS)
+    cmdline = shlex.split(yadtshell.settings.SSH) + [host]
+    status_protocol = YadtProcessProtocol(
+        host, status_script, out_log_level=logging.DEBUG)
+    reactor.spawnProcess(status_protocol, cmdline[0], cmdline, None)
+
+    def distribute_exit_codes(protocol_or_failure):
+        exit_codes = {}
+        for line in (getattr(protocol_or_failure, 'data', None) or '').splitlines():
+            try:
+                name, exit_code = line.rsplit(' ', 1)
+                exit_codes[name] = int(exit_code)
+            except ValueError:
+                logger.debug('unexpected readonly status line from %s: %r' % (host, line))
+        if not exit_codes and hasattr(protocol_or_failure, 'value'):
+            logger.debug('cannot query readonly services on %s: %s' % (
+                host, protocol_or_failure.getErrorMessage()))
+        for service, deferred in zip(services, deferreds):
+            exit_code = exit_codes.get(service.name)
+            if exit_code == 0:
+                deferred.callback(ReadonlyServiceStatus(service, exit_code))
+            else:
+                deferred.errback(ReadonlyServiceStatusFailed(service, exit_code))
+    status_protocol.deferred.addBoth(distribute_exit_codes)
+    return deferreds
+
+
 class ComponentDict(dict):
 
     def __init__(self):
@@ -237,6 +302,64 @@ class ComponentDict(dict):
         return dict.__setitem__(self, self._key_(key), value)
 
 
+class ComponentOverlay(object):
+
+    """Copy-on-write record of the attributes changed on the components of
+    a ComponentDict.
+
+    Attributes are changed in place with `set`, which remembers the
+    original value on the first change. Within `persisted` all changes are
+    undone, except those marked with `keep`, which take the value they had
+    when they were kept. Kept changes are appended to `journal` as well.
+    `on_change` is called with the component and the attribute after
+    every change.
+    """
+
+    _UNSET = object()
+
+    def __init__(self, journal=None, on_change=None):
+        self.originals = {}
+        self.kept = {}
+        self.journal = journal
+        self.on_change = on_change
+
+    def set(self, component, attribute, value):
+        key = (component.uri, attribute)
+        if key not in self.originals:
+            self.originals[key] = (component, getattr(component, attribute, self._UNSET))
+        setattr(component, attribute, value)
+        if self.on_change is not None:
+            self.on_change(component, attribute)
+
+    def keep(self, component, attribute):
+        value = getattr(component, attribute, self._UNSET)
+        self.kept[(component.uri, attribute)] = value
+        if self.journal is not None and value is not self._UNSET:
+            self.journal.append(component.uri, attribute, value)
+
+    def _assign(self, component, attribute, value):
+        if value is self._UNSET:
+            if attribute in vars(component):
+                delattr(component, attribute)
+        else:
+            setattr(component, attribute, value)
+
+    @contextmanager
+    def persisted(self):
+        """Shows the components as they are to be persisted while within
+        the context.
+        """
+        current = []
+        for (uri, attribute), (component, original) in self.originals.items():
+            current.append((component, attribute, getattr(component, attribute, self._UNSET)))
+            self._assign(component, attribute, self.kept.get((uri, attribute), original))
+        try:
+            yield
+        finally:
+            for component, attribute, value in current:
+                self._assign(component, attribute, value)
+
+
 class ComponentSet(set):
 
     def __init__(self, components=None):
@@ -549,6 +672,7 @@ class Artefact(Component):
                                 'artefact_%s_%s_%s' % (self.host, self.name, yadtshell.constants.UPDATEARTEFACT))
 
 
+@register_service_class
 class Service(Component):
 
     def __init__(self, host, name, settings=None):
@@ -0,0 +1,116 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Conditional status queries.
+
+When yadtshell holds the payload of an earlier status of a host, it passes
+the hash of that payload to yadt-status in the environment variable
+YADT_STATUS_IF_NONE_MATCH. Minions knowing this variable may answer with
+
+    {"yadt_status": "unchanged", "hash": "<hash>"}
+
+when their payload still has this hash, or with a delta against it
+
+    {"yadt_status": "delta", "base": "<hash>", "hash": "<new hash>",
+     "changes": {<top level key>: <new value>, ...}, "removed": [<key>, ...]}
+
+Any other answer is a full payload, which is all older minions send.
+The hash of a payload is the SHA-1 hex digest of the full payload as
+written by yadt-status. Conditional answers yadtshell cannot resolve, e.g.
+for a payload it no longer knows, are answered by querying the full
+payload once more.
+"""
+
+from __future__ import absolute_import
+
+import logging
+import re
+
+import simplejson as json
+
+logger = logging.getLogger('conditional_status')
+
+STATUS_HASH_VARIABLE = 'YADT_STATUS_IF_NONE_MATCH'
+CONDITIONAL_ANSWER_KEY = 'yadt_status'
+UNCHANGED = 'unchanged'
+DELTA = 'delta'
+STATUS_HASH_PATTERN = re.compile(r'^[0-9a-f]+\Z')
+
+
+class UnresolvableConditionalStatus(Exception):
+
+    def __init__(self, component, message):
+        Exception.__init__(self, '%s: %s' % (component, message))
+        self.component = component
+
+
+def conditional_status_command(status_hash):
+    """Returns the remote command (as ssh arguments) which runs the shell
+    reading the status command from stdin with `status_hash` in its
+    environment. Hashes which are no hex digests, e.g. from a malformed
+    answer, are not sent, as they end up in the remote shell command.
+    """
+    if not status_hash:
+        return []
+    if not STATUS_HASH_PATTERN.match(status_hash):
+        logger.debug('not sending invalid status hash %r' % status_hash)
+        return []
+    return ['%s=%s sh' % (STATUS_HASH_VARIABLE, status_hash)]
+
+
+def resolve_conditional_status(protocol, host_cache):
+    """Replaces an unchanged or delta answer in `protocol.data` with the
+    full payload it refers to and sets `protocol.status_hash` to the hash
+    of that payload (None for full payloads). Raises
+    UnresolvableConditionalStatus when the answer refers to an unknown
+    payload or is of an unknown kind.
+    """
+    protocol.status_hash = None
+    if ('"%s"' % CONDITIONAL_ANSWER_KEY) not in protocol.data:
+        return protocol
+    try:
+        answer = json.loads(protocol.data)
+    except ValueError:
+        return protocol
+    if not isinstance(answer, dict) or CONDITIONAL_ANSWER_KEY not in answer:
+        return protocol
+
+    kind = answer[CONDITIONAL_ANSWER_KEY]
+    if kind not in (UNCHANGED, DELTA):
+        raise UnresolvableConditionalStatus(
+            protocol.component, 'unknown conditional status answer %s' % kind)
+    base_hash = answer.get('base', answer.get('hash'))
+    base_payload = host_cache.payload(protocol.component, base_hash)
+    if base_payload is None:
+        raise UnresolvableConditionalStatus(
+            protocol.component, 'answered %s for unknown payload %s' % (kind, base_hash))
+
+    if kind == UNCHANGED:
+        logger.debug('%s: payload unchanged' % protocol.component)
+        protocol.data = base_payload
+    elif kind == DELTA:
+        data = json.loads(base_payload)
+        data.update(answer.get('changes', {}))
+        for key in answer.get('removed', []):
+            data.pop(key, None)
+        logger.debug('%s: payload changed in %s' % (
+            protocol.component,
+            ', '.join(sorted(list(answer.get('changes', {})) + answer.get('removed', [])))))
+        protocol.data = json.dumps(data)
+    protocol.status_hash = answer['hash']
+    return protocol
@@ -39,3 +39,15 @@ SSH_POLL_MAX_SECONDS_DEFAULT = 120
 
 TEN_MINUTES_IN_SECONDS = 60 * 10
 MAX_ALLOWED_AGE_OF_STATE_IN_SECONDS = TEN_MINUTES_IN_SECONDS
+
+STATUS_MAX_IN_FLIGHT_DEFAULT = 128
+STATUS_INITIAL_IN_FLIGHT = 32
+STATUS_MIN_IN_FLIGHT = 4
+STATUS_LATENCY_CONGESTION_FACTOR = 3
+STATUS_HISTORY_SIZE = 20
+STATUS_HEDGE_MIN_SAMPLES = 5
+STATUS_DEADLINE_DEFAULT = None
+
+STATUSD_REQUEST_TIMEOUT = 10
+STATUSD_STATUS_TIMEOUT = TEN_MINUTES_IN_SECONDS
+STATUSD_SSH_KEEPALIVE_INTERVAL = TEN_MINUTES_IN_SECONDS
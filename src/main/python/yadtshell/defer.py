@@ -29,6 +29,37 @@ def next_in_queue(queue):
     return queue.pop(0)
 
 
+class Wakeups(object):
+
+    """Workers park here when no task is ready for them. Notifying a change,
+    e.g. a finished task or a changed component, wakes all of them within
+    the next reactor iteration. Notifications in between are coalesced.
+    """
+
+    def __init__(self):
+        self.parked = []
+        self.pending = False
+
+    def park(self, worker):
+        self.parked.append(worker)
+
+    def notify(self, result=None):
+        """Passes `result` through, so it can be added as callback."""
+        if self.parked and not self.pending:
+            self.pending = True
+            reactor.callLater(0, self._wake)
+        return result
+
+    def _wake(self):
+        self.pending = False
+        parked, self.parked = self.parked, []
+        for worker in parked:
+            worker.run()
+
+
+wakeups = Wakeups()
+
+
 class DeferredPool(defer.Deferred):
 
     class Worker(object):
@@ -46,11 +77,14 @@ class DeferredPool(defer.Deferred):
             if self.stopped:
                 self.logger.debug('Worker stopped : %s' % self.__str__())
                 return None
+            # a worker asking for a task is idle, so the pool can tell
+            # right away when no task is going to become ready anymore
+            self.idle = True
             task = self.next_task_fun()
             self.task = task
             if not task:
-                self.idle = True
-                reactor.callLater(1, self.run)
+                if not self.stopped:
+                    wakeups.park(self)
                 return None
             self.idle = False
             self.logger.debug('starting %s(..)' % task.fun.__name__)
@@ -58,6 +92,7 @@ class DeferredPool(defer.Deferred):
             d = task.fun(plan=task.action, path=task.path)
             d.addErrback(self.handle_error_fun)
             d.addErrback(yadtshell.twisted.report_error, self.logger.error)
+            d.addBoth(wakeups.notify)
             d.addBoth(self.run)
             return d
 
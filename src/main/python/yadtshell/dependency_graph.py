@@ -0,0 +1,166 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+
+from array import array
+import logging
+
+logger = logging.getLogger('dependency_graph')
+
+EDGE_KEYS = ('needs', 'needed_by')
+
+
+def _type_of_uri(uri):
+    if '://' not in uri:
+        return None
+    return uri.split('://', 1)[0]
+
+
+class DependencyGraph(object):
+
+    """Compact, read-only copy of the dependencies between components.
+
+    Every uri is interned to an integer node, all uris of one component
+    (e.g. the revision uri of an artefact) to the same node. `uris` holds
+    the uri of the component of each node, `keys` the key it is stored
+    under. Uris that are needed, but not known as component, get a node of
+    their own.
+
+    The `needs` and `needed_by` edges are kept CSR-style: the nodes
+    adjacent to node `n` are `targets[offsets[n]:offsets[n + 1]]`. The
+    nodes of known components are partitioned by type and by host uri as
+    well.
+    """
+
+    def __init__(self, components):
+        self.nodes = {}
+        self.uris = []
+        self.keys = []
+        self.types = []
+        self.host_uris = []
+        self.by_type = {}
+        self.by_host_uri = {}
+
+        known = []
+        for key, component in components.items():
+            node = self._intern(getattr(component, 'uri', key), component)
+            self.nodes[key] = node
+            if node == len(known):
+                known.append(component)
+                self.keys[node] = key
+
+        self.offsets, self.targets = {}, {}
+        for edge_key in EDGE_KEYS:
+            adjacent = []
+            for component in known:
+                adjacent.append(self._intern_all(getattr(component, edge_key, [])))
+            self.offsets[edge_key], self.targets[edge_key] = self._compress(adjacent)
+
+    def _intern(self, uri, component=None):
+        node = self.nodes.get(uri)
+        if node is not None:
+            return node
+        node = len(self.uris)
+        self.nodes[uri] = node
+        self.uris.append(uri)
+        self.keys.append(uri)
+        if component is None:
+            self.types.append(_type_of_uri(uri))
+            self.host_uris.append(None)
+            return node
+        host_uri = getattr(component, 'host_uri', None)
+        self.types.append(component.type)
+        self.host_uris.append(host_uri)
+        self.by_type.setdefault(component.type, array('l')).append(node)
+        if host_uri is not None:
+            self.by_host_uri.setdefault(host_uri, array('l')).append(node)
+        return node
+
+    def _intern_all(self, uris):
+        adjacent, seen = [], set()
+        for uri in uris:
+            node = self._intern(uri)
+            if node not in seen:
+                seen.add(node)
+                adjacent.append(node)
+        return adjacent
+
+    def _compress(self, adjacent):
+        # uris only needed get interned while collecting the edges, they
+        # do not have edges on their own
+        offsets, targets = array('l', [0]), array('l')
+        for node in range(len(self.uris)):
+            if node < len(adjacent):
+                targets.extend(adjacent[node])
+            offsets.append(len(targets))
+        return offsets, targets
+
+    def __len__(self):
+        return len(self.uris)
+
+    def __contains__(self, uri):
+        return uri in self.nodes
+
+    def node(self, uri):
+        return self.nodes[uri]
+
+    def adjacent(self, node, edge_key):
+        """Returns the nodes `node` has an `edge_key` edge to, where
+        `edge_key` is either 'needs' or 'needed_by', as array.
+        """
+        offsets = self.offsets[edge_key]
+        if node + 1 >= len(offsets):
+            return array('l')
+        return self.targets[edge_key][offsets[node]:offsets[node + 1]]
+
+    def needs(self, node):
+        return self.adjacent(node, 'needs')
+
+    def needed_by(self, node):
+        return self.adjacent(node, 'needed_by')
+
+    def nodes_of_type(self, node_type):
+        return self.by_type.get(node_type, array('l'))
+
+    def nodes_on_host(self, host_uri):
+        return self.by_host_uri.get(host_uri, array('l'))
+
+    def uris_of(self, nodes):
+        return [self.uris[node] for node in nodes]
+
+    def components_of(self, components, nodes):
+        """Returns the components of `nodes`, looked up in the `components`
+        the graph was built from.
+        """
+        return [components[self.keys[node]] for node in nodes]
+
+
+def dependency_graph(components):
+    """Returns the DependencyGraph of `components`, which is built on first
+    use and kept with them. Changing the dependencies afterwards is not
+    reflected.
+    """
+    graph = getattr(components, 'dependency_graph', None)
+    if graph is None:
+        graph = DependencyGraph(components)
+        try:
+            components.dependency_graph = graph
+        except AttributeError:
+            logger.debug('cannot keep dependency graph with %s' % type(components))
+    return graph
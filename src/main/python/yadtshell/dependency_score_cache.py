@@ -0,0 +1,118 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+
+import hashlib
+import logging
+import os.path
+
+import yadtshell.settings
+import yadtshell.components
+
+logger = logging.getLogger('dependency_score_cache')
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+DEPENDENCY_SCORE_CACHE_FORMAT = 1
+
+
+def dependency_score_cache_file():
+    return os.path.join(yadtshell.settings.OUT_DIR, 'dependency_scores')
+
+
+def services_of(components):
+    return [component for component in components.values()
+            if isinstance(component, yadtshell.components.Service)]
+
+
+def service_graph_fingerprint(components):
+    """Returns a digest of all services of `components` and of their
+    dependencies, i.e. of everything the cycle check and the dependency
+    scores depend on, but not of the states of the services.
+    """
+    digest = hashlib.sha1()
+    for service in sorted(services_of(components), key=lambda service: service.uri):
+        digest.update('%s\0%s\0%s\0%s\0%s\n' % (
+            service.uri,
+            service.host,
+            ' '.join(sorted(service.needs)),
+            ' '.join(sorted(getattr(service, 'needed_by', []))),
+            ' '.join(sorted(getattr(service, 'needs_services', []) +
+                            getattr(service, 'needs_artefacts', [])))))
+    return digest.hexdigest()
+
+
+class DependencyScoreCache(object):
+
+    """Remembers the dependency scores of the latest acyclic service graph,
+    keyed by its fingerprint. As long as the services and their
+    dependencies do not change, neither the cycle check nor the scoring
+    has to run again.
+    """
+
+    def __init__(self, fingerprint=None, scores=None):
+        self.fingerprint = fingerprint
+        self.scores = scores or {}
+
+    @classmethod
+    def load(cls, filename=None):
+        filename = filename or dependency_score_cache_file()
+        try:
+            with open(filename) as f:
+                cache_format, fingerprint, scores = pickle.load(f)
+            if cache_format == DEPENDENCY_SCORE_CACHE_FORMAT:
+                return cls(fingerprint, scores)
+        except Exception as e:
+            logger.debug('no dependency scores available: %s' % e)
+        return cls()
+
+    def save(self, filename=None):
+        filename = filename or dependency_score_cache_file()
+        try:
+            with open(filename, 'w') as f:
+                pickle.dump((DEPENDENCY_SCORE_CACHE_FORMAT, self.fingerprint, self.scores),
+                            f, pickle.HIGHEST_PROTOCOL)
+        except (IOError, OSError) as e:
+            logger.debug('cannot store dependency scores: %s' % e)
+
+    def restore(self, components):
+        """Sets the cached dependency scores on the services of
+        `components`. Returns False when the service graph changed.
+        """
+        services = services_of(components)
+        fingerprint = service_graph_fingerprint(components)
+        if (fingerprint != self.fingerprint or
+                any(service.uri not in self.scores for service in services)):
+            logger.debug('service graph changed, computing dependency scores')
+            self.fingerprint = fingerprint
+            self.scores = {}
+            return False
+        for service in services:
+            service.dependency_score = self.scores[service.uri]
+        return True
+
+    def store(self, components):
+        """Remembers the dependency scores of `components`, which must have
+        been computed for the graph `restore` was last called with.
+        """
+        self.scores = dict((service.uri, service.dependency_score)
+                           for service in services_of(components))
@@ -0,0 +1,174 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+
+import logging
+
+from yadtshell.constants import STANDALONE_SERVICE_RANK
+from yadtshell.util import compute_dependency_scores
+
+logger = logging.getLogger('dependency_tree')
+
+
+class DependencyTreeBuilder(object):
+
+    """Wires components into the unified dependencies tree while the status
+    answers of the hosts are still arriving.
+
+    Dependencies on components that are not known yet are parked until the
+    component arrives. Whatever is still unresolved when `finish` is called
+    becomes a MissingComponent, exactly as if the whole tree had been built
+    in one go.
+    """
+
+    def __init__(self, components, score_cache=None):
+        self.components = components
+        self.score_cache = score_cache
+        self.wired = set()
+        self.unresolved = {}
+
+    def add_host(self, host):
+        """Wires `host`, its services and its artefacts.
+        Returns `host` to facilitate chaining.
+        """
+        self.add(host)
+        for service in getattr(host, 'defined_services', []):
+            self.add(service)
+        for name_version in list(host.current_artefacts) + list(host.next_artefacts):
+            artefact = self.components.get(
+                'artefact://%s/%s' % (host.name, name_version))
+            if artefact:
+                self.add(artefact)
+        return host
+
+    def add(self, component):
+        if component.uri in self.wired:
+            return
+        self.wired.add(component.uri)
+        component.needs = set(getattr(component, 'needs', []))
+        for needed in list(component.needs):
+            if needed in self.components:
+                self._wire(component, needed)
+            else:
+                self.unresolved.setdefault(needed, []).append(component)
+        for alias in set([component.uri, getattr(component, 'revision_uri', None)]):
+            for dependent in self.unresolved.pop(alias, []):
+                self._wire(dependent, alias)
+
+    def _wire(self, component, needed):
+        try:
+            needed_component = self.components[needed]
+            if not hasattr(needed_component, 'needed_by'):
+                needed_component.needed_by = set()
+            needed_component.needed_by.add(component.uri)
+            component.needs.discard(needed)
+            component.needs.add(needed_component.uri)
+        except (KeyError, AttributeError), e:
+            logger.debug('needed: ' + needed)
+            raise e
+
+    def finish(self):
+        """Wires all remaining components, turns still unresolved
+        dependencies into MissingComponents and computes the dependency
+        scores, unless `score_cache` knows them for this service graph.
+        """
+        logger.debug('building unified dependencies tree')
+
+        self.components._add_when_missing_ = True
+        logger.debug('wiring components')
+        for component in self.components.values():
+            if component.uri not in self.wired:
+                self.add(component)
+        for needed, dependents in self.unresolved.items():
+            for dependent in dependents:
+                self._wire(dependent, needed)
+        self.unresolved = {}
+        self.components._add_when_missing_ = False
+
+        for component in self.components.values():
+            for dependent in getattr(component, 'needed_by', []):
+                try:
+                    dependent_component = self.components[dependent]
+                    dependent_component.needs.add(component.uri)
+                except KeyError, ke:
+                    logger.warning("unknown dependent key " + str(ke))
+
+        if self.score_cache is None:
+            compute_dependency_scores(self.components)
+        elif not self.score_cache.restore(self.components):
+            compute_dependency_scores(self.components)
+            self.score_cache.store(self.components)
+
+
+def set_provisional_dependency_scores(services):
+    """Ranks `services` by their direct dependencies on the same host only.
+
+    The real scores need the complete tree, this approximation is good
+    enough to order services while rendering partial results.
+    """
+    for service in services:
+        same_host = 'service://%s/' % service.host
+        inbound = len([uri for uri in service.needed_by if uri.startswith(same_host)])
+        outbound = len([uri for uri in service.needs if uri.startswith(same_host)])
+        if inbound == outbound == 0:
+            service.dependency_score = STANDALONE_SERVICE_RANK
+        else:
+            service.dependency_score = inbound - outbound
+
+
+class HostGroupTracker(object):
+
+    """Tells which groups of hosts (as listed in the target) have been
+    completely answered.
+    """
+
+    def __init__(self, host_groups):
+        self.pending_groups = [set(group) for group in host_groups if group]
+        self.finished_names = set()
+
+    def host_finished(self, host):
+        """Returns the groups finished by the arrival of `host`."""
+        self.finished_names.update([host.name, host.fqdn])
+        finished_groups = [group for group in self.pending_groups
+                           if group <= self.finished_names]
+        for group in finished_groups:
+            self.pending_groups.remove(group)
+        return finished_groups
+
+
+def dependency_closure(components, uris):
+    """Returns `uris` together with the URIs of all components they need
+    and of all components needing them, transitively.
+
+    Both directions are followed separately: the services needed by a
+    dependent of `uris` are not part of the closure.
+    """
+    closure = set(uris)
+    for attribute in ('needs', 'needed_by'):
+        pending = [uri for uri in uris if uri in components]
+        seen = set(pending)
+        while pending:
+            component = components[pending.pop()]
+            for uri in getattr(component, attribute, []):
+                if uri not in seen and uri in components:
+                    seen.add(uri)
+                    pending.append(uri)
+                closure.add(uri)
+        closure.update(seen)
+    return closure
@@ -26,30 +26,44 @@ import util
 logger = logging.getLogger('dump')
 
 
-def dump(args=[], mode='all', attribute=None, filter=None, **kwargs):
+def matches_all(uri, args):
+    return reduce(
+        lambda result, arg: result & (re.search(arg, uri) is not None),
+        args,
+        True
+    )
+
+
+def restore_matching_components(args):
+    """Restores only the hosts of the components matching `args`, looked
+    up in the index of the stored state.
+    """
+    if not args:
+        return util.restore_current_state()
+    store = util.current_state_store()
+    uris = [uri for uri in store.uris() if matches_all(uri, args)]
+    return util.restore_current_state(hosts=store.hosts_of(uris))
+
+
+def dump(args=[], mode='all', attribute=None, filter=None, components=None, **kwargs):
     if kwargs.get('show_pending_updates'):
         args = ['host://']
         attribute = 'next_artefacts'
     if kwargs.get('show_current_artefacts'):
         args = ['host://']
         attribute = 'handled_artefacts'
-    try:
-        components = util.restore_current_state()
-    except IOError:
-        logger.critical("cannot restore the current state")
-        logger.info("call 'yadtshell status' first")
-        sys.exit(1)
+    if not components:
+        try:
+            components = restore_matching_components(args)
+        except IOError:
+            logger.critical("cannot restore the current state")
+            logger.info("call 'yadtshell status' first")
+            sys.exit(1)
 
     result = set()
     for uri in components.keys():
-        if len(args) > 0:
-            all_matched = reduce(
-                lambda result, arg: result & (re.search(arg, uri) is not None),
-                args,
-                True
-            )
-            if not all_matched:
-                continue
+        if len(args) > 0 and not matches_all(uri, args):
+            continue
         component = components[uri]
         if attribute:
             a = getattr(component, attribute, None)
@@ -0,0 +1,167 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compiles a nested action plan into one graph of its actions.
+
+Executing a nested plan runs a pool per plan, and a sequential plan
+finishes each of its children before starting the next one. Chunks that
+share no components thus wait for each other, and workers idling in one
+pool cannot help another one.
+
+The flat plan keeps the actions only. Besides their preconditions, the
+children of a sequential plan are ordered only when they touch the same
+components, i.e. a child waits for the latest earlier child it shares a
+component with. The waves `apply_instructions` splits a plan into stay
+strictly ordered and keep their number of workers.
+"""
+
+from __future__ import absolute_import
+
+import yadtshell.actions
+
+
+def _uri_of(component_or_uri):
+    return getattr(component_or_uri, 'uri', component_or_uri)
+
+
+def touched_uris(action):
+    """Returns the uris of the components `action` changes or waits for."""
+    uris = set([_uri_of(action.uri)])
+    for precondition in action.preconditions:
+        uris.add(_uri_of(precondition.uri))
+    return uris
+
+
+class FlatPlan(object):
+
+    """The actions of a nested plan in depth-first order, indexed by
+    position, with the plans and the groups they belong to.
+
+    A group is a child of a plan, i.e. a nested plan or an action. The
+    positions of the actions of each plan and of each group are
+    contiguous: `group_first[g]` up to `group_end[g]`. `chains[position]`
+    lists the groups an action is part of, outermost first.
+
+    A group waits for `group_waits[g]` other groups to finish and lets its
+    `group_followers[g]` go when it finishes itself. Plans in a wave allow
+    up to `plan_capacity[p]` of their groups to run at the same time, the
+    other plans have a capacity of None.
+    """
+
+    def __init__(self, plan):
+        self.actions = []
+        self.paths = []
+        self.chains = []
+        self.group_plan = []
+        self.group_first = []
+        self.group_end = []
+        self.group_waits = []
+        self.group_followers = []
+        self.plan_names = []
+        self.plan_group = []
+        self.plan_first = []
+        self.plan_end = []
+        self.plan_capacity = []
+        self.plan_nr_errors_tolerated = []
+        self._add_plan(plan, [], [], None, None)
+
+    def __len__(self):
+        return len(self.actions)
+
+    def _new_group(self, plan_id):
+        group = len(self.group_plan)
+        self.group_plan.append(plan_id)
+        self.group_first.append(len(self.actions))
+        self.group_end.append(None)
+        self.group_waits.append(0)
+        self.group_followers.append([])
+        return group
+
+    def _add_plan(self, plan, path, chain, group, capacity):
+        plan_id = len(self.plan_names)
+        path = path + [plan.name]
+        self.plan_names.append('/' + '/'.join(path))
+        self.plan_group.append(group)
+        self.plan_first.append(len(self.actions))
+        self.plan_end.append(None)
+        self.plan_capacity.append(capacity)
+        self.plan_nr_errors_tolerated.append(int(plan.nr_errors_tolerated or 0))
+
+        waves = getattr(plan, 'waves', False)
+        sequential = waves or plan.nr_workers == 1
+        previous = None
+        # uri -> (latest nested plan touching it, actions touching it since)
+        latest = {}
+        for child in plan.actions:
+            child_group = self._new_group(plan_id)
+            is_plan = isinstance(child, yadtshell.actions.ActionPlan)
+            if is_plan:
+                self._add_plan(child, path, chain + [child_group], child_group,
+                               child.nr_workers if waves else None)
+            else:
+                self.actions.append(child)
+                self.paths.append(path + [' %s@%s' % (child.cmd, child.uri)])
+                self.chains.append(chain + [child_group])
+            self.group_end[child_group] = len(self.actions)
+
+            if waves:
+                if previous is not None:
+                    self._wait(child_group, previous)
+                previous = child_group
+            elif sequential:
+                self._wait_for_related(child_group, is_plan, latest)
+        self.plan_end[plan_id] = len(self.actions)
+
+    def _wait_for_related(self, group, is_plan, latest):
+        uris = set()
+        for position in range(self.group_first[group], self.group_end[group]):
+            uris.update(touched_uris(self.actions[position]))
+        waits_for = set()
+        for uri in uris:
+            latest_plan, latest_actions = latest.get(uri, (None, []))
+            if latest_plan is not None:
+                waits_for.add(latest_plan)
+            # actions of a sequential plan are ordered by their
+            # preconditions only, as they were within their pool
+            if is_plan:
+                waits_for.update(latest_actions)
+                latest[uri] = (group, [])
+            else:
+                latest_actions.append(group)
+                latest[uri] = (latest_plan, latest_actions)
+        for other in waits_for:
+            self._wait(group, other)
+
+    def _wait(self, group, other):
+        self.group_waits[group] += 1
+        self.group_followers[other].append(group)
+
+    def waiting_for(self, position):
+        """Returns the number of groups the action at `position` waits for
+        before it may run.
+        """
+        return sum(self.group_waits[group] for group in self.chains[position])
+
+    def parent_plan(self, plan_id):
+        group = self.plan_group[plan_id]
+        if group is None:
+            return None
+        return self.group_plan[group]
+
+    def innermost_plan(self, position):
+        return self.group_plan[self.chains[position][-1]]
@@ -0,0 +1,196 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+
+import hashlib
+import logging
+import os.path
+
+import yadtshell
+import yadtshell.settings
+
+logger = logging.getLogger('host_cache')
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+HOST_CACHE_FORMAT = 3
+
+
+def host_cache_file():
+    return os.path.join(yadtshell.settings.OUT_DIR, 'host_cache')
+
+
+def payload_digest(data):
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    return hashlib.sha1(data).hexdigest()
+
+
+def class_identity(component_class):
+    return component_class.__module__, component_class.__name__
+
+
+def service_class_setting(host, service):
+    """Returns the "class" setting `service` was created for."""
+    settings = host.services.get(service.name)
+    if settings is not None and 'class' in settings:
+        return settings['class']
+    return 'Service'
+
+
+def service_classes(host):
+    """Returns the class setting of each service of `host` together with
+    the identity of the class it was resolved to.
+    """
+    return tuple(sorted(set(
+        (service_class_setting(host, service), class_identity(type(service)))
+        for service in getattr(host, 'defined_services', []))))
+
+
+class HostCache(object):
+
+    """Remembers the host, services and artefacts built from the status
+    payload of each host, keyed by a digest of the payload, the version of
+    yadtshell and the classes the services were resolved to.
+
+    The components are stored as they were before they got wired into the
+    dependencies tree, so a restored host can be wired like a new one.
+    The payload itself is kept as well, together with the hash the host
+    uses to refer to it in conditional status answers.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, filename=None):
+        filename = filename or host_cache_file()
+        try:
+            with open(filename) as f:
+                cache_format, entries = pickle.load(f)
+            if cache_format == HOST_CACHE_FORMAT:
+                return cls(entries)
+        except Exception as e:
+            logger.debug('no host cache available: %s' % e)
+        return cls()
+
+    def save(self, filename=None):
+        filename = filename or host_cache_file()
+        logger.debug('host cache: %i hits, %i misses' % (self.hits, self.misses))
+        try:
+            with open(filename, 'w') as f:
+                pickle.dump((HOST_CACHE_FORMAT, self.entries), f, pickle.HIGHEST_PROTOCOL)
+        except (IOError, OSError) as e:
+            logger.debug('cannot store host cache: %s' % e)
+
+    def status_hash(self, hostname):
+        """Returns the hash of the latest payload of `hostname`, or None."""
+        entry = self.entries.get(hostname)
+        return entry[3] if entry else None
+
+    def payload(self, hostname, status_hash):
+        """Returns the payload of `hostname` referred to by `status_hash`,
+        or None when it is not cached.
+        """
+        entry = self.entries.get(hostname)
+        if entry and entry[3] == status_hash:
+            return entry[2]
+        return None
+
+    def store(self, hostname, data, host, components, status_hash=None):
+        subgraph = [host] + list(getattr(host, 'defined_services', []))
+        for name_version in list(host.current_artefacts) + list(host.next_artefacts):
+            artefact = components.get('artefact://%s/%s' % (host.name, name_version))
+            if artefact and artefact not in subgraph:
+                subgraph.append(artefact)
+
+        loggers = {}
+        for component in subgraph:
+            if getattr(component, 'logger', None):
+                loggers[component] = component.logger
+                component.logger = None
+        try:
+            digest = payload_digest(data)
+            self.entries[hostname] = (digest,
+                                      pickle.dumps(subgraph, pickle.HIGHEST_PROTOCOL),
+                                      data,
+                                      status_hash or digest,
+                                      yadtshell.VERSION,
+                                      service_classes(host))
+        except Exception as e:
+            logger.debug('cannot cache %s: %s' % (hostname, e))
+            self.entries.pop(hostname, None)
+        finally:
+            for component, component_logger in loggers.items():
+                component.logger = component_logger
+
+    def restore(self, hostname, data, components, resolve_service_class=None):
+        """Adds the components built from the same `data` during an earlier
+        run to `components`. Returns the host or None when `data` changed,
+        yadtshell was upgraded or, checked with `resolve_service_class(host,
+        class_setting)`, a class setting resolves to another class now.
+        Attributes depending on the current user are computed anew.
+        """
+        entry = self.entries.get(hostname)
+        if (entry is None or entry[0] != payload_digest(data) or
+                entry[4] != yadtshell.VERSION):
+            self.misses += 1
+            return None
+        try:
+            subgraph = pickle.loads(entry[1])
+        except Exception as e:
+            logger.debug('cannot restore %s: %s' % (hostname, e))
+            self.misses += 1
+            return None
+
+        host = subgraph[0]
+        for component in subgraph:
+            if hasattr(component, 'logger'):
+                component.logger = logging.getLogger(component.uri)
+        if resolve_service_class and not self._same_service_classes(
+                host, entry[5], resolve_service_class):
+            logger.debug('service classes of %s changed' % hostname)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if hasattr(host, 'update_attributes_after_status'):
+            host.update_attributes_after_status()
+        for component in subgraph:
+            components[component.uri] = component
+            revision_uri = getattr(component, 'revision_uri', None)
+            if revision_uri:
+                components[revision_uri] = component
+        return host
+
+    def _same_service_classes(self, host, classes, resolve_service_class):
+        for class_setting, identity in classes:
+            try:
+                service_class = resolve_service_class(host, class_setting)
+            except Exception as e:
+                logger.debug('cannot resolve %s: %s' % (class_setting, e))
+                return False
+            if service_class is None or class_identity(service_class) != identity:
+                return False
+        return True
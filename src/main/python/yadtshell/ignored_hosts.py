@@ -0,0 +1,95 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+
+import logging
+
+import simplejson as json
+from twisted.internet import defer
+
+from yadtshell.rest_simple import rest_call
+
+logger = logging.getLogger('ignored_hosts')
+
+
+class HostNotIgnored(Exception):
+    pass
+
+
+def host_status_ignored_url(ybc, short_hostname):
+    return "http://%s:%s/api/v1/hosts/%s/status-ignored" % (
+        ybc.host, ybc.port, short_hostname)
+
+
+def target_status_ignored_url(ybc, target):
+    return "http://%s:%s/api/v1/targets/%s/status-ignored" % (
+        ybc.host, ybc.port, target)
+
+
+class IgnoredHostsSnapshot(object):
+
+    """The ignore states of all hosts of a target, fetched from the
+    broadcaster with a single request.
+
+    `status_ignored` behaves like the per host status-ignored call: the
+    deferred fires with the ignore message of an ignored host and fails for
+    all other hosts. When the bulk request fails (e.g. because the
+    broadcaster does not support it), each host is asked separately.
+    """
+
+    def __init__(self, ybc, target):
+        self.ybc = ybc
+        self.target = target
+        self.ignored = None
+        self.fetched = None
+
+    def fetch(self):
+        self.fetched = defer.maybeDeferred(
+            rest_call, target_status_ignored_url(self.ybc, self.target))
+        self.fetched.addCallback(json.loads)
+        self.fetched.addCallback(self._store)
+        self.fetched.addErrback(self._fall_back)
+        return self.fetched
+
+    def _store(self, ignored):
+        if not isinstance(ignored, dict):
+            raise ValueError('expected a mapping of hosts to messages, got %r' % ignored)
+        logger.debug('ignored hosts of %s: %s' % (self.target, ', '.join(sorted(ignored))))
+        self.ignored = ignored
+
+    def _fall_back(self, failure):
+        logger.debug('cannot fetch ignored hosts of %s, asking each host separately: %s' %
+                     (self.target, failure.getErrorMessage()))
+        self.ignored = None
+
+    def status_ignored(self, short_hostname):
+        if self.fetched is None:
+            self.fetch()
+        deferred = defer.Deferred()
+        self.fetched.addCallback(self._answer, short_hostname, deferred)
+        return deferred
+
+    def _answer(self, result, short_hostname, deferred):
+        if self.ignored is None:
+            rest_call(host_status_ignored_url(self.ybc, short_hostname)).chainDeferred(deferred)
+        elif short_hostname in self.ignored:
+            deferred.callback(self.ignored[short_hostname])
+        else:
+            deferred.errback(HostNotIgnored(short_hostname))
+        return result
@@ -23,6 +23,7 @@ from subprocess import Popen, PIPE
 import hostexpand
 import yadtshell
 from yadtshell.constants import MAX_ALLOWED_AGE_OF_STATE_IN_SECONDS
+from yadtshell.dependency_graph import dependency_graph
 
 logger = logging.getLogger('info')
 
@@ -120,7 +121,7 @@ def info(logLevel=None, full=False, components=None, **kwargs):
 
     render_services_matrix(components)
 
-    max_age = yadtshell.util.get_age_of_current_state_in_seconds()
+    max_age = yadtshell.util.get_age_of_status_in_seconds(components)
     if max_age > MAX_ALLOWED_AGE_OF_STATE_IN_SECONDS:
         max_age = render_red('  %.0f  ' % max_age)
     else:
@@ -237,7 +238,9 @@ def calculate_info_view_settings(nr_of_hosts=None):
 
 
 def render_readonly_services(components):
-    ro_services = [c for c in components.itervalues()
+    graph = dependency_graph(components)
+    services = graph.components_of(components, graph.nodes_of_type(yadtshell.settings.SERVICE))
+    ro_services = [c for c in services
                    if isinstance(c, yadtshell.components.ReadonlyService)]
     if not ro_services:
         return
@@ -303,12 +306,15 @@ def render_services_matrix(components=None, **kwargs):
     render_legend(info_view_settings)
 
 
-def _render_services_matrix(components, hosts, info_view_settings, enable_legend=False):
+def _render_services_matrix(components, hosts, info_view_settings, enable_legend=False, graph=None):
+    if graph is None:
+        graph = dependency_graph(components)
+    all_hosts = graph.components_of(components, graph.nodes_of_type(yadtshell.settings.HOST))
     host_components = set()
     for host in hosts:
         found = components.get(host)
         if not found:
-            for c in [h for h in components.values()
+            for c in [h for h in all_hosts
                       if type(h) is yadtshell.components.Host or type(h) is yadtshell.components.UnreachableHost]:
                 if getattr(c, 'hostname', None) == host:
                     found = c
@@ -17,10 +17,10 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import logging
-import yaml
 import fnmatch
 
 import yadtshell
+from yadtshell.dependency_graph import dependency_graph
 
 logger = logging.getLogger('metalogic')
 
@@ -86,8 +86,28 @@ def collect_parallel_tasks(g):
     yield(pt, last_indent)
 
 
-def metalogic(cmd, args, plan_post_handler=None):
-    components = yadtshell.util.restore_current_state()
+def touched_closure(graph, components, nodes, key):
+    """Returns `nodes` together with all nodes of `graph` found along the
+    `key` edges, which is either 'needs' or 'needed_by'. Every node is
+    expanded once, when it is found.
+    """
+    touched = set(nodes)
+    pending = list(touched)
+    while pending:
+        node = pending.pop()
+        component = components[graph.keys[node]]
+        for dependent_node in graph.adjacent(node, key):
+            if dependent_node in touched:
+                continue
+            if components[graph.keys[dependent_node]].is_touched_also(component):
+                touched.add(dependent_node)
+                pending.append(dependent_node)
+    return touched
+
+
+def metalogic(cmd, args, plan_post_handler=None, components=None):
+    if components is None:
+        components = yadtshell.util.restore_current_state()
     if not plan_post_handler:
         plan_post_handler = chop_minimal_related_chunks
 
@@ -106,29 +126,20 @@ def metalogic(cmd, args, plan_post_handler=None):
     touched_uris = yadtshell.helper.expand_hosts(args)
     touched_uris = yadtshell.helper.glob_hosts(components, touched_uris)
 
-    touched_components = yadtshell.components.ComponentSet(components)
+    graph = dependency_graph(components)
+    touched_nodes = set()
     for touched_uri in touched_uris:
-        touched_components.add(touched_uri, True)
-    for c in touched_components:
-        logger.debug('touched component: %s' % c.uri)
+        if touched_uri not in components:
+            logger.warning('key %(touched_uri)s not found, ignoring' % locals())
+            continue
+        touched_nodes.add(graph.node(touched_uri))
+    for node in touched_nodes:
+        logger.debug('touched component: %s' % graph.uris[node])
 
     logger.debug('search recursivly for dependent components')
-    new_components = True
-    while new_components:
-        new_components = set()
-        for component in touched_components:
-            logger.debug('  processing %s' % component.uri)
-            for dependent_uri in getattr(component, key, []):
-                dependent = components[dependent_uri]
-                logger.debug('    checking %s' % dependent.uri)
-                if dependent in touched_components:
-                    logger.debug('    already found: %s' % dependent_uri)
-                    continue
-                if dependent.is_touched_also(component):
-                    new_components.add(dependent)
-        touched_components.update(new_components)
-        logger.debug('    new found: %s' % ', '.join(map(str, new_components)))
+    touched_nodes = touched_closure(graph, components, touched_nodes, key)
 
+    touched_components = graph.components_of(components, touched_nodes)
     for component in touched_components:
         logger.debug('touched component: %s' % component.uri)
 
@@ -137,14 +148,15 @@ def metalogic(cmd, args, plan_post_handler=None):
             logger.error('unknown component %(uri)s' % vars(component))
 
     action_set = set()
-    for touched_component in touched_components:
+    for node in touched_nodes:
+        touched_component = components[graph.keys[node]]
         if not hasattr(touched_component, cmd):
             continue
         action = yadtshell.actions.Action(cmd, touched_component.uri, 'state', target_state)
         action.preconditions = set([
-                                   yadtshell.actions.TargetState(d, 'state', target_state)
-                                   for d in getattr(touched_component, key, set())
-                                   if yadtshell.uri.parse(d)['type'] == yadtshell.settings.SERVICE
+                                   yadtshell.actions.TargetState(graph.uris[d], 'state', target_state)
+                                   for d in graph.adjacent(node, key)
+                                   if graph.types[d] == yadtshell.settings.SERVICE
                                    ])
         action_set.add(action)
 
@@ -152,13 +164,40 @@ def metalogic(cmd, args, plan_post_handler=None):
     return plan_post_handler(dependencies)
 
 
-def merge_chunks(component_to_chunk, old, new):
-    if old == new:
-        return
-    logger.debug('    merging chunk %(old)s with chunk %(new)s' % locals())
-    for uri, old_chunk_nr in component_to_chunk.iteritems():
-        if old_chunk_nr == old:
-            component_to_chunk[uri] = new
+class DisjointSets(object):
+
+    """Union-find over hashable items, with path compression. Every set is
+    labeled with the smallest label of the items merged into it.
+    """
+
+    def __init__(self):
+        self.parent = {}
+        self.label = {}
+
+    def __contains__(self, item):
+        return item in self.parent
+
+    def add(self, item, label):
+        self.parent[item] = item
+        self.label[item] = label
+
+    def find(self, item):
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, item, other):
+        root, other_root = self.find(item), self.find(other)
+        if root == other_root:
+            return
+        self.parent[other_root] = root
+        self.label[root] = min(self.label[root], self.label.pop(other_root))
+
+    def label_of(self, item):
+        return self.label[self.find(item)]
 
 
 def identity(x):
@@ -166,45 +205,30 @@ def identity(x):
 
 
 def chop_minimal_related_chunks(plan):
-    component_to_chunk = {}
+    """Splits `plan` into chunks of actions, which are related by their
+    preconditions, and returns a plan of these chunks.
+    """
+    chunks = DisjointSets()
     for nr, action in enumerate(plan.actions):
-        cmd = action.cmd
-        uri = action.uri
-        logger.debug('uri found: %s' % uri)
-        if uri not in component_to_chunk:
-            component_to_chunk[uri] = nr + 1
-    logger.debug(yaml.dump(component_to_chunk))
+        if action.uri not in chunks:
+            chunks.add(action.uri, nr + 1)
 
     for action in plan.actions:
-        cmd = action.cmd
-        uri = action.uri
-        chunk_nr = component_to_chunk.get(uri, None)
-        logger.debug('uri: %(uri)s, chunk: %(chunk_nr)s' % locals())
-        preconds = action.preconditions
-        for precond in preconds:
-            puri = precond.uri
-            if puri in component_to_chunk:
-                chunk_nr = min(component_to_chunk[puri], chunk_nr)
-                logger.debug('    chunk member found: %(puri)s' % locals())
-        logger.debug('    new chunk nr: %s' % chunk_nr)
-        merge_chunks(component_to_chunk, component_to_chunk[uri], chunk_nr)
-        for precond in preconds:
-            puri = precond.uri
-            precond_chunk_nr = component_to_chunk.get(puri)
-            if not precond_chunk_nr:
-                logger.debug('        interesting, %s not in plan, assuming up' % puri)
-                continue
-            logger.debug('    precond: %(puri)s %(precond_chunk_nr)s' % locals())
-            merge_chunks(component_to_chunk, precond_chunk_nr, chunk_nr)
+        for precond in action.preconditions:
+            if precond.uri in chunks:
+                chunks.union(action.uri, precond.uri)
+            else:
+                logger.debug('        interesting, %s not in plan, assuming up' % precond.uri)
+
+    actions_of_chunk = {}
+    for action in plan.actions:
+        actions_of_chunk.setdefault(chunks.label_of(action.uri), set()).add(action)
 
+    # the chunks are numbered in the order of their labels within a set,
+    # which depends on the order the labels are added in
     chunk_plans = set()
-    for nr, chunk_nr in enumerate(set(component_to_chunk.values())):
-        logger.debug('collecting components in chunk %s' % chunk_nr)
-        chunk_actions = set()
-        for action in plan.actions:
-            if component_to_chunk[action.uri] == chunk_nr:
-                chunk_actions.add(action)
-        chunk_plan = yadtshell.actions.ActionPlan('chunk_%s' % nr, chunk_actions)
+    for nr, chunk_nr in enumerate(set([chunks.label_of(uri) for uri in chunks.parent])):
+        chunk_plan = yadtshell.actions.ActionPlan('chunk_%s' % nr, actions_of_chunk[chunk_nr])
         chunk_plans.add(chunk_plan)
     if len(chunk_plans) > 1:
         logger.debug('%i independent chunks found' % len(chunk_plans))
@@ -269,6 +293,8 @@ def apply_instructions(plan, instructions):
                 start = end
             p.actions = chunks
             p.nr_workers = 1
+            # the waves run one after the other, even when flattened
+            p.waves = True
     logger.debug('-' * 20 + ' augmented plan ' + '-' * 20)
     for line in str(plan).splitlines():
         logger.debug(line)
@@ -34,19 +34,20 @@ logger = logging.getLogger('reboot')
 
 
 @log_exceptions(logger)
-def reboot(protocol=None, uris=None, parallel=None, **kwargs):
+def reboot(protocol=None, uris=None, parallel=None, components=None, **kwargs):
     for uri in uris:
         if not uri.startswith("host://"):
             message = "Cannot reboot %s" % uri
             logger.error(message)
             raise ValueError(message)
 
-    components = restore_current_state()
+    if components is None:
+        components = restore_current_state()
     host_uris = expand_hosts(uris)
     host_uris = glob_hosts(components, host_uris)
 
     hosts_to_reboot = uris
-    stop_plan = create_plan_to_stop_all_services_on(hosts_to_reboot)
+    stop_plan = create_plan_to_stop_all_services_on(hosts_to_reboot, components)
 
     all_stopped_services = set()
     for action in stop_plan.actions:
@@ -98,18 +99,20 @@ def create_reboot_action_for(host):
     return reboot_host_action
 
 
-def create_plan_to_stop_all_services_on(host_uris):
+def create_plan_to_stop_all_services_on(host_uris, components=None):
     return metalogic(
         yadtshell.settings.STOP,
         host_uris,
-        plan_post_handler=identity)
+        plan_post_handler=identity,
+        components=components)
 
 
 def create_plan_to_start_services_after_rebooting(services, rebooted_hosts, components):
     start_plan = metalogic(
         yadtshell.settings.START,
         services,
-        plan_post_handler=identity)
+        plan_post_handler=identity,
+        components=components)
 
     for start_action in start_plan.actions:
         if start_action.uri in services:
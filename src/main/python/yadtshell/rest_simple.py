@@ -21,13 +21,15 @@ from logging import getLogger
 
 try:
     from StringIO import StringIO  # py2
+    from urlparse import urlparse
 except ImportError:
     from io import StringIO  # py3
+    from urllib.parse import urlparse
 
 from twisted.internet import defer, reactor
 from twisted.internet.protocol import Protocol
 from twisted.python.failure import Failure
-from twisted.web.client import Agent, FileBodyProducer
+from twisted.web.client import Agent, FileBodyProducer, HTTPConnectionPool
 from twisted.web.http_headers import Headers
 
 
@@ -35,6 +37,9 @@ logger = getLogger("rest_library")
 
 
 HTTP_CONNECT_TIMEOUT_IN_SECONDS = 30
+HTTP_MAX_CONNECTIONS_PER_HOST = 8
+HTTP_CACHED_CONNECTION_TIMEOUT_IN_SECONDS = 60
+HTTP_MAX_RESPONSE_SIZE_IN_BYTES = 10 * 1024 * 1024
 
 
 class HTTP_METHOD(object):
@@ -43,7 +48,106 @@ class HTTP_METHOD(object):
     PUT = "PUT"
 
 
-def rest_call(url, http_method=HTTP_METHOD.GET, headers=Headers(), data=""):
+class ResponseTooLarge(Exception):
+    pass
+
+
+class RestMetrics(object):
+
+    """Counts the rest calls and their latencies (in seconds)."""
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.bytes_received = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency, failed=False, nr_bytes=0):
+        self.requests += 1
+        if failed:
+            self.failures += 1
+        self.bytes_received += nr_bytes
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def mean_latency(self):
+        if not self.requests:
+            return None
+        return self.total_latency / self.requests
+
+    def __str__(self):
+        return "%i rest calls (%i failed), %i bytes, latency mean %.3fs max %.3fs" % (
+            self.requests, self.failures, self.bytes_received,
+            self.mean_latency() or 0.0, self.max_latency)
+
+
+metrics = RestMetrics()
+
+
+class PooledAgent(object):
+
+    """A single Agent with persistent connections for all rest calls.
+
+    At most `max_connections_per_host` requests are sent to the same host
+    at the same time, further requests wait for a free connection. A
+    request holds its slot until its response body is read completely, so
+    the connection is back in the pool when the next request starts.
+    """
+
+    def __init__(self, clock=reactor,
+                 max_connections_per_host=HTTP_MAX_CONNECTIONS_PER_HOST):
+        self.clock = clock
+        self.max_connections_per_host = max_connections_per_host
+        self.pool = HTTPConnectionPool(clock, persistent=True)
+        self.pool.maxPersistentPerHost = max_connections_per_host
+        self.pool.cachedConnectionTimeout = HTTP_CACHED_CONNECTION_TIMEOUT_IN_SECONDS
+        self.agent = Agent(clock, pool=self.pool,
+                           connectTimeout=HTTP_CONNECT_TIMEOUT_IN_SECONDS)
+        self.semaphores = {}
+
+    def request(self, http_method, url, headers=None, body_producer=None):
+        """Returns a deferred firing with the body of the response, see
+        `read_response`.
+        """
+        parsed_url = urlparse(url)
+        key = (parsed_url.scheme, parsed_url.netloc)
+        semaphore = self.semaphores.get(key)
+        if semaphore is None:
+            semaphore = self.semaphores[key] = defer.DeferredSemaphore(
+                self.max_connections_per_host)
+        return semaphore.run(
+            self._request_body, http_method, url, headers, body_producer)
+
+    def _request_body(self, http_method, url, headers, body_producer):
+        deferred = self.agent.request(http_method, url, headers, body_producer)
+        deferred.addCallback(read_response)
+        return deferred
+
+    def close(self):
+        return self.pool.closeCachedConnections()
+
+
+_agent = None
+
+
+def get_agent():
+    global _agent
+    if _agent is None:
+        _agent = PooledAgent()
+        reactor.addSystemEventTrigger("before", "shutdown", _close_agent)
+    return _agent
+
+
+def _close_agent():
+    global _agent
+    agent, _agent = _agent, None
+    if agent:
+        logger.debug(str(metrics))
+        return agent.close()
+
+
+def rest_call(url, http_method=HTTP_METHOD.GET, headers=None, data=""):
     """
     Returns a deferred that will callback with the response to a rest call
     or fire its err-back when a response code != 200 is received.
@@ -66,37 +170,65 @@ def rest_call(url, http_method=HTTP_METHOD.GET, headers=Headers(), data=""):
         string with data to submit - no special treatment (e.G. no URL encoding!)
     """
 
+    if headers is None:
+        headers = Headers()
     headers.addRawHeader("Content-Type", "text/plain")
 
-    agent = Agent(reactor, None, connectTimeout=HTTP_CONNECT_TIMEOUT_IN_SECONDS)
-
-    deferred = agent.request(http_method,
-                             url,
-                             headers,
-                             FileBodyProducer(StringIO(data)) if data else None)
-    deferred.addCallback(read_response)
+    started = reactor.seconds()
+    deferred = get_agent().request(http_method,
+                                   url,
+                                   headers,
+                                   FileBodyProducer(StringIO(data)) if data else None)
+    deferred.addBoth(record_metrics, started)
     return deferred
 
 
-def read_response(response):
-    if response.code != 200:
-        return Failure(Exception("Non-OK response for URL: %s" % response))
+def record_metrics(result, started):
+    failed = isinstance(result, Failure)
+    metrics.record(reactor.seconds() - started, failed,
+                   0 if failed else len(result))
+    return result
+
+
+def read_response(response, max_size=HTTP_MAX_RESPONSE_SIZE_IN_BYTES):
+    """Returns a deferred firing with the body of `response`. The body of
+    a non-OK response is read as well before failing, otherwise its
+    connection would not go back to the pool.
+    """
     d = defer.Deferred()
-    response.deliverBody(BodyConsumer(d))
+    response.deliverBody(BodyConsumer(d, max_size))
+    if response.code != 200:
+        d.addBoth(fail_on_non_ok_response, response)
     return d
 
 
+def fail_on_non_ok_response(ignored, response):
+    return Failure(Exception("Non-OK response for URL: %s" % response))
+
+
 class BodyConsumer(Protocol):
 
-    def __init__(self, finished):
+    def __init__(self, finished, max_size=HTTP_MAX_RESPONSE_SIZE_IN_BYTES):
         self.finished = finished
-        self.data = ""
+        self.max_size = max_size
+        self.chunks = []
+        self.size = 0
 
     def connectionMade(self, *args, **kwargs):
         pass
 
     def dataReceived(self, data):
-        self.data += data
+        if self.finished.called:
+            return
+        self.size += len(data)
+        if self.size > self.max_size:
+            self.chunks = []
+            self.finished.errback(ResponseTooLarge(
+                "Response exceeds %i bytes" % self.max_size))
+            self.transport.stopProducing()
+            return
+        self.chunks.append(data)
 
     def connectionLost(self, reason):
-        self.finished.callback(self.data)
+        if not self.finished.called:
+            self.finished.callback("".join(self.chunks))
@@ -28,19 +28,20 @@ logger = logging.getLogger('restart')
 
 
 @log_exceptions(logger)
-def restart(protocol=None, uris=None, parallel=None, **kwargs):
+def restart(protocol=None, uris=None, parallel=None, components=None, **kwargs):
     logger.debug("uris: %s" % uris)
     logger.debug("parallel: %s" % parallel)
     logger.debug("kwargs: %s" % kwargs)
 
-    components = restore_current_state()
+    if components is None:
+        components = restore_current_state()
     service_uris = expand_hosts(uris)
     service_uris = glob_hosts(components, service_uris)
 
     logging.debug("service uris: %s" % service_uris)
 
     plan_all = []
-    stop_plan = metalogic(STOP, uris, plan_post_handler=identity)
+    stop_plan = metalogic(STOP, uris, plan_post_handler=identity, components=components)
     stop_plan = chop_minimal_related_chunks(stop_plan)
     for chunk in stop_plan.actions:
         stops = ActionPlan("stop", chunk.actions)
@@ -54,7 +55,7 @@ def restart(protocol=None, uris=None, parallel=None, **kwargs):
                       if state == UP]
         start_uris = set(start_uris)
         logging.info("restarting %s" % ", ".join(start_uris))
-        starts = metalogic(START, start_uris, plan_post_handler=identity)
+        starts = metalogic(START, start_uris, plan_post_handler=identity, components=components)
 
         plan_all.append(ActionPlan("chunk", [stops, starts], nr_workers=1))
 
@@ -0,0 +1,135 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+
+import inspect
+import logging
+import sys
+
+logger = logging.getLogger('service_registry')
+
+ENTRY_POINT_GROUP = 'yadtshell.services'
+
+
+class ServiceClassRegistry(object):
+
+    """Resolves service class names, as used in the "class" setting of a
+    service, to classes.
+
+    Lookups try explicitly registered classes first, then classes published
+    via the `yadtshell.services` entry point group and finally all classes
+    of the loaded modules. The modules are indexed lazily: only modules
+    loaded since the last miss are inspected again. Long running processes
+    start over when the published service classes change, see
+    `invalidate_if_plugins_changed`.
+    """
+
+    def __init__(self):
+        self.registered = {}
+        self.index = {}
+        self.indexed_modules = set()
+        self.entry_points_loaded = False
+        self.entry_point_signature = None
+        self.fallbacks = {}
+
+    def invalidate(self):
+        """Forgets the indexed modules, the entry points and the classes
+        found by the fallbacks. Registered classes are kept.
+        """
+        self.index = {}
+        self.indexed_modules = set()
+        self.entry_points_loaded = False
+        self.entry_point_signature = None
+        self.fallbacks = {}
+
+    def invalidate_if_plugins_changed(self):
+        """Invalidates the registry when the entry points of the
+        `yadtshell.services` group or their distributions changed since
+        they were loaded.
+        """
+        if not self.entry_points_loaded:
+            return
+        if _entry_point_signature(_entry_points()) != self.entry_point_signature:
+            logger.debug('service plugins changed, resolving service classes anew')
+            self.invalidate()
+
+    def register(self, service_class, name=None):
+        self.registered[name or service_class.__name__] = service_class
+        return service_class
+
+    def lookup(self, service_class_name):
+        service_class = self.registered.get(service_class_name)
+        if service_class:
+            return service_class
+        if not self.entry_points_loaded:
+            self._load_entry_points()
+            service_class = self.registered.get(service_class_name)
+            if service_class:
+                return service_class
+        if service_class_name not in self.index:
+            self._index_loaded_modules()
+        return self.index.get(service_class_name)
+
+    def _load_entry_points(self):
+        self.entry_points_loaded = True
+        entry_points = _entry_points()
+        self.entry_point_signature = _entry_point_signature(entry_points)
+        for entry_point in entry_points:
+            try:
+                self.register(entry_point.load(), entry_point.name)
+            except Exception as e:
+                logger.warning('cannot load service class %s: %s' % (entry_point, e))
+
+    def _index_loaded_modules(self):
+        for module_name, module in sys.modules.items():
+            if module_name in self.indexed_modules:
+                continue
+            self.indexed_modules.add(module_name)
+            if module is None or module_name.startswith("six.moves"):
+                continue  # six.moves is horrible and inspecting it causes a crash
+            try:
+                for classname, service_class in inspect.getmembers(module, inspect.isclass):
+                    self.index.setdefault(classname, service_class)
+            except Exception:
+                pass
+
+
+def _entry_points():
+    """Returns the entry points of the `yadtshell.services` group currently
+    installed, which may differ from those of the running process.
+    """
+    try:
+        import pkg_resources
+    except ImportError:
+        return []
+    return list(pkg_resources.WorkingSet().iter_entry_points(ENTRY_POINT_GROUP))
+
+
+def _entry_point_signature(entry_points):
+    return sorted('%s (%s)' % (entry_point, entry_point.dist) for entry_point in entry_points)
+
+
+registry = ServiceClassRegistry()
+
+
+def register_service_class(service_class, name=None):
+    """Makes `service_class` available under `name` (defaults to the class
+    name). Can be used as class decorator.
+    """
+    return registry.register(service_class, name)
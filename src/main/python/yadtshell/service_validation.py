@@ -21,10 +21,14 @@ class ServiceDefinitionValidator(object):
         """ Will raise an exception if the service definitions contain cycles
         """
         cycles = []
-        strongly_connected_components = tarjan_scc(self.edges)
+        closing_edges = []
+        strongly_connected_components = tarjan_scc(self.edges, closing_edges)
         for component in strongly_connected_components:
             if len(component) > 1:
-                cycles.append("\t\t * %s" % Cycle(component))
+                nodes = set(component)
+                cycles.append("\t\t * %s" % Cycle(
+                    component,
+                    [edge for edge in closing_edges if edge[0] in nodes and edge[1] in nodes]))
 
         if len(cycles) > 0:
             error_message = """Found cycle(s) in service definition : \n%s""" % "\n".join(
@@ -34,54 +38,81 @@ class ServiceDefinitionValidator(object):
 
 class Cycle(object):
 
-    def __init__(self, nodes_involved):
+    def __init__(self, nodes_involved, closing_edges=None):
         self.nodes_involved = nodes_involved
+        self.closing_edges = closing_edges or []
 
     def __str__(self):
-        return "Cycle of %s" % (self.nodes_involved,)
+        description = "Cycle of %s" % (self.nodes_involved,)
+        if self.closing_edges:
+            description += ", closed by %s" % ", ".join(
+                "%s -> %s" % edge for edge in self.closing_edges)
+        return description
 
 
-def tarjan_scc(graph):
+def tarjan_scc(graph, closing_edges=None):
     """ Tarjan's partitioning algorithm for finding strongly
         connected components in a graph.
+
+        The depth-first search keeps its own stack instead of recursing,
+        so long dependency chains do not hit the recursion limit. The
+        edges leading back to a node still on the stack, i.e. the edges
+        closing a cycle, are appended to `closing_edges` when given.
     """
 
-    index_counter = [0]
+    index_counter = 0
     stack = []
+    on_stack = set()
     low_links = {}
     index = {}
     result = []
 
-    def strong_connect(node):
-        index[node] = index_counter[0]
-        low_links[node] = index_counter[0]
-        index_counter[0] += 1
-        stack.append(node)
-
+    def successors_of(node):
         try:
-            successors = graph[node]
+            return iter(graph[node])
         except Exception:
-            successors = []
-        for successor in successors:
-            if successor not in low_links:
-                strong_connect(successor)
-                low_links[node] = min(low_links[node], low_links[successor])
-            elif successor in stack:
-                low_links[node] = min(low_links[node], index[successor])
-
-        if low_links[node] == index[node]:
-            connected_component = []
-
-            while True:
-                successor = stack.pop()
-                connected_component.append(successor)
-                if successor == node:
+            return iter([])
+
+    for root in graph:
+        if root in low_links:
+            continue
+
+        index[root] = low_links[root] = index_counter
+        index_counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, successors_of(root))]
+
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in low_links:
+                    index[successor] = low_links[successor] = index_counter
+                    index_counter += 1
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, successors_of(successor)))
                     break
-            component = tuple(connected_component)
-            result.append(component)
-
-    for node in graph:
-        if node not in low_links:
-            strong_connect(node)
+                elif successor in on_stack:
+                    low_links[node] = min(low_links[node], index[successor])
+                    if closing_edges is not None:
+                        closing_edges.append((node, successor))
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low_links[parent] = min(low_links[parent], low_links[node])
+
+                if low_links[node] == index[node]:
+                    connected_component = []
+
+                    while True:
+                        successor = stack.pop()
+                        on_stack.discard(successor)
+                        connected_component.append(successor)
+                        if successor == node:
+                            break
+                    component = tuple(connected_component)
+                    result.append(component)
 
     return result
@@ -0,0 +1,275 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Indexed on-disk store of the current state.
+
+The components of each host are pickled into one row of a SQLite
+database, next to an index of all uris with the host and the type of
+their component. Readers that only touch a few hosts unpickle only
+those, and the index answers which uris exist without unpickling
+anything. The dependency graph of the whole state is stored along, so
+it is built once per status and not by every reader.
+
+While actions run, the state changes they find out are appended to a
+journal, which readers replay on top of the stored state until the next
+full state replaces both.
+"""
+
+from __future__ import absolute_import
+
+import logging
+import os
+import sqlite3
+import time
+
+import simplejson as json
+
+import yadtshell.settings
+import yadtshell.components
+from yadtshell.dependency_graph import DependencyGraph
+
+logger = logging.getLogger('state_store')
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+STATE_STORE_FORMAT = 1
+STATE_STORE_FILENAME = 'current_state.db'
+LEGACY_STATE_FILENAME = 'current_state.components'
+STATE_JOURNAL_FILENAME = 'current_state.journal'
+
+
+def state_store_file():
+    return os.path.join(yadtshell.settings.OUT_DIR, STATE_STORE_FILENAME)
+
+
+def legacy_state_file():
+    return os.path.join(yadtshell.settings.OUT_DIR, LEGACY_STATE_FILENAME)
+
+
+def state_journal_file():
+    return os.path.join(yadtshell.settings.OUT_DIR, STATE_JOURNAL_FILENAME)
+
+
+class StateStoreError(IOError):
+    pass
+
+
+class StateStore(object):
+
+    """The current state of a target, stored per host.
+
+    Components are grouped by the host they are located on. All uris
+    referring to a component, e.g. the revision uri of an artefact, are
+    stored in the same row, so the identity of components within a host
+    survives a round trip.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename or state_store_file()
+
+    def _connect(self, filename=None):
+        return sqlite3.connect(filename or self.filename)
+
+    def _open(self):
+        if not os.path.exists(self.filename):
+            raise StateStoreError('no state stored in %s' % self.filename)
+        connection = self._connect()
+        try:
+            (store_format,) = connection.execute(
+                "SELECT value FROM meta WHERE key = 'format'").fetchone()
+        except (sqlite3.Error, TypeError) as e:
+            connection.close()
+            raise StateStoreError('cannot read %s: %s' % (self.filename, e))
+        if int(store_format) != STATE_STORE_FORMAT:
+            connection.close()
+            raise StateStoreError('%s has format %s, expected %s' % (
+                self.filename, store_format, STATE_STORE_FORMAT))
+        return connection
+
+    def save(self, components):
+        """Replaces the stored state with `components`. The new state is
+        written next to the old one and renamed over it, so readers never
+        see a partially written state. The dependency graph is built anew,
+        a graph kept with `components` may stem from fewer components.
+        """
+        by_host = {}
+        for uri, component in components.items():
+            by_host.setdefault(component.host, {})[uri] = component
+
+        temporary_filename = '%s.%i' % (self.filename, os.getpid())
+        if os.path.exists(temporary_filename):
+            os.remove(temporary_filename)
+        connection = self._connect(temporary_filename)
+        try:
+            connection.executescript("""
+                CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE hosts (host TEXT PRIMARY KEY, components BLOB);
+                CREATE TABLE uris (uri TEXT PRIMARY KEY, host TEXT, type TEXT);
+                CREATE TABLE graph (graph BLOB);
+                CREATE INDEX uris_by_host ON uris (host);
+                CREATE INDEX uris_by_type ON uris (type);
+            """)
+            connection.execute("INSERT INTO meta VALUES ('format', ?)",
+                               (str(STATE_STORE_FORMAT),))
+            for host, host_components in by_host.items():
+                connection.execute(
+                    'INSERT INTO hosts VALUES (?, ?)',
+                    (host, sqlite3.Binary(pickle.dumps(host_components, pickle.HIGHEST_PROTOCOL))))
+                connection.executemany(
+                    'INSERT INTO uris VALUES (?, ?, ?)',
+                    [(uri, host, component.type) for uri, component in host_components.items()])
+            connection.execute(
+                'INSERT INTO graph VALUES (?)',
+                (sqlite3.Binary(pickle.dumps(DependencyGraph(components), pickle.HIGHEST_PROTOCOL)),))
+            connection.commit()
+        finally:
+            connection.close()
+        os.rename(temporary_filename, self.filename)
+
+    def uris(self, hosts=None, types=None):
+        """Returns the stored uris, optionally only those located on
+        `hosts` or of one of `types`, without loading any component.
+        """
+        query = 'SELECT uri FROM uris'
+        conditions, parameters = [], []
+        for column, values in (('host', hosts), ('type', types)):
+            if values is not None:
+                values = list(values)
+                conditions.append('%s IN (%s)' % (column, ', '.join('?' * len(values))))
+                parameters.extend(values)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        connection = self._open()
+        try:
+            return [str(uri) for (uri,) in connection.execute(query, parameters)]
+        finally:
+            connection.close()
+
+    def hosts_of(self, uris):
+        """Returns the hosts the components of `uris` are located on."""
+        uris = list(uris)
+        connection = self._open()
+        try:
+            hosts = set()
+            for offset in range(0, len(uris), 500):
+                chunk = uris[offset:offset + 500]
+                hosts.update(str(host) for (host,) in connection.execute(
+                    'SELECT DISTINCT host FROM uris WHERE uri IN (%s)' % ', '.join('?' * len(chunk)),
+                    chunk))
+            return hosts
+        finally:
+            connection.close()
+
+    def load(self, hosts=None):
+        """Returns a ComponentDict with the components located on `hosts`,
+        or with all stored components along with their dependency graph.
+        """
+        query = 'SELECT components FROM hosts'
+        parameters = []
+        if hosts is not None:
+            hosts = list(hosts)
+            query += ' WHERE host IN (%s)' % ', '.join('?' * len(hosts))
+            parameters = hosts
+        components = yadtshell.components.ComponentDict()
+        connection = self._open()
+        try:
+            for (blob,) in connection.execute(query, parameters):
+                components.update(pickle.loads(str(blob)))
+            if hosts is None:
+                components.dependency_graph = self._load_graph(connection)
+        finally:
+            connection.close()
+        return components
+
+    def _load_graph(self, connection):
+        try:
+            (blob,) = connection.execute('SELECT graph FROM graph').fetchone()
+            return pickle.loads(str(blob))
+        except Exception as e:
+            logger.debug('no dependency graph stored in %s: %s' % (self.filename, e))
+            return None
+
+
+def migrate_legacy_state(store=None):
+    """Converts the pickled current_state.components of earlier versions
+    into a StateStore, keeping its modification time. Returns True when
+    there was a state to migrate.
+    """
+    store = store or StateStore()
+    legacy_filename = legacy_state_file()
+    if os.path.exists(store.filename) or not os.path.exists(legacy_filename):
+        return False
+    logger.debug('migrating %s to %s' % (legacy_filename, store.filename))
+    with open(legacy_filename) as f:
+        components = pickle.load(f)
+    store.save(components)
+    mtime = os.path.getmtime(legacy_filename)
+    os.utime(store.filename, (mtime, mtime))
+    os.remove(legacy_filename)
+    return True
+
+
+class StateJournal(object):
+
+    """Append-only journal of attribute changes of components, one JSON
+    object per line. Each change is on disk before `append` returns, so
+    the changes survive when yadtshell dies before storing the state.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename or state_journal_file()
+
+    def append(self, uri, attribute, value):
+        entry = json.dumps({'uri': uri, 'attribute': attribute, 'value': value, 'time': time.time()})
+        with open(self.filename, 'a') as f:
+            f.write(entry + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def entries(self):
+        try:
+            with open(self.filename) as f:
+                lines = f.readlines()
+        except IOError:
+            return []
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                logger.debug('skipping incomplete journal entry %r' % line)
+        return entries
+
+    def replay(self, components):
+        """Applies the journaled changes to those of `components` that
+        are present. Returns `components` to facilitate chaining.
+        """
+        for entry in self.entries():
+            component = components.get(entry['uri'])
+            if component is not None:
+                setattr(component, str(entry['attribute']), entry['value'])
+        return components
+
+    def clear(self):
+        try:
+            os.remove(self.filename)
+        except OSError:
+            pass
@@ -22,8 +22,8 @@ import glob
 import os
 import logging
 import sys
-import inspect
 import shlex
+import time
 import yaml
 import simplejson as json
 import re
@@ -36,7 +36,28 @@ from twisted.python.failure import Failure
 from hostexpand.HostExpander import HostExpander
 import yadtshell
 from yadtshell.rest_simple import rest_call
-from yadtshell.util import compute_dependency_scores, filter_missing_services
+from yadtshell.conditional_status import (conditional_status_command,
+                                          resolve_conditional_status,
+                                          UnresolvableConditionalStatus)
+from yadtshell.dependency_graph import DependencyGraph
+from yadtshell.dependency_score_cache import DependencyScoreCache
+from yadtshell.host_cache import HostCache
+from yadtshell.ignored_hosts import (IgnoredHostsSnapshot,
+                                     host_status_ignored_url)
+from yadtshell.service_registry import registry as service_registry
+from yadtshell.state_store import (STATE_STORE_FILENAME,
+                                   STATE_JOURNAL_FILENAME,
+                                   LEGACY_STATE_FILENAME)
+from yadtshell.status_scheduler import (StatusScheduler,
+                                        StatusHistory,
+                                        StatusDeadlineExceeded)
+from yadtshell.constants import (STATUS_MAX_IN_FLIGHT_DEFAULT,
+                                 STATUS_DEADLINE_DEFAULT)
+from yadtshell.util import filter_missing_services
+from yadtshell.dependency_tree import (DependencyTreeBuilder,
+                                       HostGroupTracker,
+                                       dependency_closure,
+                                       set_provisional_dependency_scores)
 
 
 logger = logging.getLogger('status')
@@ -47,12 +68,6 @@ try:
 except ImportError:
     from yaml import Loader as yaml_loader
     logger.debug("using default yaml")
-try:
-    import cPickle as pickle
-    logger.debug("using C implementation of pickle")
-except ImportError:
-    import pickle
-    logger.debug("using default pickle")
 
 local_service_collector = None
 
@@ -61,7 +76,7 @@ def status_cb(protocol=None):
     return status()
 
 
-def handle_ignored_status(result_or_failure, component_name, components, pi):
+def handle_ignored_status(result_or_failure, component_name, components, pi, status_hash=None):
     if isinstance(result_or_failure, Failure):
         ignored = False
     else:
@@ -73,28 +88,49 @@ def handle_ignored_status(result_or_failure, component_name, components, pi):
         components[ignored_host.uri] = ignored_host
         return succeed(ignored_host)
     else:
-        p = yadtshell.twisted.YadtProcessProtocol(
-            component_name, '/usr/bin/yadt-status', pi, out_log_level=logging.NOTSET)
-        p.deferred.name = component_name
-        cmd = shlex.split(yadtshell.settings.SSH) + [component_name]
-        reactor.spawnProcess(p, cmd[0], cmd, os.environ)
-        return p.deferred
+        return spawn_status_query(component_name, pi, status_hash)
+
 
+def spawn_status_query(component_name, pi=None, status_hash=None):
+    p = yadtshell.twisted.YadtProcessProtocol(
+        component_name, '/usr/bin/yadt-status', pi, out_log_level=logging.NOTSET)
+    p.deferred.name = component_name
+    cmd = (shlex.split(yadtshell.settings.SSH) + [component_name] +
+           conditional_status_command(status_hash))
+    reactor.spawnProcess(p, cmd[0], cmd, os.environ)
+    return p.deferred
 
-def query_status(component_name, components, pi=None):
+
+def query_status(component_name, components, pi=None, ignored_hosts=None, status_hash=None):
     short_hostname = re.sub("\\..*", "", component_name)
 
-    d = rest_call("http://%s:%s/api/v1/hosts/%s/status-ignored" % (
-        yadtshell.settings.ybc.host,
-        yadtshell.settings.ybc.port,
-        short_hostname))
+    if ignored_hosts:
+        d = ignored_hosts.status_ignored(short_hostname)
+    else:
+        d = rest_call(host_status_ignored_url(yadtshell.settings.ybc, short_hostname))
 
-    d.addCallbacks(callback=handle_ignored_status, callbackArgs=[component_name, components, pi],
-                   errback=handle_ignored_status, errbackArgs=[component_name, components, pi])
+    d.addCallbacks(callback=handle_ignored_status,
+                   callbackArgs=[component_name, components, pi, status_hash],
+                   errback=handle_ignored_status,
+                   errbackArgs=[component_name, components, pi, status_hash])
     return d
 
 
 def handle_failing_status(failure, components, ignore_unreachable_hosts=False):
+    if isinstance(failure.value, StatusDeadlineExceeded):
+        if yadtshell.settings.ignore_unreachable_hosts or ignore_unreachable_hosts:
+            logger.warning('Host %s did not answer within %s seconds; temporarily ignoring it.',
+                           failure.value.component, failure.value.deadline)
+            unreachable_host = yadtshell.components.UnreachableHost(
+                failure.value.component)
+            components[unreachable_host.uri] = unreachable_host
+            return unreachable_host
+
+        logger.critical(
+            'Host %s did not answer within %s seconds. Use --ignore-unreachable-hosts '
+            'to ignore this error.',
+            failure.value.component, failure.value.deadline)
+        return failure
     if failure.value.exitCode == 127:
         logger.critical('No yadt-minion installed on remote host %s',
                         failure.value.component)
@@ -158,6 +194,106 @@ def create_host(protocol, components):
     return host
 
 
+def create_host_with_components(protocol, components, host_cache=None, requery=True):
+    """Creates the host with its services and artefacts from the status
+    `protocol`. When the status data did not change since it was cached in
+    `host_cache`, the components are restored from the cache instead.
+    Conditional answers (unchanged or delta) are resolved against the
+    payload in `host_cache` first. When they cannot be resolved, the full
+    status of the host is queried once more and a deferred is returned.
+    """
+    if host_cache is None or isinstance(protocol, yadtshell.components.AbstractHost):
+        host = create_host(protocol, components)
+        initialize_services(host, components)
+        return initialize_artefacts(host, components)
+
+    try:
+        resolve_conditional_status(protocol, host_cache)
+    except UnresolvableConditionalStatus as e:
+        if not requery:
+            raise
+        logger.debug('%s, querying full status' % e)
+        d = spawn_status_query(protocol.component)
+        d.addCallback(create_host_with_components, components, host_cache, False)
+        return d
+    host = host_cache.restore(protocol.component, protocol.data, components,
+                              resolve_service_class)
+    if host:
+        write_host_data_to_file(protocol.component, protocol.data)
+        return host
+    host = create_host(protocol, components)
+    initialize_services(host, components)
+    initialize_artefacts(host, components)
+    host_cache.store(protocol.component, protocol.data, host, components,
+                     protocol.status_hash)
+    return host
+
+
+def host_components(host, components):
+    """Returns `host` with its services and artefacts."""
+    subgraph = [host] + list(getattr(host, 'defined_services', []))
+    for name_version in (list(getattr(host, 'current_artefacts', [])) +
+                         list(getattr(host, 'next_artefacts', []))):
+        artefact = components.get('artefact://%s/%s' % (host.name, name_version))
+        if artefact and artefact not in subgraph:
+            subgraph.append(artefact)
+    return subgraph
+
+
+def record_snapshot(host, components, host_cache=None, status_time=None):
+    """Records on `host`, its services and its artefacts that they stem
+    from the status answered at `status_time` (now by default). The
+    snapshot is named by the digest of the payload, as found in
+    `host_cache`. Returns `host` to facilitate chaining.
+    """
+    status_time = status_time or time.time()
+    snapshot = None
+    if host_cache is not None:
+        snapshot = host_cache.entries.get(host.fqdn, host_cache.entries.get(host.name, (None,)))[0]
+    for component in host_components(host, components):
+        component.status_time = status_time
+        component.status_snapshot = snapshot
+    return host
+
+
+def reuse_fresh_snapshots(max_age, hosts=None, **kwargs):
+    """Queries only those `hosts` (all hosts of the target by default)
+    whose stored status is older than `max_age` seconds, or unreachable.
+    The stored status of all other hosts is merged into the new one.
+    """
+    try:
+        previous_components = yadtshell.util.restore_current_state(must_be_fresh=False)
+    except Exception, e:
+        logger.debug('no stored status to reuse: %s' % e)
+        return status(hosts=hosts, **kwargs)
+
+    now = time.time()
+
+    def is_outdated(component):
+        status_time = getattr(component, 'status_time', None)
+        return status_time is None or now - status_time > max_age
+
+    fresh_hosts = set([component.host for component in previous_components.values()
+                       if isinstance(component, yadtshell.components.Host) and
+                       not is_outdated(component)])
+    if type(hosts) is str:
+        hosts = [hosts]
+    hosts = hosts or yadtshell.settings.TARGET_SETTINGS['hosts']
+    outdated_hosts = [hostname for hostname in hosts if hostname.split('.')[0] not in fresh_hosts]
+
+    if not outdated_hosts:
+        logger.debug('reusing the status of all %i hosts' % len(hosts))
+        yadtshell.info(components=previous_components)
+        return defer.succeed(previous_components)
+
+    logger.debug('reusing the status of %i hosts, querying %s' % (
+        len(hosts) - len(outdated_hosts), ', '.join(outdated_hosts)))
+    outdated_uris = set([uri for uri, component in previous_components.items()
+                         if is_outdated(component)])
+    known_components = known_components_outside_of(previous_components, outdated_hosts, outdated_uris)
+    return status(hosts=outdated_hosts, known_components=known_components, **kwargs)
+
+
 def initialize_services(host, components):
     """Find the service class for each of `host`s services and instantiate it.
     Return `host` to facilitate chaining.
@@ -173,11 +309,7 @@ def initialize_services(host, components):
             logger.debug("No service name found, using default: 'Service'")
             service_class_name = "Service"
 
-        service_class = get_service_class_from_loaded_modules(
-            service_class_name)
-        if not service_class:
-            service_class = get_service_class_from_fallbacks(
-                host, service_class_name)
+        service_class = resolve_service_class(host, service_class_name)
 
         service = None
         try:
@@ -194,23 +326,24 @@ def initialize_services(host, components):
     return host
 
 
+def resolve_service_class(host, service_class_name):
+    """Returns the class for services with the "class" setting
+    `service_class_name`.
+    """
+    return (get_service_class_from_loaded_modules(service_class_name) or
+            get_service_class_from_fallbacks(host, service_class_name))
+
+
 def get_service_class_from_loaded_modules(service_class_name):
-    for module_name in sys.modules.keys()[:]:
-        if module_name.startswith("six.moves"):
-            continue  # six.moves is horrible and inspecting it causes a crash
-        try:
-            for classname, service_class in inspect.getmembers(sys.modules[module_name], inspect.isclass):
-                if classname == service_class_name:
-                    return service_class
-        except:
-            pass
-    return None
+    return service_registry.lookup(service_class_name)
 
 
 def get_service_class_from_fallbacks(host, service_class_name):
+    service_class = service_registry.fallbacks.get(service_class_name)
+    if service_class:
+        return service_class
     host.logger.debug(
         '%s not a standard service, searching class' % service_class_name)
-    service_class = None
     try:
         host.logger.debug('fallback 1: checking loaded modules')
         service_class = eval(service_class_name)
@@ -251,6 +384,7 @@ def get_service_class_from_fallbacks(host, service_class_name):
         raise Exception(
             'cannot find class %(service_class)s' % locals())
 
+    service_registry.fallbacks[service_class_name] = service_class
     return service_class
 
 
@@ -289,7 +423,7 @@ def fetch_missing_hosts(ignored, components):
 
 def fetch_missing_services_as_readonly(ignored, components):
     missings = filter_missing_services(components)
-    missing_deferreds = []
+    readonly_services_by_host = {}
     for missing in missings:
         host = components.get("host://%s" % missing.host,
                               yadtshell.components.Host(missing.host))
@@ -298,7 +432,16 @@ def fetch_missing_services_as_readonly(ignored, components):
             host, missing.name)
         readonly_service.needed_by = missing.needed_by
         components[missing.uri] = readonly_service
-        missing_deferreds.append(readonly_service.status())
+        readonly_services_by_host.setdefault(missing.host, []).append(readonly_service)
+
+    missing_deferreds = []
+    for host in sorted(readonly_services_by_host):
+        readonly_services = readonly_services_by_host[host]
+        if len(readonly_services) == 1:
+            missing_deferreds.append(readonly_services[0].status())
+        else:
+            missing_deferreds.extend(
+                yadtshell.components.readonly_services_status(readonly_services))
     return defer.DeferredList(missing_deferreds, consumeErrors=True)
 
 
@@ -310,15 +453,104 @@ def handle_readonly_service_states(results, components):
         logger.debug("Readonly status for %s : %s -> %s" % (uri, success, actual_state))
 
 
-def status(hosts=None, include_artefacts=True, **kwargs):
+def render_partial_info(components, hostnames, nr_hosts_pending):
+    services = []
+    for hostname in hostnames:
+        host = components.get('host://%s' % hostname.split('.')[0])
+        services.extend(getattr(host, 'defined_services', []))
+    set_provisional_dependency_scores(services)
+    print()
+    print('partial status, still waiting for %i host(s):' % nr_hosts_pending)
+    # the graph of a partial status must not be kept with the components,
+    # it would be stored along with the complete status
+    yadtshell._info._render_services_matrix(
+        components, sorted(hostnames), yadtshell._info.calculate_info_view_settings(),
+        graph=DependencyGraph(components))
+
+
+def known_components_outside_of(previous_components, hosts, rescanned_uris):
+    """Returns the components of `previous_components` which are not
+    located on `hosts`, ready to be wired again.
+
+    Readonly services and missing components within `rescanned_uris` are
+    left out, they are looked up again after the hosts answered.
+    """
+    queried = set([hostname.split('.')[0] for hostname in hosts])
+    known_components = {}
+    for uri, component in previous_components.items():
+        if component.host in queried:
+            continue
+        if (uri in rescanned_uris and
+                isinstance(component, (yadtshell.components.ReadonlyService,
+                                       yadtshell.components.MissingComponent))):
+            continue
+        component.needed_by = set()
+        if hasattr(component, 'logger'):
+            component.logger = logging.getLogger(component.uri)
+        known_components[uri] = component
+    return known_components
+
+
+def scoped_status(uris=None, **kwargs):
+    """Queries only the hosts of the components `uris` depend on or which
+    depend on `uris`, and merges their answers into the stored state.
+    A host URI stands for all components on that host.
+
+    Falls back to a full status when there is no fresh stored state or
+    when the scope covers all hosts of the target anyway.
+    """
+    if not uris:
+        return status(**kwargs)
+    try:
+        previous_components = yadtshell.util.restore_current_state()
+    except Exception, e:
+        logger.debug('no stored state to scope the status with: %s' % e)
+        return status(**kwargs)
+
+    affected_hosts = set([yadtshell.uri.parse(uri)['host']
+                          for uri in uris if uri.startswith('host://')])
+    affected = set(uris)
+    for uri, component in previous_components.items():
+        if component.host in affected_hosts:
+            affected.add(uri)
+    closure = dependency_closure(previous_components, affected)
+    scope = set()
+    for uri in closure:
+        component = previous_components.get(uri)
+        if component is not None:
+            scope.add(component.host)
+        else:
+            scope.add(yadtshell.uri.parse(uri)['host'])
+
+    all_hosts = yadtshell.settings.TARGET_SETTINGS['hosts']
+    hosts = [hostname for hostname in all_hosts if hostname.split('.')[0] in scope]
+    if not hosts or len(hosts) == len(all_hosts):
+        return status(**kwargs)
+
+    logger.debug('status scoped to %i of %i hosts: %s' % (
+        len(hosts), len(all_hosts), ', '.join(hosts)))
+    known_components = known_components_outside_of(previous_components, hosts, closure)
+    return status(hosts=hosts, known_components=known_components, **kwargs)
+
+
+def status(hosts=None, include_artefacts=True, known_components=None, max_age=None, **kwargs):
+    """Queries the status of `hosts` (all hosts of the target by default)
+    and stores it. Returns a deferred firing with the new components.
+    """
+    if max_age is not None:
+        return reuse_fresh_snapshots(int(max_age), hosts, **kwargs)
     if type(hosts) is str:
         hosts = [hosts]
 
-    try:
-        os.remove(
-            os.path.join(yadtshell.settings.OUT_DIR, 'current_state.components'))
-    except OSError:
-        pass
+    ignored_hosts = IgnoredHostsSnapshot(
+        yadtshell.settings.ybc, yadtshell.settings.TARGET_SETTINGS.get('name'))
+    ignored_hosts.fetch()
+
+    for state_filename in [STATE_STORE_FILENAME, STATE_JOURNAL_FILENAME, LEGACY_STATE_FILENAME]:
+        try:
+            os.remove(os.path.join(yadtshell.settings.OUT_DIR, state_filename))
+        except OSError:
+            pass
 
     if hosts:
         state_files = [os.path.join(yadtshell.settings.OUT_DIR, 'current_state_%s.yaml' % h)
@@ -340,6 +572,8 @@ def status(hosts=None, include_artefacts=True, **kwargs):
         hosts = yadtshell.settings.TARGET_SETTINGS['hosts']
 
     components = yadtshell.components.ComponentDict()
+    if known_components:
+        components.update(known_components)
 
     def store_service_up(protocol):
         protocol.component.state = yadtshell.settings.UP
@@ -406,41 +640,25 @@ def status(hosts=None, include_artefacts=True, **kwargs):
         if not all_ok:
             raise Exception('errors occured during status')
 
-    def build_unified_dependencies_tree(ignored):
-        logger.debug('building unified dependencies tree')
-
-        components._add_when_missing_ = True
-        logger.debug('wiring components')
-        for component in components.values():
-            needs_with_resolved_version_alias = set([])
-            for needed in getattr(component, 'needs', []):
-                try:
-                    needed_component = components[needed]
-                    if not hasattr(needed_component, 'needed_by'):
-                        needed_component.needed_by = set()
-                    needed_component.needed_by.add(component.uri)
-                    needs_with_resolved_version_alias.add(needed_component.uri)
-                except (KeyError, AttributeError), e:
-                    logger.debug('needed: ' + needed)
-                    raise e
-
-            component.needs = needs_with_resolved_version_alias
-        components._add_when_missing_ = False
+    score_cache = DependencyScoreCache.load()
+    tree = DependencyTreeBuilder(components, score_cache)
 
-        for component in components.values():
-            for dependent in getattr(component, 'needed_by', []):
-                try:
-                    dependent_component = components[dependent]
-                    dependent_component.needs.add(component.uri)
-                except KeyError, ke:
-                    logger.warning("unknown dependent key " + str(ke))
-
-        compute_dependency_scores(components)
+    def build_unified_dependencies_tree(ignored):
+        tree.finish()
 
     def store_status_locally(ignored, components):
+        scheduler.history.save()
+        host_cache.save()
+        score_cache.save()
+
+        now = time.time()
         for component in components.values():
             if hasattr(component, "logger"):
                 component.logger = None
+            if getattr(component, 'status_time', None) is None:
+                component.status_time = now
+                component.status_snapshot = None
+            component.status_age = now - component.status_time
 
         def _open_component_file(component_type):
             return open(os.path.join(yadtshell.settings.OUT_DIR, component_type), 'w')
@@ -456,9 +674,7 @@ def status(hosts=None, include_artefacts=True, **kwargs):
         for f in component_files.values():
             f.close()
 
-        f = _open_component_file('current_state.components')
-        pickle.dump(components, f, pickle.HIGHEST_PROTOCOL)
-        f.close()
+        yadtshell.util.store_current_state(components)
 
         groups = []
         he = HostExpander()
@@ -519,20 +735,45 @@ def status(hosts=None, include_artefacts=True, **kwargs):
 
     pi = yadtshell.twisted.ProgressIndicator()
 
-    def query_and_initialize_host(hostname):
-        deferred = query_status(hostname, components, pi)
-        deferred.addCallbacks(callback=create_host,
-                              callbackArgs=[components],
+    he = HostExpander()
+    host_groups = HostGroupTracker(
+        [he.expand(grouped_hosts)
+         for grouped_hosts in yadtshell.settings.TARGET_SETTINGS.get('original_hosts', [])])
+    nr_hosts_pending = [len(hosts)]
+
+    def render_finished_host_groups(host):
+        nr_hosts_pending[0] -= 1
+        for group in host_groups.host_finished(host):
+            if nr_hosts_pending[0]:
+                render_partial_info(components, group, nr_hosts_pending[0])
+        return host
+
+    host_cache = HostCache.load()
+    scheduler = StatusScheduler(
+        lambda hostname: query_status(hostname, components, pi, ignored_hosts,
+                                      host_cache.status_hash(hostname)),
+        history=StatusHistory.load(),
+        max_in_flight=yadtshell.settings.TARGET_SETTINGS.get(
+            'status_max_in_flight', STATUS_MAX_IN_FLIGHT_DEFAULT),
+        deadline=yadtshell.settings.TARGET_SETTINGS.get(
+            'status_deadline', STATUS_DEADLINE_DEFAULT),
+        hedging=yadtshell.settings.TARGET_SETTINGS.get(
+            'status_hedging', False))
+
+    def initialize_host(deferred):
+        deferred.addCallbacks(callback=create_host_with_components,
+                              callbackArgs=[components, host_cache],
                               errback=handle_failing_status,
                               errbackArgs=[components, kwargs.get("ignore_unreachable_hosts")])
 
-        deferred.addCallback(initialize_services, components)
+        deferred.addCallback(record_snapshot, components, host_cache)
         deferred.addCallback(add_local_state)
-        deferred.addCallback(initialize_artefacts, components)
+        deferred.addCallback(tree.add_host)
+        deferred.addCallback(render_finished_host_groups)
         deferred.addErrback(yadtshell.twisted.report_error, logger.error)
         return deferred
 
-    deferreds = [query_and_initialize_host(host) for host in hosts]
+    deferreds = [initialize_host(d) for d in scheduler.schedule(hosts)]
     reactor.callLater(10, show_still_pending, deferreds)
 
     dl = defer.DeferredList(deferreds)
@@ -544,6 +785,7 @@ def status(hosts=None, include_artefacts=True, **kwargs):
     dl.addCallback(handle_readonly_service_states, components)
     dl.addCallback(store_status_locally, components)
     dl.addCallback(yadtshell.info, components=components)
+    dl.addCallback(lambda ignored: components)
     dl.addErrback(yadtshell.twisted.report_error,
                   logger.error, include_stacktrace=False)
 
@@ -0,0 +1,303 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+
+import logging
+import math
+import os.path
+
+from twisted.internet import defer, reactor
+from twisted.python.failure import Failure
+
+import yadtshell.settings
+from yadtshell.constants import (STATUS_HEDGE_MIN_SAMPLES,
+                                 STATUS_HISTORY_SIZE,
+                                 STATUS_INITIAL_IN_FLIGHT,
+                                 STATUS_MAX_IN_FLIGHT_DEFAULT,
+                                 STATUS_MIN_IN_FLIGHT,
+                                 STATUS_LATENCY_CONGESTION_FACTOR)
+
+logger = logging.getLogger('status_scheduler')
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+SSH_EXIT_CODE_UNREACHABLE = 255
+
+
+class StatusDeadlineExceeded(Exception):
+
+    def __init__(self, component, deadline):
+        Exception.__init__(self, 'no status answer within %s seconds' % deadline)
+        self.component = component
+        self.deadline = deadline
+        self.exitCode = None
+
+
+def status_history_file():
+    return os.path.join(yadtshell.settings.OUT_DIR, 'status_history')
+
+
+class StatusHistory(object):
+
+    """Remembers the latest status query latencies (in seconds) per host."""
+
+    def __init__(self, latencies=None):
+        self.latencies = latencies or {}
+
+    @classmethod
+    def load(cls, filename=None):
+        filename = filename or status_history_file()
+        try:
+            with open(filename) as f:
+                return cls(pickle.load(f))
+        except Exception as e:
+            logger.debug('no status history available: %s' % e)
+            return cls()
+
+    def save(self, filename=None):
+        filename = filename or status_history_file()
+        try:
+            with open(filename, 'w') as f:
+                pickle.dump(self.latencies, f, pickle.HIGHEST_PROTOCOL)
+        except (IOError, OSError) as e:
+            logger.debug('cannot store status history: %s' % e)
+
+    def record(self, hostname, latency):
+        latencies = self.latencies.setdefault(hostname, [])
+        latencies.append(latency)
+        del latencies[:-STATUS_HISTORY_SIZE]
+
+    def estimate(self, hostname):
+        latencies = self.latencies.get(hostname)
+        if not latencies:
+            return None
+        return sum(latencies) / len(latencies)
+
+    def percentile(self, hostname, percent, min_samples=STATUS_HEDGE_MIN_SAMPLES):
+        """Returns the latency below which `percent` of the recorded queries
+        of `hostname` answered, or None if there are not enough samples.
+        """
+        latencies = sorted(self.latencies.get(hostname, []))
+        if len(latencies) < max(min_samples, 1):
+            return None
+        rank = int(math.ceil(len(latencies) * percent / 100.0))
+        return latencies[max(rank, 1) - 1]
+
+    def slowest_first(self, hostnames):
+        """Returns `hostnames` ordered by descending expected latency.
+        Hosts without history are considered slowest, the relative order
+        of hosts with equal estimates is kept.
+        """
+        def expected_latency(hostname):
+            estimate = self.estimate(hostname)
+            if estimate is None:
+                return float('inf')
+            return estimate
+        return sorted(hostnames, key=expected_latency, reverse=True)
+
+
+class StatusScheduler(object):
+
+    """Limits the number of status queries in flight.
+
+    The limit is a congestion window that is adapted with AIMD: each clean
+    answer widens the window by 1/window slots, i.e. by one slot per round
+    of answers, an unreachable host (ssh exit code 255) or an answer much
+    slower than the host's history halves it. At most one decrease happens
+    per round of queries, so a burst of failures caused by the same
+    overload does not collapse the window. Hosts missing the deadline leave
+    the window unchanged.
+    """
+
+    def __init__(self, query_fun, history=None,
+                 max_in_flight=STATUS_MAX_IN_FLIGHT_DEFAULT,
+                 min_in_flight=STATUS_MIN_IN_FLIGHT,
+                 initial_in_flight=STATUS_INITIAL_IN_FLIGHT,
+                 deadline=None, hedging=False, clock=reactor):
+        self.query_fun = query_fun
+        self.deadline = deadline
+        self.hedging = hedging
+        self.history = history if history is not None else StatusHistory()
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self.min_in_flight = max(min(int(min_in_flight), self.max_in_flight), 1)
+        self.window = float(min(max(initial_in_flight, self.min_in_flight), self.max_in_flight))
+        self.clock = clock
+        self.in_flight = 0
+        self.waiting = []
+        self.nr_dispatched = 0
+        self.last_decrease = 0
+
+    def schedule(self, hostnames):
+        """Returns one deferred per host (in the order of `hostnames`) which
+        fires with the result of `query_fun(hostname)` once it was run.
+        """
+        deferreds = {}
+        for hostname in self.history.slowest_first(hostnames):
+            deferred = defer.Deferred()
+            deferred.name = hostname
+            deferreds[hostname] = deferred
+            self.waiting.append((hostname, deferred))
+        self._dispatch()
+        return [deferreds[hostname] for hostname in hostnames]
+
+    def _dispatch(self):
+        while self.waiting and self.in_flight < int(self.window):
+            hostname, deferred = self.waiting.pop(0)
+            self._start(hostname, deferred)
+
+    def _start(self, hostname, deferred):
+        self.in_flight += 1
+        self.nr_dispatched += 1
+        logger.debug('querying %s (%i in flight, window %.1f)' %
+                     (hostname, self.in_flight, self.window))
+        hedge_after = None
+        if self.hedging:
+            hedge_after = self.history.percentile(hostname, 95)
+        query = RacingQuery(self.query_fun, hostname, hedge_after, self.deadline, self.clock,
+                            acquire_hedge=self._acquire_hedge).deferred
+        query.addBoth(self._finished, hostname, self.clock.seconds(), self.nr_dispatched)
+        query.chainDeferred(deferred)
+
+    def _acquire_hedge(self):
+        """Takes a slot of the window for a hedged query. Returns the
+        function releasing it, or None when the window is full.
+        """
+        if self.in_flight >= int(self.window):
+            return None
+        self.in_flight += 1
+        return self._release_hedge
+
+    def _release_hedge(self, result):
+        self.in_flight -= 1
+        self._dispatch()
+        return result
+
+    def _finished(self, result, hostname, started, dispatch_nr):
+        self.in_flight -= 1
+        latency = self.clock.seconds() - started
+        if _is_overdue(result):
+            logger.debug('%s is overdue, keeping window at %.1f' % (hostname, self.window))
+        elif self._is_congested(result, hostname, latency):
+            self._decrease(dispatch_nr)
+        else:
+            self.window = min(self.window + 1.0 / self.window, self.max_in_flight)
+        if not _is_unreachable(result) and not _is_overdue(result):
+            self.history.record(hostname, latency)
+        self._dispatch()
+        return result
+
+    def _is_congested(self, result, hostname, latency):
+        if _is_unreachable(result):
+            return True
+        expected = self.history.estimate(hostname)
+        return expected is not None and latency > expected * STATUS_LATENCY_CONGESTION_FACTOR
+
+    def _decrease(self, dispatch_nr):
+        if dispatch_nr <= self.last_decrease:
+            return
+        self.window = max(self.window / 2, self.min_in_flight)
+        self.last_decrease = self.nr_dispatched
+        logger.debug('congestion detected, shrinking window to %.1f' % self.window)
+
+
+class RacingQuery(object):
+
+    """Queries one host and fires `deferred` with the first answer.
+
+    If there is no answer after `hedge_after` seconds, a second (hedged)
+    query is started, whichever answers first wins and the other one is
+    cancelled. A failed query only counts when no other query for the host
+    is still running. After `deadline` seconds all queries are cancelled and
+    `deferred` fails with StatusDeadlineExceeded.
+
+    `acquire_hedge()` is asked for a slot before hedging. It returns the
+    function to call with the result of the hedged query once it finished
+    or was cancelled, or None when no query may be started now.
+    """
+
+    def __init__(self, query_fun, hostname, hedge_after=None, deadline=None, clock=reactor,
+                 acquire_hedge=None):
+        self.query_fun = query_fun
+        self.hostname = hostname
+        self.acquire_hedge = acquire_hedge
+        self.deferred = defer.Deferred()
+        self.settled = False
+        self.queries = []
+        self.timers = []
+        self._launch()
+        if hedge_after is not None and not self.settled:
+            self.timers.append(clock.callLater(hedge_after, self._hedge))
+        if deadline is not None and not self.settled:
+            self.timers.append(clock.callLater(deadline, self._expire, deadline))
+
+    def _launch(self, release=None):
+        query = defer.maybeDeferred(self.query_fun, self.hostname)
+        self.queries.append(query)
+        query.addBoth(self._answered)
+        if release is not None:
+            query.addBoth(release)
+
+    def _hedge(self):
+        release = None
+        if self.acquire_hedge is not None:
+            release = self.acquire_hedge()
+            if release is None:
+                logger.debug('%s is slower than usual, but no query slot is free' % self.hostname)
+                return
+        logger.info('%s is slower than usual, sending a hedged status query' % self.hostname)
+        self._launch(release)
+
+    def _expire(self, deadline):
+        logger.warning('%s did not answer within %s seconds' % (self.hostname, deadline))
+        self._settle(Failure(StatusDeadlineExceeded(self.hostname, deadline)))
+
+    def _answered(self, result):
+        if self.settled:
+            return None
+        still_running = [query for query in self.queries if not query.called]
+        if isinstance(result, Failure) and still_running:
+            logger.debug('%s: %s, still waiting for another query' %
+                         (self.hostname, result.getErrorMessage()))
+            return None
+        self._settle(result)
+
+    def _settle(self, result):
+        self.settled = True
+        for timer in self.timers:
+            if timer.active():
+                timer.cancel()
+        for query in self.queries:
+            if not query.called:
+                query.cancel()
+        if isinstance(result, Failure):
+            self.deferred.errback(result)
+        else:
+            self.deferred.callback(result)
+
+
+def _is_overdue(result):
+    return isinstance(result, Failure) and result.check(StatusDeadlineExceeded)
+
+
+def _is_unreachable(result):
+    return (isinstance(result, Failure) and
+            getattr(result.value, 'exitCode', None) == SSH_EXIT_CODE_UNREACHABLE)
@@ -0,0 +1,264 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+#   YADT - an Augmented Deployment Tool
+#   Copyright (C) 2010-2015  Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Resident status daemon.
+
+`yadtshell statusd` keeps the wired components of a target in memory, keeps
+the ssh control masters to its hosts open and answers the requests of other
+yadtshell calls in the same target directory over a Unix socket.
+
+A request is a single line of JSON
+
+    {"request": "<name>", "arguments": {...}}
+
+and is answered with a JSON object before the daemon closes the connection.
+Answers carrying an "error" make the client fall back to doing the work
+itself, exactly as if no daemon was running.
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import logging
+import os
+import socket
+import sys
+import time
+from StringIO import StringIO
+
+import simplejson as json
+from twisted.internet import defer, protocol, reactor, task
+from twisted.protocols.basic import LineOnlyReceiver
+from twisted.python.failure import Failure
+
+import yadtshell
+from yadtshell.constants import (STATUSD_REQUEST_TIMEOUT,
+                                 STATUSD_SSH_KEEPALIVE_INTERVAL)
+from yadtshell.service_registry import registry as service_registry
+from yadtshell.state_store import state_journal_file
+
+logger = logging.getLogger('statusd')
+
+
+def socket_path():
+    """Returns the socket of the daemon serving the target in the current
+    directory. The socket lives in the output directory, named after a
+    digest of the target directory since Unix socket paths are short.
+    """
+    digest = hashlib.sha1(yadtshell.settings.OUT_DIR).hexdigest()[:12]
+    return os.path.join(yadtshell.settings.OUTPUT_DIR, 'statusd-%s.sock' % digest)
+
+
+def target_mtime():
+    try:
+        return os.path.getmtime('target')
+    except OSError:
+        return None
+
+
+def request(name, timeout=STATUSD_REQUEST_TIMEOUT, **arguments):
+    """Sends the request `name` to the daemon of the current target and
+    returns its answer, or None when no daemon can answer it.
+    """
+    path = socket_path()
+    if not os.path.exists(path):
+        return None
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    chunks = []
+    try:
+        client.connect(path)
+        client.sendall(json.dumps({'request': name, 'arguments': arguments}) + '\r\n')
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    except socket.error as e:
+        logger.debug('statusd not available: %s' % e)
+        return None
+    finally:
+        client.close()
+
+    try:
+        answer = json.loads(''.join(chunks))
+    except ValueError:
+        logger.debug('statusd sent an invalid answer')
+        return None
+    if 'error' in answer:
+        logger.debug('statusd cannot answer %s: %s' % (name, answer['error']))
+        return None
+    return answer
+
+
+def capture_output(fun, *args, **kwargs):
+    """Returns what `fun` prints."""
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        fun(*args, **kwargs)
+        return sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+
+
+class StatusDaemon(object):
+
+    """Answers requests using the components of the latest status, which
+    are reloaded only when another status stored a newer state or an
+    action journaled state changes.
+    """
+
+    def __init__(self):
+        self.components = None
+        self.state_mtime = None
+        self.target_mtime = target_mtime()
+        self.started_on = time.time()
+        self.pending_status = None
+        self.pending_arguments = None
+
+    def current_components(self):
+        try:
+            state_mtime = os.path.getmtime(yadtshell.util.current_state())
+        except OSError:
+            return None
+        journal_filename = state_journal_file()
+        if os.path.exists(journal_filename):
+            state_mtime = (state_mtime, os.path.getmtime(journal_filename))
+        if state_mtime != self.state_mtime:
+            logger.debug('loading current state')
+            self.components = yadtshell.util.restore_current_state(must_be_fresh=False)
+            self.state_mtime = state_mtime
+        return self.components
+
+    def handle(self, name, arguments):
+        if target_mtime() != self.target_mtime:
+            return defer.succeed({'error': 'target file changed, statusd needs a restart'})
+        handler = getattr(self, 'request_%s' % name, None)
+        if handler is None:
+            return defer.succeed({'error': 'unknown request %s' % name})
+        deferred = defer.maybeDeferred(handler, **arguments)
+        deferred.addErrback(lambda failure: {'error': failure.getErrorMessage()})
+        return deferred
+
+    def request_ping(self):
+        return {'pid': os.getpid(), 'uptime': time.time() - self.started_on}
+
+    def request_info(self, **kwargs):
+        components = self.current_components()
+        if not components:
+            return {'error': 'no status available'}
+        return {'output': capture_output(yadtshell.info, components=components, **kwargs)}
+
+    def request_dump(self, **kwargs):
+        components = self.current_components()
+        if not components:
+            return {'error': 'no status available'}
+        return {'output': capture_output(yadtshell.dump, components=components, **kwargs)}
+
+    def request_status(self, hosts=None, **kwargs):
+        """Runs a status within the daemon. Like every status command, it
+        ignores unreachable hosts. Requests arriving while a status is
+        running wait for that one instead of starting another, unless they
+        ask for another status.
+        """
+        waiting = defer.Deferred()
+        arguments = dict(kwargs, hosts=hosts or None, ignore_unreachable_hosts=True)
+        if self.pending_status is not None:
+            if arguments != self.pending_arguments:
+                return {'error': 'another status is running'}
+            self.pending_status.append(waiting)
+            return waiting
+        self.pending_status = [waiting]
+        self.pending_arguments = arguments
+        service_registry.invalidate_if_plugins_changed()
+        deferred = yadtshell.status(**arguments)
+        deferred.addBoth(self._status_finished)
+        return waiting
+
+    def _status_finished(self, result):
+        waiting, self.pending_status = self.pending_status, None
+        self.pending_arguments = None
+        if isinstance(result, Failure):
+            answer = {'error': 'status failed: %s' % result.getErrorMessage()}
+        else:
+            answer = self.request_info()
+        for deferred in waiting:
+            deferred.callback(answer)
+
+
+class StatusdProtocol(LineOnlyReceiver):
+
+    def lineReceived(self, line):
+        try:
+            message = json.loads(line)
+            name, arguments = message['request'], message.get('arguments', {})
+            arguments = dict((str(key), value) for key, value in arguments.items())
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self.answer({'error': 'invalid request'})
+            return
+        logger.debug('request %s %s' % (name, arguments))
+        self.factory.daemon.handle(name, arguments).addCallback(self.answer)
+
+    def answer(self, result):
+        self.transport.write(json.dumps(result))
+        self.transport.loseConnection()
+
+
+class StatusdFactory(protocol.ServerFactory):
+
+    protocol = StatusdProtocol
+
+    def __init__(self, daemon):
+        self.daemon = daemon
+
+
+def remove_socket(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def keep_ssh_multiplexed():
+    deferred = yadtshell.util.start_ssh_multiplexed()
+    deferred.addErrback(yadtshell.twisted.report_error, logger.warning)
+    return deferred
+
+
+def serve():
+    """Runs the daemon for the target in the current directory until it
+    gets terminated.
+    """
+    path = socket_path()
+    if request('ping') is not None:
+        logger.error('statusd already running on %s' % path)
+        return 1
+    remove_socket(path)
+
+    daemon = StatusDaemon()
+    daemon.current_components()
+    reactor.listenUNIX(path, StatusdFactory(daemon), mode=0600)
+    reactor.addSystemEventTrigger('after', 'shutdown', remove_socket, path)
+    task.LoopingCall(keep_ssh_multiplexed).start(STATUSD_SSH_KEEPALIVE_INTERVAL)
+
+    logger.info('statusd serving %s on %s' % (
+        yadtshell.settings.TARGET_SETTINGS['name'], path))
+    reactor.run()
+    return 0
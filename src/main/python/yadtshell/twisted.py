@@ -16,7 +16,7 @@
 
 from __future__ import (absolute_import, print_function)
 
-from twisted.internet import protocol, reactor, defer
+from twisted.internet import protocol, reactor, defer, error
 import twisted.python.failure as failure
 
 import sys
@@ -93,7 +93,7 @@ class ProgressIndicator(object):
 class YadtProcessProtocol(protocol.ProcessProtocol):
     def __init__(self, component, cmd, pi=None, out_log_level=logging.DEBUG,
                  err_log_level=logging.WARN, log_prefix='', wait_for_io=True):
-        self.deferred = defer.Deferred()
+        self.deferred = defer.Deferred(canceller=self.kill)
         try:
             self.component = component.encode('ascii')
         except AttributeError:
@@ -146,10 +146,22 @@ class YadtProcessProtocol(protocol.ProcessProtocol):
         if self.wait_for_io:
             self.finish(reason)
 
+    def kill(self, deferred=None):
+        transport = getattr(self, 'transport', None)
+        if not transport:
+            return
+        self.logger.debug('killing %s@%s' % (self.cmd, self.component))
+        try:
+            transport.signalProcess('KILL')
+        except (error.ProcessExitedAlready, OSError):
+            pass
+
     def finish(self, reason):
         self.exitcode = reason.value.exitCode
         if self.pi:
             self.pi.update((self.cmd, self.component), str(self.exitcode))
+        if self.deferred.called:
+            return
         if reason.value.exitCode == 0:
             self.deferred.callback(self)
         else:
@@ -19,32 +19,35 @@
 import logging
 
 import yadtshell
+from yadtshell.dependency_graph import dependency_graph
 from yadtshell.util import log_exceptions
 
 logger = logging.getLogger('update')
 
 
 def get_all_adjacent_needed_hosts(service_uri, components):
+    graph = dependency_graph(components)
     result = set()
-    service = components[service_uri]
-    for needed_uri in service.needs:
-        needed = components[needed_uri]
-        if needed.type == 'host':
-            result.add(needed.uri)
+    for needed in graph.needs(graph.node(service_uri)):
+        if graph.types[needed] == yadtshell.settings.HOST:
+            result.add(graph.uris[needed])
             continue
-        if needed.type == 'service':
-            result.add(needed.host_uri)
+        if graph.types[needed] == yadtshell.settings.SERVICE:
+            result.add(graph.host_uris[needed])
     return result
 
 
 @log_exceptions(logger)
-def compare_versions(protocol=None, hosts=None, update_plan_post_handler=None, parallel=None, **kwargs):
-    components = yadtshell.util.restore_current_state()
+def compare_versions(protocol=None, hosts=None, update_plan_post_handler=None, parallel=None,
+                     components=None, **kwargs):
+    if components is None:
+        components = yadtshell.util.restore_current_state()
     if not update_plan_post_handler:
         update_plan_post_handler = yadtshell.metalogic.chop_minimal_related_chunks
 
-    all_hosts = set(
-        [c for c in components.values() if isinstance(c, yadtshell.components.Host)])
+    graph = dependency_graph(components)
+    all_hosts = set([c for c in graph.components_of(components, graph.nodes_of_type(yadtshell.settings.HOST))
+                     if isinstance(c, yadtshell.components.Host)])
 
     if hosts:
         handled_hosts = yadtshell.helper.expand_hosts(hosts)
@@ -70,10 +73,10 @@ def compare_versions(protocol=None, hosts=None, update_plan_post_handler=None, p
     else:
         logger.info('No hosts with pending updates.')
 
+    artefacts = graph.components_of(components, graph.nodes_of_type(yadtshell.settings.ARTEFACT))
     next_artefacts = set([artefact.uri
-                         for artefact in components.values()
-                         if artefact.type == yadtshell.settings.ARTEFACT and
-                         artefact.revision == yadtshell.settings.NEXT and
+                         for artefact in artefacts
+                         if artefact.revision == yadtshell.settings.NEXT and
                          artefact.host_uri in handled_hosts
                           ])
 
@@ -97,7 +100,8 @@ def compare_versions(protocol=None, hosts=None, update_plan_post_handler=None, p
     logger.debug('diff: ' + ', '.join(diff))
 
     stop_plan = yadtshell.metalogic.metalogic(
-        yadtshell.settings.STOP, diff, plan_post_handler=yadtshell.metalogic.identity)
+        yadtshell.settings.STOP, diff, plan_post_handler=yadtshell.metalogic.identity,
+        components=components)
     stopped_services = set()
     for action in stop_plan.actions:
         stopped_services.add(action.uri)
@@ -112,10 +116,12 @@ def compare_versions(protocol=None, hosts=None, update_plan_post_handler=None, p
         is_a_stopped_service = service.uri in stopped_services
         return is_on_a_handled_host or is_a_stopped_service
 
-    all_handled_services = set([s.uri for s in components.values() if is_a_handled_service(s)])
+    services = graph.components_of(components, graph.nodes_of_type(yadtshell.settings.SERVICE))
+    all_handled_services = set([s.uri for s in services if is_a_handled_service(s)])
 
     start_plan = yadtshell.metalogic.metalogic(
-        yadtshell.settings.START, all_handled_services, plan_post_handler=yadtshell.metalogic.identity)
+        yadtshell.settings.START, all_handled_services, plan_post_handler=yadtshell.metalogic.identity,
+        components=components)
 
     if not diff:
         yadtshell.util.dump_action_plan('update', start_plan)
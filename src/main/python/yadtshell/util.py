@@ -29,6 +29,10 @@ from twisted.internet import defer, reactor
 
 import yadtshell.settings
 import yadtshell.components
+from yadtshell.state_store import (StateStore,
+                                   StateJournal,
+                                   migrate_legacy_state,
+                                   state_store_file)
 from yadtshell.constants import (STANDALONE_SERVICE_RANK,
                                  MAX_ALLOWED_AGE_OF_STATE_IN_SECONDS)
 from yadtshell.service_validation import ServiceDefinitionValidator
@@ -83,7 +87,7 @@ def dump_action_plan(flavor, plan):
 
 
 def current_state():
-    return os.path.join(yadtshell.settings.OUT_DIR, 'current_state.components')
+    return state_store_file()
 
 
 def get_age_of_current_state_in_seconds():
@@ -91,13 +95,42 @@ def get_age_of_current_state_in_seconds():
     return age_of_state
 
 
-def restore_current_state(must_be_fresh=True):
-    deserialized_state = restore(current_state())
+def current_state_store():
+    store = StateStore(current_state())
+    migrate_legacy_state(store)
+    return store
+
+
+def store_current_state(components):
+    """Stores `components` as the current state, which supersedes the
+    changes journaled so far.
+    """
+    StateStore(current_state()).save(components)
+    StateJournal().clear()
+
+
+def restore_current_state(must_be_fresh=True, hosts=None):
+    """Returns the components of the stored state, only those located on
+    `hosts` when given, including the changes journaled since.
+    """
+    deserialized_state = StateJournal().replay(current_state_store().load(hosts))
     if get_age_of_current_state_in_seconds() >= MAX_ALLOWED_AGE_OF_STATE_IN_SECONDS and must_be_fresh:
         raise IOError("Serialized state is too old")
     return deserialized_state
 
 
+def get_age_of_status_in_seconds(components):
+    """Returns the age of the oldest host status within `components`, but
+    at least the age of the stored state.
+    """
+    age_of_status = get_age_of_current_state_in_seconds()
+    status_times = [component.status_time for component in components.values()
+                    if isinstance(getattr(component, 'status_time', None), float)]
+    if status_times:
+        age_of_status = max(age_of_status, time.time() - min(status_times))
+    return age_of_status
+
+
 def get_mtime_of_current_state():
     return os.path.getmtime(current_state())
 
@@ -230,9 +263,13 @@ def stop_ssh_multiplexed(ignored, hosts=None):
     return dl
 
 
+def is_on_same_host(service, uri):
+    return 'service://%s' % service.host in uri
+
+
 def inbound_deps_on_same_host(service, components):
     inbound_services = [
-        s for s in service.needed_by if 'service://%s' % service.host in s]
+        s for s in service.needed_by if is_on_same_host(service, s)]
     for dependent_service in service.needed_by:
         inbound_services.extend(
             inbound_deps_on_same_host(components[dependent_service], components))
@@ -241,14 +278,51 @@ def inbound_deps_on_same_host(service, components):
 
 def outbound_deps_on_same_host(service, components):
     needed_services = [
-        s for s in service.needs if 'service://%s' % service.host in s]
+        s for s in service.needs if is_on_same_host(service, s)]
     outbound_services = needed_services
-    for needed_service in [s for s in service.needs if 'service://%s' % service.host in s]:
+    for needed_service in [s for s in service.needs if is_on_same_host(service, s)]:
         outbound_services.extend(
             outbound_deps_on_same_host(components[needed_service], components))
     return outbound_services
 
 
+def count_deps_recursively(component, components, edges, memo):
+    """Returns len(inbound_deps_on_same_host(...)) or
+    len(outbound_deps_on_same_host(...)) of `component`, depending on
+    `edges`, without building the lists.
+
+    `edges(component)` returns the number of dependencies the component
+    itself lists and the uris the listing recurses into. The counts of all
+    components visited are kept in `memo`, so every component is counted
+    once, no matter how many paths lead to it.
+    """
+    index = {}
+    stack = [(component.uri, component)]
+    while stack:
+        uri, current = stack[-1]
+        if uri in memo:
+            stack.pop()
+            continue
+        if uri not in index:
+            index[uri] = edges(current or components[uri])
+            stack.extend((next_uri, None) for next_uri in index[uri][1] if next_uri not in memo)
+            continue
+        stack.pop()
+        nr_direct, next_uris = index.pop(uri)
+        memo[uri] = nr_direct + sum(memo[next_uri] for next_uri in next_uris)
+    return memo[component.uri]
+
+
+def inbound_edges(component):
+    needed_by = list(component.needed_by)
+    return len([s for s in needed_by if is_on_same_host(component, s)]), needed_by
+
+
+def outbound_edges(component):
+    needs = [s for s in component.needs if is_on_same_host(component, s)]
+    return len(needs), needs
+
+
 def compute_dependency_scores(components):
     servicedefs = dict((component.uri, component)
                        for component in components.values() if isinstance(component, yadtshell.components.Service))
@@ -257,14 +331,14 @@ def compute_dependency_scores(components):
     t = ServiceDefinitionValidator(servicedefs)
     t.assert_no_cycles_present()
 
+    nr_inbound, nr_outbound = {}, {}
     for service, servicedef in servicedefs.iteritems():
-        outbound_edges = len(
-            outbound_deps_on_same_host(servicedef, components))
-        inbound_edges = len(inbound_deps_on_same_host(servicedef, components))
-        if outbound_edges == inbound_edges == 0:
+        outbound = count_deps_recursively(servicedef, components, outbound_edges, nr_outbound)
+        inbound = count_deps_recursively(servicedef, components, inbound_edges, nr_inbound)
+        if outbound == inbound == 0:
             servicedef.dependency_score = STANDALONE_SERVICE_RANK
         else:
-            servicedef.dependency_score = inbound_edges - outbound_edges
+            servicedef.dependency_score = inbound - outbound
 
 
 def calculate_max_tries_for_interval_and_delay(interval, delay):
@@ -5,8 +5,11 @@ from mock import MagicMock, Mock, patch
 import yadtshell
 
 from yadtshell.actionmanager import (ActionManager,
+                                     FlatReadyQueue,
+                                     ReadyQueue,
                                      _user_should_acknowledge_plan,
                                      remove_harmless_actions)
+from yadtshell.flat_plan import FlatPlan
 
 
 class ActionManagerTestBase(TestCase):
@@ -100,23 +103,168 @@ class ActionManagerHelperFunctionsTest(ActionManagerTestBase):
 
     def test_next_with_preconditions_actionplan(self):
         task1 = ActionManager.Task(None, Mock(yadtshell.actions.ActionPlan))
-        task2 = ActionManager.Task(None, Mock())
-        queue = [task1, task2]
+        task2 = ActionManager.Task(None, yadtshell.actions.Action('stop', 'service://foo/bar'))
+        queue = ReadyQueue([task1, task2], {})
         result = self.am.next_with_preconditions(queue)
         self.assertEqual(result, task1)
 
     def test_next_with_preconditions_actions(self):
-        self.am.components = Mock()
-        task1 = ActionManager.Task(None, Mock())
-        task2 = ActionManager.Task(None, Mock())
+        task1 = ActionManager.Task(None, yadtshell.actions.Action('stop', 'service://foo/bar'))
+        task2 = ActionManager.Task(None, yadtshell.actions.Action('stop', 'service://foo/baz'))
         task1.action.state = yadtshell.actions.State.RUNNING
-        task2.action.state = yadtshell.actions.State.PENDING
-        task2.action.are_all_preconditions_met.return_value = True
-        queue = [task1, task2]
+        queue = ReadyQueue([task1, task2], {})
         result = self.am.next_with_preconditions(queue)
         self.assertEqual(result, task2)
 
 
+def create_task(uri, preconditions=None):
+    action = yadtshell.actions.Action('start', uri, 'state', 'up', preconditions=preconditions)
+    return ActionManager.Task(None, action)
+
+
+class ReadyQueueTests(TestCase):
+
+    def setUp(self):
+        self.components = {'service://foo/a': Mock(state='down'),
+                           'service://foo/b': Mock(state='down')}
+        self.a_is_up = yadtshell.actions.TargetState('service://foo/a', 'state', 'up')
+        self.b_is_up = yadtshell.actions.TargetState('service://foo/b', 'state', 'up')
+
+    def test_should_hand_out_tasks_without_preconditions_in_order(self):
+        tasks = [create_task('service://foo/a'), create_task('service://foo/b')]
+        queue = ReadyQueue(tasks, self.components)
+
+        self.assertEqual(queue.pop_ready(), tasks[0])
+        self.assertEqual(queue.pop_ready(), tasks[1])
+        self.assertEqual(queue.pop_ready(), None)
+        self.assertFalse(queue)
+
+    def test_should_hold_back_tasks_until_all_preconditions_are_met(self):
+        waiting = create_task('service://foo/c', set([self.a_is_up, self.b_is_up]))
+        queue = ReadyQueue([waiting], self.components)
+
+        self.assertEqual(queue.pop_ready(), None)
+        self.components['service://foo/a'].state = 'up'
+        queue.changed('service://foo/a', 'state')
+        self.assertEqual(queue.pop_ready(), None)
+        self.components['service://foo/b'].state = 'up'
+        queue.changed('service://foo/b', 'state')
+
+        self.assertEqual(queue.pop_ready(), waiting)
+        self.assertEqual(len(queue), 0)
+
+    def test_should_hold_back_task_again_when_precondition_is_lost(self):
+        self.components['service://foo/a'].state = 'up'
+        waiting = create_task('service://foo/c', set([self.a_is_up, self.b_is_up]))
+        queue = ReadyQueue([waiting], self.components)
+
+        self.components['service://foo/a'].state = 'down'
+        queue.changed('service://foo/a', 'state')
+        self.components['service://foo/b'].state = 'up'
+        queue.changed('service://foo/b', 'state')
+
+        self.assertEqual(queue.pop_ready(), None)
+        self.assertEqual(list(queue), [waiting])
+
+    def test_should_ignore_changes_of_other_attributes(self):
+        waiting = create_task('service://foo/c', set([self.a_is_up]))
+        queue = ReadyQueue([waiting], self.components)
+
+        self.components['service://foo/a'].state = 'up'
+        queue.changed('service://foo/a', 'is_frozen')
+
+        self.assertEqual(queue.pop_ready(), None)
+
+    def test_should_hand_out_ready_tasks_by_priority(self):
+        tasks = [create_task('service://foo/a'), create_task('service://foo/b')]
+        queue = ReadyQueue(tasks, self.components, priority=lambda task: -tasks.index(task))
+
+        self.assertEqual(queue.pop_ready(), tasks[1])
+
+
+def create_flat_queue(plan, components=None):
+    flat_plan = FlatPlan(plan)
+    tasks = [ActionManager.Task(None, action, path)
+             for action, path in zip(flat_plan.actions, flat_plan.paths)]
+    return FlatReadyQueue(flat_plan, tasks, components or {})
+
+
+def create_stop_start_chunk(uri, nr_errors_tolerated=0):
+    return yadtshell.actions.ActionPlan('chunk', [
+        yadtshell.actions.ActionPlan('stops', [yadtshell.actions.Action('stop', uri)]),
+        yadtshell.actions.ActionPlan('starts', [yadtshell.actions.Action('start', uri)])
+    ], nr_workers=1, nr_errors_tolerated=nr_errors_tolerated)
+
+
+class FlatReadyQueueTests(TestCase):
+
+    def pop_all_ready(self, queue):
+        names = []
+        task = queue.pop_ready()
+        while task:
+            names.append(task.action.name)
+            task = queue.pop_ready()
+        return names
+
+    def test_should_start_unrelated_chunks_right_away(self):
+        queue = create_flat_queue(yadtshell.actions.ActionPlan('update', [
+            create_stop_start_chunk('service://foo/a'),
+            create_stop_start_chunk('service://foo/b')], nr_workers=1))
+
+        self.assertEqual(self.pop_all_ready(queue), ['stop service://foo/a', 'stop service://foo/b'])
+
+        queue.finished(0)
+
+        self.assertEqual(self.pop_all_ready(queue), ['start service://foo/a'])
+
+    def test_should_hold_back_actions_on_busy_component(self):
+        queue = create_flat_queue(yadtshell.actions.ActionPlan('stop', [
+            yadtshell.actions.Action('stop', 'service://foo/a'),
+            yadtshell.actions.Action('probe', 'service://foo/a')], nr_workers=2))
+
+        self.assertEqual(self.pop_all_ready(queue), ['stop service://foo/a'])
+
+        queue.finished(0)
+
+        self.assertEqual(self.pop_all_ready(queue), ['probe service://foo/a'])
+
+    def test_should_limit_running_children_of_wave_to_its_workers(self):
+        plan = yadtshell.actions.ActionPlan('stop', [
+            yadtshell.actions.Action('stop', 'service://foo/%s' % name) for name in 'abc'])
+        queue = create_flat_queue(yadtshell.metalogic.apply_instructions(plan, 'stop=*_2_0'))
+
+        self.assertEqual(len(self.pop_all_ready(queue)), 2)
+
+        queue.finished(0)
+
+        self.assertEqual(self.pop_all_ready(queue), ['stop service://foo/c'])
+
+    def test_should_drop_remaining_actions_of_failed_plan_tolerated_by_parent(self):
+        plan = yadtshell.actions.ActionPlan('restart', [
+            create_stop_start_chunk('service://foo/a'),
+            create_stop_start_chunk('service://foo/b')], nr_workers=1, nr_errors_tolerated=1)
+        queue = create_flat_queue(plan)
+        self.pop_all_ready(queue)
+
+        queue.finished(0)
+
+        self.assertEqual(queue.failed(0), 0)
+        self.assertEqual([task.action.name for task in queue], ['start service://foo/b'])
+
+        queue.finished(2)
+
+        self.assertEqual(queue.failed(2), None)
+
+    def test_should_tolerate_errors_within_plan(self):
+        queue = create_flat_queue(create_stop_start_chunk('service://foo/a', nr_errors_tolerated=1))
+        self.pop_all_ready(queue)
+
+        queue.finished(0)
+
+        self.assertEqual(queue.failed(0), 0)
+        self.assertEqual(self.pop_all_ready(queue), ['start service://foo/a'])
+
+
 class ActionManagerHandleTests(ActionManagerTestBase):
 
     @patch('yadtshell.ActionManager.Task')
@@ -139,6 +287,8 @@ class ActionManagerHandleTests(ActionManagerTestBase):
     def test_should_instantiate_deferred_pool_according_to_plan(self,
                                                                 mock_deferred_pool,
                                                                 mock_task):
+        self.am.components = {}
+        mock_task.return_value.action.preconditions = set()
         plan = MagicMock(spec=list)
         plan.actions = [Mock()]
         plan.nr_workers = 99
@@ -147,12 +297,38 @@ class ActionManagerHandleTests(ActionManagerTestBase):
         plan.meta_info = Mock()
         self.am.handle(plan)
 
-        mock_deferred_pool.assert_called_with(
-            '/update',
-            [mock_task.return_value],
-            nr_errors_tolerated=2,
-            nr_workers=1,
-            next_task_fun=self.am.next_with_preconditions)
+        args, kwargs = mock_deferred_pool.call_args
+        self.assertEqual(args[0], '/update')
+        self.assertEqual(list(args[1]), [mock_task.return_value])
+        self.assertEqual(kwargs, dict(nr_errors_tolerated=2,
+                                      nr_workers=1,
+                                      next_task_fun=self.am.next_with_preconditions))
+
+    @patch('yadtshell.defer.DeferredPool')
+    def test_should_run_all_actions_of_flat_plan_in_one_pool(self, mock_deferred_pool):
+        self.am.components = {}
+        self.am.parallel = 'max'
+        plan = yadtshell.actions.ActionPlan('restart', [create_stop_start_chunk('service://foo/a'),
+                                                        create_stop_start_chunk('service://foo/b')])
+        self.am.handle_flat(plan)
+
+        args, kwargs = mock_deferred_pool.call_args
+        self.assertEqual(args[0], '/restart')
+        self.assertEqual([task.action.name for task in args[1]],
+                         ['stop service://foo/a', 'start service://foo/a',
+                          'stop service://foo/b', 'start service://foo/b'])
+        self.assertEqual(kwargs, dict(nr_workers=4,
+                                      next_task_fun=self.am.next_with_preconditions))
+
+    @patch('yadtshell.defer.wakeups')
+    def test_should_pass_component_changes_to_ready_queues_of_running_plans(self, mock_wakeups):
+        ready_queue = Mock()
+        self.am.ready_queues = [ready_queue]
+
+        self.am.wake_up_workers(Mock(uri='service://foo/a'), 'state')
+
+        ready_queue.changed.assert_called_with('service://foo/a', 'state')
+        mock_wakeups.notify.assert_called_with()
 
 
 class ActionManagerActionTests(ActionManagerTestBase):
@@ -90,6 +90,63 @@ class ReadonlyServiceTests(unittest.TestCase):
         self.assertTrue(status_deferred is yadt_process_protocol_mock.return_value.deferred)
 
 
+class ReadonlyServicesStatusTests(unittest.TestCase):
+
+    def setUp(self):
+        yadtshell.settings.SSH = 'ssh'
+        host = yadtshell.components.Host('example.com')
+        self.services = [yadtshell.components.ReadonlyService(host, name)
+                         for name in ['db', 'queue', 'cache']]
+        self.patchers = [
+            patch('yadtshell.components.reactor'),
+            patch('yadtshell.components.get_user_info', return_value={'owner': 'owner'}),
+            patch.object(yadtshell.components.ReadonlyService, 'create_remote_log_filename',
+                         return_value='/var/log/yadt.log')]
+        self.reactor = self.patchers[0].start()
+        for patcher in self.patchers[1:]:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def answer(self, data, exit_code=0):
+        protocol = self.reactor.spawnProcess.call_args[0][0]
+        protocol.data = data
+        protocol.finish(Mock(value=Mock(exitCode=exit_code)))
+
+    def test_should_query_all_services_with_one_ssh_call(self):
+        yadtshell.components.readonly_services_status(self.services)
+
+        self.assertEqual(self.reactor.spawnProcess.call_count, 1)
+        protocol, _, cmdline, _ = self.reactor.spawnProcess.call_args[0]
+        self.assertEqual(cmdline, ['ssh', 'example.com'])
+        self.assertTrue('for service in db queue cache;' in protocol.cmd)
+        self.assertTrue('yadt-command yadt-service-status "$service"' in protocol.cmd)
+
+    def test_should_distribute_exit_codes_to_services(self):
+        results = []
+        for d in yadtshell.components.readonly_services_status(self.services):
+            d.addBoth(results.append)
+
+        self.answer('db 0\nqueue 3\n')
+
+        self.assertEqual(results[0].component, self.services[0])
+        self.assertEqual(results[1].value.component, self.services[1])
+        self.assertEqual(results[1].value.exitCode, 3)
+        self.assertEqual(results[2].value.component, self.services[2])
+        self.assertEqual(results[2].value.exitCode, None)
+
+    def test_should_fail_all_services_when_host_is_unreachable(self):
+        results = []
+        for d in yadtshell.components.readonly_services_status(self.services):
+            d.addBoth(results.append)
+
+        self.answer('', exit_code=255)
+
+        self.assertEqual([r.value.component for r in results], self.services)
+
+
 class ArtefactTests(unittest.TestCase):
 
     def test_should_update_artefacts(self):
@@ -246,3 +303,56 @@ services:
         self.assertEqual(len(host.services), 1)
         self.assertTrue("backend-service" in host.services)
         self.assertEqual(host.services["backend-service"]["service_artefact"], ["yit-backend-service"])
+
+
+class ComponentOverlayTests(unittest.TestCase):
+
+    def setUp(self):
+        self.host = yadtshell.components.Host('foobar42.acme.com')
+        self.host.state = 'uptodate'
+        self.service = yadtshell.components.Service(self.host, 'app', {'state': 'up'})
+        self.overlay = yadtshell.components.ComponentOverlay()
+
+    def test_should_change_attributes_in_place(self):
+        self.overlay.set(self.service, 'state', 'down')
+
+        self.assertEqual(self.service.state, 'down')
+
+    def test_should_show_original_values_while_persisted(self):
+        self.overlay.set(self.service, 'state', 'unknown')
+        self.overlay.set(self.service, 'state', 'down')
+        self.overlay.set(self.host, 'probed', 'unknown')
+
+        with self.overlay.persisted():
+            self.assertEqual(self.service.state, 'up')
+            self.assertFalse(hasattr(self.host, 'probed'))
+
+        self.assertEqual(self.service.state, 'down')
+        self.assertEqual(self.host.probed, 'unknown')
+
+    def test_should_persist_kept_value(self):
+        self.overlay.set(self.service, 'state', 'down')
+        self.overlay.keep(self.service, 'state')
+        self.overlay.set(self.service, 'state', 'unknown')
+
+        with self.overlay.persisted():
+            self.assertEqual(self.service.state, 'down')
+
+        self.assertEqual(self.service.state, 'unknown')
+
+    def test_should_journal_kept_value(self):
+        journal = Mock()
+        overlay = yadtshell.components.ComponentOverlay(journal=journal)
+        overlay.set(self.service, 'state', 'down')
+
+        overlay.keep(self.service, 'state')
+
+        journal.append.assert_called_with('service://foobar42/app', 'state', 'down')
+
+    def test_should_report_every_change(self):
+        on_change = Mock()
+        overlay = yadtshell.components.ComponentOverlay(on_change=on_change)
+
+        overlay.set(self.service, 'state', 'down')
+
+        on_change.assert_called_with(self.service, 'state')
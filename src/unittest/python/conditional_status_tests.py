@@ -0,0 +1,107 @@
+import unittest
+
+import simplejson as json
+from mock import Mock
+
+from yadtshell.conditional_status import (conditional_status_command,
+                                          resolve_conditional_status,
+                                          UnresolvableConditionalStatus)
+from yadtshell.host_cache import HostCache, payload_digest
+
+
+PAYLOAD = json.dumps({
+    'fqdn': 'foobar42.acme.com',
+    'current_artefacts': ['foo/1.0'],
+    'next_artefacts': ['foo/1.1'],
+    'services': {},
+})
+PAYLOAD_HASH = payload_digest(PAYLOAD)
+
+
+class FakeMinion(object):
+
+    """Answers like a minion supporting conditional status queries."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def status(self, if_none_match=None, known_data=None):
+        payload = json.dumps(self.data)
+        payload_hash = payload_digest(payload)
+        if if_none_match is None:
+            return payload
+        if if_none_match == payload_hash:
+            return json.dumps({'yadt_status': 'unchanged', 'hash': payload_hash})
+        changes = dict([(key, value) for key, value in self.data.items()
+                        if known_data.get(key) != value])
+        removed = [key for key in known_data if key not in self.data]
+        return json.dumps({'yadt_status': 'delta', 'base': if_none_match, 'hash': payload_hash,
+                           'changes': changes, 'removed': removed})
+
+
+class ConditionalStatusTests(unittest.TestCase):
+
+    def setUp(self):
+        self.host_cache = HostCache()
+        self.host_cache.entries['foobar42.acme.com'] = ('digest', 'blob', PAYLOAD, PAYLOAD_HASH)
+
+    def resolve(self, data):
+        protocol = Mock(component='foobar42.acme.com', data=data)
+        return resolve_conditional_status(protocol, self.host_cache)
+
+    def test_should_not_send_hash_without_known_payload(self):
+        self.assertEqual(conditional_status_command(None), [])
+
+    def test_should_send_hash_of_known_payload(self):
+        self.assertEqual(conditional_status_command('cafe'),
+                         ['YADT_STATUS_IF_NONE_MATCH=cafe sh'])
+
+    def test_should_not_send_hash_with_shell_metacharacters(self):
+        self.assertEqual(conditional_status_command('cafe; rm -rf /'), [])
+        self.assertEqual(conditional_status_command('$(reboot)'), [])
+        self.assertEqual(conditional_status_command('cafe\nreboot'), [])
+        self.assertEqual(conditional_status_command('cafe\n'), [])
+
+    def test_should_keep_full_payload_of_old_minions(self):
+        protocol = self.resolve('{"fqdn": "foobar42.acme.com"}')
+
+        self.assertEqual(protocol.data, '{"fqdn": "foobar42.acme.com"}')
+        self.assertEqual(protocol.status_hash, None)
+
+    def test_should_keep_yaml_payload(self):
+        protocol = self.resolve('fqdn: foobar42.acme.com\nyadt_status: "unchanged"\n')
+
+        self.assertEqual(protocol.status_hash, None)
+
+    def test_should_resolve_unchanged_answer_to_known_payload(self):
+        minion = FakeMinion(json.loads(PAYLOAD))
+        answer = minion.status(if_none_match=PAYLOAD_HASH, known_data=json.loads(PAYLOAD))
+
+        protocol = self.resolve(answer)
+
+        self.assertEqual(protocol.data, PAYLOAD)
+        self.assertEqual(protocol.status_hash, PAYLOAD_HASH)
+
+    def test_should_apply_delta_answer_to_known_payload(self):
+        data = json.loads(PAYLOAD)
+        data['current_artefacts'] = ['foo/1.1']
+        data['next_artefacts'] = []
+        del data['services']
+        minion = FakeMinion(data)
+        answer = minion.status(if_none_match=PAYLOAD_HASH, known_data=json.loads(PAYLOAD))
+
+        protocol = self.resolve(answer)
+
+        self.assertEqual(json.loads(protocol.data), data)
+        self.assertEqual(protocol.status_hash, payload_digest(minion.status()))
+
+    def test_should_fail_on_answer_for_unknown_payload(self):
+        answer = json.dumps({'yadt_status': 'unchanged', 'hash': 'unknown'})
+
+        self.assertRaises(UnresolvableConditionalStatus, self.resolve, answer)
+
+    def test_should_fail_on_unknown_answer(self):
+        answer = json.dumps({'yadt_status': 'moved', 'hash': PAYLOAD_HASH})
+
+        self.assertRaises(UnresolvableConditionalStatus, self.resolve, answer)
+
@@ -1,4 +1,4 @@
-from yadtshell.defer import DeferredPool
+from yadtshell.defer import DeferredPool, Wakeups
 
 import unittest
 from mock import patch, call, Mock
@@ -141,3 +141,48 @@ class DeferredPoolTests(unittest.TestCase):
         next_task = pool._next_task()
 
         self.assertEqual(next_task, 'some-stuff')
+
+    @patch('yadtshell.defer.wakeups')
+    @patch('yadtshell.defer.reactor')
+    def test_should_stop_without_polling_when_no_task_can_become_ready(self, fake_reactor, wakeups):
+        task = Mock()
+        task.action.dump.return_value = 'do something'
+        pool = DeferredPool('pool-name', queue=[task], nr_workers=2, next_task_fun=lambda _: None)
+
+        self.assertTrue(all(worker.stopped for worker in pool.workers))
+        self.assertFalse(wakeups.park.called)
+        self.assertEqual([c[0][0] for c in fake_reactor.callLater.call_args_list], [0])
+
+    @patch('yadtshell.defer.wakeups')
+    def test_should_park_worker_while_no_task_is_ready(self, wakeups):
+        worker = DeferredPool.Worker('worker', lambda: None, None)
+
+        worker.run()
+
+        self.assertTrue(worker.idle)
+        wakeups.park.assert_called_with(worker)
+
+
+class WakeupsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.wakeups = Wakeups()
+        self.worker = Mock()
+
+    @patch('yadtshell.defer.reactor')
+    def test_should_not_schedule_wakeup_without_parked_workers(self, fake_reactor):
+        self.assertEqual(self.wakeups.notify('result'), 'result')
+
+        self.assertFalse(fake_reactor.callLater.called)
+
+    @patch('yadtshell.defer.reactor')
+    def test_should_wake_parked_workers_once_per_notifications(self, fake_reactor):
+        self.wakeups.park(self.worker)
+
+        self.wakeups.notify()
+        self.wakeups.notify()
+
+        fake_reactor.callLater.assert_called_once_with(0, self.wakeups._wake)
+        self.wakeups._wake()
+        self.worker.run.assert_called_once_with()
+        self.assertEqual(self.wakeups.parked, [])
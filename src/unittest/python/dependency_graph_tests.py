@@ -0,0 +1,69 @@
+import unittest
+
+import yadtshell
+from yadtshell.components import ComponentDict, Host, Service, Artefact
+from yadtshell.dependency_graph import DependencyGraph, dependency_graph
+
+
+class DependencyGraphTests(unittest.TestCase):
+
+    def setUp(self):
+        self.components = ComponentDict()
+        host = Host('foo.acme.com')
+        self.artefact = Artefact(host, 'lib', '1.0')
+        self.db = Service(host, 'db', {})
+        self.app = Service(host, 'app', {'needs_services': ['db'],
+                                         'needs_artefacts': ['lib']})
+        host.needed_by = set([self.db.uri, self.app.uri])
+        self.db.needed_by = set([self.app.uri])
+        for component in (host, self.db, self.app):
+            self.components[component.uri] = component
+        self.components[self.artefact.uri] = self.artefact
+        self.components[self.artefact.revision_uri] = self.artefact
+
+        self.graph = DependencyGraph(self.components)
+
+    def uris_of_needs(self, uri):
+        return sorted(self.graph.uris_of(self.graph.needs(self.graph.node(uri))))
+
+    def test_should_intern_all_uris_of_a_component_to_one_node(self):
+        self.assertEqual(self.graph.node('artefact://foo/lib/current'),
+                         self.graph.node('artefact://foo/lib/1.0'))
+        self.assertEqual(self.graph.uris[self.graph.node('artefact://foo/lib/current')],
+                         'artefact://foo/lib/1.0')
+
+    def test_should_keep_needs_and_needed_by(self):
+        self.assertEqual(self.uris_of_needs('service://foo/app'),
+                         ['artefact://foo/lib/1.0', 'host://foo', 'service://foo/db'])
+        self.assertEqual(self.graph.uris_of(self.graph.needed_by(self.graph.node('service://foo/db'))),
+                         ['service://foo/app'])
+
+    def test_should_partition_nodes_by_type_and_host(self):
+        self.assertEqual(sorted(self.graph.uris_of(self.graph.nodes_of_type(yadtshell.settings.SERVICE))),
+                         ['service://foo/app', 'service://foo/db'])
+        self.assertEqual(len(self.graph.nodes_on_host('host://foo')), 4)
+        self.assertEqual(list(self.graph.nodes_of_type('unknown')), [])
+
+    def test_should_add_node_without_edges_for_unknown_uri(self):
+        self.db.needs.add('service://bar/missing')
+
+        graph = DependencyGraph(self.components)
+        missing = graph.node('service://bar/missing')
+
+        self.assertEqual(graph.types[missing], yadtshell.settings.SERVICE)
+        self.assertEqual(list(graph.needs(missing)), [])
+        self.assertEqual(list(graph.needed_by(len(graph))), [])
+        self.assertFalse(missing in graph.nodes_of_type(yadtshell.settings.SERVICE))
+
+    def test_should_look_up_components_by_their_keys(self):
+        del self.components[self.artefact.uri]
+
+        graph = DependencyGraph(self.components)
+
+        self.assertEqual(graph.components_of(self.components, graph.nodes_of_type(yadtshell.settings.ARTEFACT)),
+                         [self.artefact])
+
+    def test_should_build_graph_once_per_components(self):
+        graph = dependency_graph(self.components)
+
+        self.assertTrue(dependency_graph(self.components) is graph)
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+import yadtshell
+from yadtshell.components import ComponentDict, Host, Service
+from yadtshell.dependency_score_cache import (DependencyScoreCache,
+                                              service_graph_fingerprint)
+from yadtshell.dependency_tree import DependencyTreeBuilder
+
+
+def build_components():
+    components = ComponentDict()
+    host = Host('foo.acme.com')
+    app = Service(host, 'app', {'needs_services': ['service://foo/db']})
+    db = Service(host, 'db', {})
+    app.needs = set([db.uri])
+    db.needs = set()
+    db.needed_by = set([app.uri])
+    for component in (host, app, db):
+        components[component.uri] = component
+    return components
+
+
+class ServiceGraphFingerprintTests(unittest.TestCase):
+
+    def test_should_not_change_when_states_change(self):
+        components = build_components()
+        fingerprint = service_graph_fingerprint(components)
+
+        components['service://foo/db'].state = 'down'
+
+        self.assertEqual(service_graph_fingerprint(components), fingerprint)
+
+    def test_should_change_when_dependencies_change(self):
+        components = build_components()
+        fingerprint = service_graph_fingerprint(components)
+
+        components['service://foo/db'].needs.add('service://foo/other')
+
+        self.assertNotEqual(service_graph_fingerprint(components), fingerprint)
+
+
+class DependencyScoreCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        yadtshell.settings.OUT_DIR = self.out_dir
+        self.components = build_components()
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_should_not_restore_scores_of_unknown_graph(self):
+        cache = DependencyScoreCache()
+
+        self.assertFalse(cache.restore(self.components))
+        self.assertEqual(cache.fingerprint, service_graph_fingerprint(self.components))
+
+    def test_should_restore_stored_scores_after_reload(self):
+        cache = DependencyScoreCache()
+        cache.restore(self.components)
+        self.components['service://foo/app'].dependency_score = -1
+        self.components['service://foo/db'].dependency_score = 1
+        cache.store(self.components)
+        cache.save()
+
+        components = build_components()
+        self.assertTrue(DependencyScoreCache.load().restore(components))
+
+        self.assertEqual(components['service://foo/app'].dependency_score, -1)
+        self.assertEqual(components['service://foo/db'].dependency_score, 1)
+
+    def test_should_load_empty_cache_without_file(self):
+        self.assertEqual(DependencyScoreCache.load(os.path.join(self.out_dir, 'missing')).scores, {})
+
+    @patch('yadtshell.dependency_tree.compute_dependency_scores')
+    def test_should_compute_scores_only_when_graph_changed(self, compute_dependency_scores):
+        def set_scores(components):
+            for service in ('service://foo/app', 'service://foo/db'):
+                components[service].dependency_score = 0
+        compute_dependency_scores.side_effect = set_scores
+        cache = DependencyScoreCache()
+        DependencyTreeBuilder(self.components, cache).finish()
+        DependencyTreeBuilder(self.components, cache).finish()
+
+        self.assertEqual(compute_dependency_scores.call_count, 1)
+
+        self.components['service://foo/db'].needs.add('host://foo')
+        DependencyTreeBuilder(self.components, cache).finish()
+
+        self.assertEqual(compute_dependency_scores.call_count, 2)
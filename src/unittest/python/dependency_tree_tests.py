@@ -0,0 +1,165 @@
+import unittest
+
+from mock import Mock, patch
+
+import yadtshell
+from yadtshell.components import ComponentDict, Host, Service, Artefact, MissingComponent
+from yadtshell.constants import STANDALONE_SERVICE_RANK
+from yadtshell.dependency_tree import (DependencyTreeBuilder,
+                                       HostGroupTracker,
+                                       dependency_closure,
+                                       set_provisional_dependency_scores)
+
+
+def create_host(components, fqdn, services, artefacts=None):
+    host = Host(fqdn)
+    host.state = yadtshell.settings.UPTODATE
+    host.current_artefacts = artefacts or []
+    components[host.uri] = host
+    host.defined_services = []
+    for name, settings in services:
+        service = Service(host, name, settings)
+        components[service.uri] = service
+        host.defined_services.append(service)
+    for name_version in host.current_artefacts:
+        name, version = name_version.split('/')
+        artefact = Artefact(host, name, version)
+        components[artefact.uri] = artefact
+        components[artefact.revision_uri] = artefact
+    return host
+
+
+class DependencyTreeBuilderTests(unittest.TestCase):
+
+    def setUp(self):
+        yadtshell.settings.TARGET_SETTINGS = {'name': 'test', 'hosts': ['foo', 'bar']}
+        self.components = ComponentDict()
+        self.builder = DependencyTreeBuilder(self.components)
+
+    def create_foo(self):
+        return create_host(self.components, 'foo.acme.com',
+                           [('app', {'needs_services': ['service://bar/db'],
+                                     'needs_artefacts': ['webapp']})],
+                           ['webapp/1.0'])
+
+    def create_bar(self):
+        return create_host(self.components, 'bar.acme.com', [('db', {})])
+
+    def test_should_wire_dependencies_of_host_on_arrival(self):
+        self.builder.add_host(self.create_bar())
+        self.builder.add_host(self.create_foo())
+
+        app = self.components['service://foo/app']
+        self.assertEqual(app.needs, set(['host://foo',
+                                         'service://bar/db',
+                                         'artefact://foo/webapp/1.0']))
+        self.assertEqual(self.components['service://bar/db'].needed_by, set(['service://foo/app']))
+
+    def test_should_wire_parked_dependency_when_needed_host_arrives_later(self):
+        self.builder.add_host(self.create_foo())
+        self.assertEqual(self.builder.unresolved.keys(), ['service://bar/db'])
+
+        self.builder.add_host(self.create_bar())
+
+        self.assertEqual(self.builder.unresolved, {})
+        self.assertEqual(self.components['service://bar/db'].needed_by, set(['service://foo/app']))
+
+    @patch('yadtshell.dependency_tree.compute_dependency_scores')
+    def test_should_create_missing_components_for_unresolved_dependencies_on_finish(self, _):
+        self.builder.add_host(self.create_foo())
+
+        self.builder.finish()
+
+        self.assertTrue(isinstance(self.components['service://bar/db'], MissingComponent))
+        self.assertEqual(self.components['service://bar/db'].needed_by, set(['service://foo/app']))
+        self.assertFalse(self.components._add_when_missing_)
+
+    @patch('yadtshell.dependency_tree.compute_dependency_scores')
+    def test_should_produce_same_tree_as_building_everything_on_finish(self, _):
+        self.builder.add_host(self.create_foo())
+        self.builder.add_host(self.create_bar())
+        self.builder.finish()
+        incremental = dict((uri, (c.needs, c.needed_by)) for uri, c in self.components.items())
+
+        self.components = ComponentDict()
+        self.builder = DependencyTreeBuilder(self.components)
+        self.create_foo()
+        self.create_bar()
+        self.builder.finish()
+        at_once = dict((uri, (c.needs, c.needed_by)) for uri, c in self.components.items())
+
+        self.assertEqual(incremental, at_once)
+
+    @patch('yadtshell.dependency_tree.compute_dependency_scores')
+    def test_should_compute_dependency_scores_on_finish(self, compute_dependency_scores):
+        self.builder.finish()
+
+        compute_dependency_scores.assert_called_with(self.components)
+
+
+class ProvisionalDependencyScoreTests(unittest.TestCase):
+
+    def test_should_rank_services_by_direct_dependencies_on_same_host(self):
+        lonely = Mock(host='foo', needs=set(['host://foo']), needed_by=set())
+        backend = Mock(host='foo', needs=set(), needed_by=set(['service://foo/frontend']))
+        frontend = Mock(host='foo', needs=set(['service://foo/backend', 'service://bar/db']),
+                        needed_by=set())
+
+        set_provisional_dependency_scores([lonely, backend, frontend])
+
+        self.assertEqual(lonely.dependency_score, STANDALONE_SERVICE_RANK)
+        self.assertEqual(backend.dependency_score, 1)
+        self.assertEqual(frontend.dependency_score, -1)
+
+
+def finished_host(name, fqdn):
+    host = Mock(fqdn=fqdn)
+    host.name = name
+    return host
+
+
+class HostGroupTrackerTests(unittest.TestCase):
+
+    def test_should_report_group_once_all_hosts_are_finished(self):
+        tracker = HostGroupTracker([['foo01', 'foo02'], ['bar01']])
+
+        self.assertEqual(tracker.host_finished(finished_host('foo01', 'foo01.acme.com')), [])
+        self.assertEqual(tracker.host_finished(finished_host('bar01', 'bar01.acme.com')), [set(['bar01'])])
+        self.assertEqual(tracker.pending_groups, [set(['foo01', 'foo02'])])
+
+    def test_should_match_hosts_by_fqdn(self):
+        tracker = HostGroupTracker([['foo01.acme.com']])
+
+        self.assertEqual(tracker.host_finished(finished_host('foo01', 'foo01.acme.com')), [set(['foo01.acme.com'])])
+
+
+class DependencyClosureTests(unittest.TestCase):
+
+    def setUp(self):
+        yadtshell.settings.TARGET_SETTINGS = {'name': 'test', 'hosts': ['foo', 'bar', 'baz']}
+        self.components = ComponentDict()
+        builder = DependencyTreeBuilder(self.components)
+        builder.add_host(create_host(self.components, 'foo.acme.com',
+                                     [('app', {'needs_services': ['service://bar/db']})]))
+        builder.add_host(create_host(self.components, 'bar.acme.com',
+                                     [('db', {'needs_services': ['service://baz/storage']})]))
+        builder.add_host(create_host(self.components, 'baz.acme.com',
+                                     [('storage', {}), ('backup', {'needs_services': ['storage']})]))
+
+    def test_should_follow_needs_and_needed_by_transitively(self):
+        closure = dependency_closure(self.components, ['service://bar/db'])
+
+        self.assertEqual(closure, set(['service://foo/app',
+                                       'service://bar/db',
+                                       'service://baz/storage',
+                                       'host://bar', 'host://baz']))
+
+    def test_should_not_mix_directions(self):
+        closure = dependency_closure(self.components, ['service://foo/app'])
+
+        self.assertFalse('service://baz/backup' in closure)
+        self.assertTrue('service://baz/storage' in closure)
+
+    def test_should_keep_unknown_uris(self):
+        self.assertEqual(dependency_closure(self.components, ['service://qux/unknown']),
+                         set(['service://qux/unknown']))
@@ -0,0 +1,75 @@
+import unittest
+
+from yadtshell.actions import Action, ActionPlan, TargetState
+from yadtshell.flat_plan import FlatPlan, touched_uris
+from yadtshell.metalogic import apply_instructions
+
+
+def create_chunk(uri):
+    return ActionPlan('chunk', [ActionPlan('stops', [Action('stop', uri, 'state', 'down')]),
+                                ActionPlan('starts', [Action('start', uri, 'state', 'up')])],
+                      nr_workers=1)
+
+
+class FlatPlanTests(unittest.TestCase):
+
+    def test_should_keep_actions_in_depth_first_order_with_their_paths(self):
+        flat_plan = FlatPlan(ActionPlan('restart', [create_chunk('service://foo/a')]))
+
+        self.assertEqual([action.name for action in flat_plan.actions],
+                         ['stop service://foo/a', 'start service://foo/a'])
+        self.assertEqual(flat_plan.paths[1], ['restart', 'chunk', 'starts', ' start@service://foo/a'])
+
+    def test_should_order_related_children_of_sequential_plan(self):
+        flat_plan = FlatPlan(create_chunk('service://foo/a'))
+
+        self.assertEqual(flat_plan.waiting_for(0), 0)
+        self.assertEqual(flat_plan.waiting_for(1), 1)
+
+    def test_should_not_order_unrelated_children_of_sequential_plan(self):
+        plan = ActionPlan('update', [create_chunk('service://foo/a'),
+                                     create_chunk('service://foo/b')], nr_workers=1)
+
+        flat_plan = FlatPlan(plan)
+
+        self.assertEqual([flat_plan.waiting_for(position) for position in range(4)], [0, 1, 0, 1])
+
+    def test_should_relate_children_by_preconditions(self):
+        needs_a = TargetState('service://foo/a', 'state', 'up')
+        plan = ActionPlan('update', [
+            ActionPlan('prestart', [Action('start', 'service://foo/a', 'state', 'up')]),
+            ActionPlan('start', [Action('start', 'service://foo/b', 'state', 'up',
+                                        preconditions=set([needs_a]))])], nr_workers=1)
+
+        flat_plan = FlatPlan(plan)
+
+        self.assertEqual(flat_plan.waiting_for(1), 1)
+        self.assertEqual(touched_uris(flat_plan.actions[1]),
+                         set(['service://foo/a', 'service://foo/b']))
+
+    def test_should_order_actions_of_sequential_plan_by_preconditions_only(self):
+        plan = ActionPlan('stop', [Action('stop', 'service://foo/a', 'state', 'down'),
+                                   Action('start', 'service://foo/a', 'state', 'up')], nr_workers=1)
+
+        flat_plan = FlatPlan(plan)
+
+        self.assertEqual(flat_plan.waiting_for(1), 0)
+
+    def test_should_not_order_children_of_parallel_plan(self):
+        plan = ActionPlan('chunk', create_chunk('service://foo/a').actions, nr_workers=2)
+
+        self.assertEqual(FlatPlan(plan).waiting_for(1), 0)
+
+    def test_should_run_waves_one_after_the_other_with_their_workers(self):
+        plan = ActionPlan('stop', [Action('stop', 'service://foo/%s' % name, 'state', 'down')
+                                   for name in 'abc'])
+        plan = apply_instructions(plan, 'stop=1_1_0:*_2_1')
+
+        flat_plan = FlatPlan(plan)
+
+        self.assertEqual([flat_plan.waiting_for(position) for position in range(3)], [0, 1, 1])
+        self.assertEqual(flat_plan.plan_capacity, [None, 1, 2])
+        self.assertEqual(flat_plan.plan_nr_errors_tolerated, [0, 0, 1])
+        self.assertEqual(flat_plan.innermost_plan(2), 2)
+        self.assertEqual(flat_plan.parent_plan(2), 0)
+        self.assertEqual(flat_plan.parent_plan(0), None)
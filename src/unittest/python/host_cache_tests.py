@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import simplejson as json
+from mock import Mock, patch
+
+import yadtshell
+from yadtshell.components import ComponentDict
+from yadtshell.host_cache import HostCache, payload_digest
+
+
+DATA = json.dumps({
+    'fqdn': 'foobar42.acme.com',
+    'current_artefacts': ['foo/1.0'],
+    'next_artefacts': ['foo/1.1'],
+    'services': {'bar': {'needs_artefacts': ['foo'], 'state': 'up'}},
+})
+
+
+def build_host(data, components):
+    protocol = Mock(component='foobar42.acme.com', data=data)
+    with patch('yadtshell._status.write_host_data_to_file'):
+        host = yadtshell._status.create_host(protocol, components)
+    yadtshell._status.initialize_services(host, components)
+    return yadtshell._status.initialize_artefacts(host, components)
+
+
+class HostCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.components = ComponentDict()
+        self.host = build_host(DATA, self.components)
+        self.cache = HostCache()
+        self.cache.store('foobar42.acme.com', DATA, self.host, self.components)
+
+    def test_should_restore_host_services_and_artefacts_for_same_data(self):
+        components = ComponentDict()
+
+        host = self.cache.restore('foobar42.acme.com', DATA, components)
+
+        self.assertEqual(host.uri, 'host://foobar42')
+        self.assertEqual(sorted(components.keys()), sorted(self.components.keys()))
+        self.assertTrue(components['service://foobar42/bar'] in host.defined_services)
+        self.assertTrue(components['artefact://foobar42/foo/current'] is
+                        components['artefact://foobar42/foo/1.0'])
+        self.assertEqual(host.logger.name, 'host://foobar42')
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_should_restore_fresh_objects(self):
+        host = self.cache.restore('foobar42.acme.com', DATA, ComponentDict())
+
+        self.assertFalse(host is self.host)
+
+    def test_should_not_restore_host_when_data_changed(self):
+        components = ComponentDict()
+
+        host = self.cache.restore('foobar42.acme.com', DATA.replace('1.1', '1.2'), components)
+
+        self.assertEqual(host, None)
+        self.assertEqual(components, {})
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_should_not_restore_host_cached_by_other_version(self):
+        with patch.object(yadtshell, 'VERSION', 'other-version'):
+            host = self.cache.restore('foobar42.acme.com', DATA, ComponentDict())
+
+        self.assertEqual(host, None)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_should_restore_host_when_service_classes_resolve_the_same(self):
+        host = self.cache.restore('foobar42.acme.com', DATA, ComponentDict(),
+                                  yadtshell._status.resolve_service_class)
+
+        self.assertEqual(host.uri, 'host://foobar42')
+
+    def test_should_not_restore_host_when_service_class_resolves_to_other_class(self):
+        class OtherService(yadtshell.components.Service):
+            pass
+
+        host = self.cache.restore('foobar42.acme.com', DATA, ComponentDict(),
+                                  lambda host, class_setting: OtherService)
+
+        self.assertEqual(host, None)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_should_compute_lock_owner_attributes_for_current_user(self):
+        locked_data = json.dumps(dict(json.loads(DATA), lockstate={'owner': 'alice'}))
+        with patch('yadtshell.components.get_user_info', return_value={'owner': 'alice'}):
+            host = build_host(locked_data, ComponentDict())
+        self.assertTrue(host.is_locked_by_me)
+        self.cache.store('foobar42.acme.com', locked_data, host, ComponentDict())
+
+        with patch('yadtshell.components.get_user_info', return_value={'owner': 'bob'}):
+            restored = self.cache.restore('foobar42.acme.com', locked_data, ComponentDict())
+
+        self.assertFalse(restored.is_locked_by_me)
+        self.assertTrue(restored.is_locked_by_other)
+
+    def test_should_not_restore_unknown_host(self):
+        self.assertEqual(self.cache.restore('other.acme.com', DATA, ComponentDict()), None)
+
+    def test_should_use_payload_digest_as_hash_of_full_payloads(self):
+        self.assertEqual(self.cache.status_hash('foobar42.acme.com'), payload_digest(DATA))
+        self.assertEqual(self.cache.payload('foobar42.acme.com', payload_digest(DATA)), DATA)
+
+    def test_should_remember_minion_hash_of_resolved_payload(self):
+        self.cache.store('foobar42.acme.com', DATA, self.host, self.components,
+                         status_hash='minion-hash')
+
+        self.assertEqual(self.cache.status_hash('foobar42.acme.com'), 'minion-hash')
+        self.assertEqual(self.cache.payload('foobar42.acme.com', 'minion-hash'), DATA)
+        self.assertEqual(self.cache.payload('foobar42.acme.com', 'other-hash'), None)
+
+    def test_should_not_know_hash_of_unknown_host(self):
+        self.assertEqual(self.cache.status_hash('other.acme.com'), None)
+
+    def test_should_keep_logger_of_stored_host(self):
+        self.assertEqual(self.host.logger.name, 'host://foobar42')
+
+    def test_should_save_and_load_entries(self):
+        out_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(out_dir, 'host_cache')
+            self.cache.save(filename)
+
+            loaded = HostCache.load(filename)
+
+            self.assertEqual(loaded.entries, self.cache.entries)
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_should_start_empty_without_cache_file(self):
+        self.assertEqual(HostCache.load('/does/not/exist').entries, {})
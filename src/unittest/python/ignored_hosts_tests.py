@@ -0,0 +1,100 @@
+import unittest
+
+from mock import Mock, patch
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+from yadtshell.ignored_hosts import HostNotIgnored, IgnoredHostsSnapshot
+
+
+class BroadcasterStub(object):
+
+    """Answers rest calls like a broadcaster on localhost:8081 would."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requested_urls = []
+
+    def __call__(self, url):
+        self.requested_urls.append(url)
+        response = self.responses.get(url.replace('http://localhost:8081', ''))
+        if response is None:
+            return defer.fail(Exception('Non-OK response for URL: %s' % url))
+        if isinstance(response, defer.Deferred):
+            return response
+        return defer.succeed(response)
+
+
+class IgnoredHostsSnapshotTests(unittest.TestCase):
+
+    def setUp(self):
+        self.ybc = Mock(host='localhost', port=8081)
+        self.results = []
+
+    def status_ignored(self, snapshot, short_hostname):
+        snapshot.status_ignored(short_hostname).addBoth(self.results.append)
+
+    def test_should_answer_all_hosts_with_one_bulk_request(self):
+        stub = BroadcasterStub({
+            '/api/v1/targets/test/status-ignored': '{"foo": "maintenance"}'})
+        with patch('yadtshell.ignored_hosts.rest_call', stub):
+            snapshot = IgnoredHostsSnapshot(self.ybc, 'test')
+            snapshot.fetch()
+            self.status_ignored(snapshot, 'foo')
+            self.status_ignored(snapshot, 'bar')
+
+        self.assertEqual(stub.requested_urls,
+                         ['http://localhost:8081/api/v1/targets/test/status-ignored'])
+        self.assertEqual(self.results[0], 'maintenance')
+        self.assertTrue(self.results[1].check(HostNotIgnored))
+
+    def test_should_answer_lookups_once_bulk_request_arrives(self):
+        bulk_response = defer.Deferred()
+        stub = BroadcasterStub({
+            '/api/v1/targets/test/status-ignored': bulk_response})
+        with patch('yadtshell.ignored_hosts.rest_call', stub):
+            snapshot = IgnoredHostsSnapshot(self.ybc, 'test')
+            snapshot.fetch()
+            self.status_ignored(snapshot, 'foo')
+
+            self.assertEqual(self.results, [])
+            bulk_response.callback('{"foo": "maintenance"}')
+
+        self.assertEqual(self.results, ['maintenance'])
+
+    def test_should_ask_each_host_when_bulk_request_fails(self):
+        stub = BroadcasterStub({
+            '/api/v1/hosts/foo/status-ignored': 'maintenance'})
+        with patch('yadtshell.ignored_hosts.rest_call', stub):
+            snapshot = IgnoredHostsSnapshot(self.ybc, 'test')
+            snapshot.fetch()
+            self.status_ignored(snapshot, 'foo')
+            self.status_ignored(snapshot, 'bar')
+
+        self.assertEqual(stub.requested_urls, [
+            'http://localhost:8081/api/v1/targets/test/status-ignored',
+            'http://localhost:8081/api/v1/hosts/foo/status-ignored',
+            'http://localhost:8081/api/v1/hosts/bar/status-ignored'])
+        self.assertEqual(self.results[0], 'maintenance')
+        self.assertTrue(isinstance(self.results[1], Failure))
+
+    def test_should_ask_each_host_when_bulk_response_is_malformed(self):
+        stub = BroadcasterStub({
+            '/api/v1/targets/test/status-ignored': '["foo"]',
+            '/api/v1/hosts/foo/status-ignored': 'maintenance'})
+        with patch('yadtshell.ignored_hosts.rest_call', stub):
+            snapshot = IgnoredHostsSnapshot(self.ybc, 'test')
+            snapshot.fetch()
+            self.status_ignored(snapshot, 'foo')
+
+        self.assertEqual(self.results, ['maintenance'])
+
+    def test_should_fetch_snapshot_on_first_lookup(self):
+        stub = BroadcasterStub({
+            '/api/v1/targets/test/status-ignored': '{}'})
+        with patch('yadtshell.ignored_hosts.rest_call', stub):
+            snapshot = IgnoredHostsSnapshot(self.ybc, 'test')
+            self.status_ignored(snapshot, 'foo')
+            self.status_ignored(snapshot, 'bar')
+
+        self.assertEqual(len(stub.requested_urls), 1)
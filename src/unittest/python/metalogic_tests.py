@@ -1,8 +1,29 @@
 import unittest
 from mock import patch
 
-from yadtshell.metalogic import apply_instructions
-from yadtshell.actions import ActionPlan, Action
+from yadtshell.components import ComponentDict, Host, Service
+from yadtshell.dependency_graph import DependencyGraph
+from yadtshell.metalogic import (DisjointSets,
+                                 apply_instructions,
+                                 chop_minimal_related_chunks,
+                                 touched_closure)
+from yadtshell.actions import ActionPlan, Action, TargetState
+
+
+def create_chain(length):
+    components = ComponentDict()
+    host = Host('foo.acme.com')
+    components[host.uri] = host
+    previous = None
+    for nr in range(length):
+        service = Service(host, 'service%i' % nr, {})
+        components[service.uri] = service
+        host.needed_by.add(service.uri)
+        if previous:
+            service.needs.add(previous.uri)
+            previous.needed_by.add(service.uri)
+        previous = service
+    return components
 
 
 class MetalogicTests(unittest.TestCase):
@@ -82,3 +103,61 @@ class MetalogicTests(unittest.TestCase):
         self.assertEqual(second_subplan.nr_errors_tolerated, '1')
         self.assertEqual(len(second_subplan.actions), 3)
         self.assertEqual(second_subplan.actions, actions[1:])
+
+
+class TouchedClosureTests(unittest.TestCase):
+
+    def setUp(self):
+        self.components = create_chain(3)
+        self.graph = DependencyGraph(self.components)
+
+    def closure(self, uri, key):
+        nodes = touched_closure(self.graph, self.components, [self.graph.node(uri)], key)
+        return sorted(self.graph.uris_of(nodes))
+
+    def test_should_find_all_components_needing_a_component(self):
+        self.assertEqual(self.closure('service://foo/service1', 'needed_by'),
+                         ['service://foo/service1', 'service://foo/service2'])
+
+    def test_should_find_all_components_needed_by_a_component(self):
+        self.assertEqual(self.closure('service://foo/service1', 'needs'),
+                         ['host://foo', 'service://foo/service0', 'service://foo/service1'])
+
+    def test_should_skip_components_not_touched_by_dependency(self):
+        with patch.object(Service, 'is_touched_also', return_value=False):
+            self.assertEqual(self.closure('host://foo', 'needed_by'), ['host://foo'])
+
+    def test_should_handle_long_chains(self):
+        self.components = create_chain(5000)
+        self.graph = DependencyGraph(self.components)
+
+        self.assertEqual(len(self.closure('host://foo', 'needed_by')), 5001)
+
+
+class DisjointSetsTests(unittest.TestCase):
+
+    def test_should_label_merged_sets_with_smallest_label(self):
+        sets = DisjointSets()
+        for label, item in enumerate('abcd'):
+            sets.add(item, label + 1)
+
+        sets.union('d', 'c')
+        sets.union('c', 'b')
+
+        self.assertEqual([sets.label_of(item) for item in 'abcd'], [1, 2, 2, 2])
+        self.assertEqual(sets.find('d'), sets.find('b'))
+
+
+class ChopMinimalRelatedChunksTests(unittest.TestCase):
+
+    def test_should_put_actions_related_by_preconditions_into_one_chunk(self):
+        app = Action('stop', 'service://foo/app', 'state', 'down')
+        db = Action('stop', 'service://foo/db', 'state', 'down',
+                    preconditions=set([TargetState('service://foo/app', 'state', 'down')]))
+        other = Action('stop', 'service://bar/other', 'state', 'down',
+                       preconditions=set([TargetState('service://bar/unknown', 'state', 'down')]))
+
+        plan = chop_minimal_related_chunks(ActionPlan('stop', [app, db, other]))
+
+        self.assertEqual(sorted([action.uri for action in chunk.actions] for chunk in plan.actions),
+                         [['service://bar/other'], ['service://foo/app', 'service://foo/db']])
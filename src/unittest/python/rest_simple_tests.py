@@ -0,0 +1,162 @@
+import unittest
+
+from mock import Mock, patch
+from twisted.internet import defer
+from twisted.internet.task import Clock
+
+from yadtshell.rest_simple import (BodyConsumer,
+                                   PooledAgent,
+                                   ResponseTooLarge,
+                                   RestMetrics,
+                                   read_response,
+                                   rest_call)
+
+
+def create_response(code=200, body='body'):
+    def deliver_body(protocol):
+        protocol.dataReceived(body)
+        protocol.connectionLost(None)
+    return Mock(code=code, deliverBody=Mock(side_effect=deliver_body))
+
+
+class BodyConsumerTests(unittest.TestCase):
+
+    def test_should_join_received_chunks(self):
+        finished = defer.Deferred()
+        results = []
+        finished.addBoth(results.append)
+        consumer = BodyConsumer(finished)
+
+        consumer.dataReceived('some-data-')
+        consumer.dataReceived('-more-data')
+        consumer.connectionLost(None)
+
+        self.assertEqual(results, ['some-data--more-data'])
+
+    def test_should_fail_when_response_exceeds_size_limit(self):
+        finished = defer.Deferred()
+        results = []
+        finished.addBoth(results.append)
+        consumer = BodyConsumer(finished, max_size=8)
+        consumer.transport = Mock()
+
+        consumer.dataReceived('12345')
+        consumer.dataReceived('67890')
+        consumer.dataReceived('more')
+        consumer.connectionLost(None)
+
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0].check(ResponseTooLarge))
+        consumer.transport.stopProducing.assert_called_with()
+
+    def test_should_fail_on_non_ok_response_after_reading_its_body(self):
+        results = []
+        response = create_response(code=404)
+        d = defer.maybeDeferred(read_response, response)
+        d.addBoth(results.append)
+
+        self.assertTrue(results[0].check(Exception))
+        self.assertEqual(response.deliverBody.call_count, 1)
+
+    def test_should_not_fail_on_non_ok_response_before_body_is_read(self):
+        results = []
+        read_response(Mock(code=500)).addBoth(results.append)
+
+        self.assertEqual(results, [])
+
+
+class PooledAgentTests(unittest.TestCase):
+
+    def setUp(self):
+        self.agent = PooledAgent(clock=Clock(), max_connections_per_host=2)
+        self.requests = []
+        self.agent.agent = Mock()
+        self.agent.agent.request.side_effect = self.request
+
+    def request(self, *args):
+        self.requests.append(defer.Deferred())
+        return self.requests[-1]
+
+    def test_should_use_persistent_connections(self):
+        agent = PooledAgent(clock=Clock(), max_connections_per_host=2)
+
+        self.assertTrue(agent.pool.persistent)
+        self.assertEqual(agent.pool.maxPersistentPerHost, 2)
+
+    def test_should_limit_concurrent_requests_per_host(self):
+        for _ in range(3):
+            self.agent.request('GET', 'http://foo:8080/api')
+        self.agent.request('GET', 'http://bar:8080/api')
+
+        self.assertEqual(len(self.requests), 3)
+
+        self.requests[0].callback(create_response())
+
+        self.assertEqual(len(self.requests), 4)
+
+    def test_should_hold_connection_slot_until_body_is_read(self):
+        bodies = []
+        for _ in range(3):
+            self.agent.request('GET', 'http://foo:8080/api').addBoth(bodies.append)
+        response = Mock(code=200)
+
+        self.requests[0].callback(response)
+
+        self.assertEqual(len(self.requests), 2)
+
+        protocol = response.deliverBody.call_args[0][0]
+        protocol.dataReceived('body')
+        protocol.connectionLost(None)
+
+        self.assertEqual(bodies, ['body'])
+        self.assertEqual(len(self.requests), 3)
+
+    def test_should_free_connection_slot_when_request_fails(self):
+        for _ in range(3):
+            self.agent.request('GET', 'http://foo:8080/api').addErrback(lambda failure: None)
+
+        self.requests[0].errback(Exception('connection refused'))
+
+        self.assertEqual(len(self.requests), 3)
+
+
+class RestCallTests(unittest.TestCase):
+
+    @patch('yadtshell.rest_simple.metrics')
+    @patch('yadtshell.rest_simple.get_agent')
+    def test_should_share_one_agent_and_record_metrics(self, get_agent, metrics):
+        get_agent.return_value.request.side_effect = lambda *args: defer.succeed('response')
+        results = []
+
+        rest_call('http://foo:8080/api').addBoth(results.append)
+        rest_call('http://foo:8080/api').addBoth(results.append)
+
+        self.assertEqual(results, ['response', 'response'])
+        self.assertEqual(get_agent.return_value.request.call_count, 2)
+        self.assertEqual(metrics.record.call_count, 2)
+        self.assertFalse(metrics.record.call_args[0][1])
+        self.assertEqual(metrics.record.call_args[0][2], len('response'))
+
+    @patch('yadtshell.rest_simple.get_agent')
+    def test_should_not_accumulate_headers_between_calls(self, get_agent):
+        get_agent.return_value.request.return_value = defer.Deferred()
+
+        rest_call('http://foo:8080/api')
+        rest_call('http://foo:8080/api')
+
+        headers = get_agent.return_value.request.call_args[0][2]
+        self.assertEqual(headers.getRawHeaders('Content-Type'), ['text/plain'])
+
+
+class RestMetricsTests(unittest.TestCase):
+
+    def test_should_count_requests_failures_and_latencies(self):
+        metrics = RestMetrics()
+        metrics.record(0.1, nr_bytes=10)
+        metrics.record(0.3, failed=True)
+
+        self.assertEqual(metrics.requests, 2)
+        self.assertEqual(metrics.failures, 1)
+        self.assertEqual(metrics.bytes_received, 10)
+        self.assertAlmostEqual(metrics.mean_latency(), 0.2)
+        self.assertEqual(metrics.max_latency, 0.3)
@@ -0,0 +1,105 @@
+import types
+import unittest
+
+from mock import Mock, patch
+
+import yadtshell
+from yadtshell.service_registry import ServiceClassRegistry
+
+
+class RegisteredService(yadtshell.components.Service):
+    pass
+
+
+def create_entry_point(name, service_class, dist='plugin 1.0'):
+    entry_point = Mock(dist=dist)
+    entry_point.name = name
+    entry_point.__str__ = Mock(return_value='%s = plugin:%s' % (name, service_class.__name__))
+    entry_point.load.return_value = service_class
+    return entry_point
+
+
+class ServiceClassRegistryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = ServiceClassRegistry()
+        self.registry.entry_points_loaded = True
+
+    def test_should_find_registered_class(self):
+        self.registry.register(RegisteredService, 'SomeAlias')
+
+        self.assertEqual(self.registry.lookup('SomeAlias'), RegisteredService)
+
+    def test_should_prefer_registered_class_over_loaded_modules(self):
+        self.registry.register(Mock, 'RegisteredService')
+
+        self.assertEqual(self.registry.lookup('RegisteredService'), Mock)
+
+    def test_should_find_class_in_loaded_modules(self):
+        self.assertEqual(self.registry.lookup('RegisteredService'), RegisteredService)
+
+    def test_should_not_inspect_indexed_modules_again(self):
+        self.registry.lookup('RegisteredService')
+
+        with patch('yadtshell.service_registry.inspect.getmembers') as getmembers:
+            self.registry.lookup('RegisteredService')
+            self.registry.lookup('NoSuchClass')
+
+        self.assertFalse(getmembers.called)
+
+    def test_should_find_replaced_class_after_invalidation(self):
+        self.registry.lookup('RegisteredService')
+        module = types.ModuleType(__name__)
+        module.RegisteredService = type('RegisteredService', (yadtshell.components.Service,), {})
+
+        with patch.dict('sys.modules', {__name__: module}):
+            self.registry.invalidate()
+            service_class = self.registry.lookup('RegisteredService')
+
+        self.assertTrue(service_class is module.RegisteredService)
+
+    def test_should_forget_fallbacks_on_invalidation(self):
+        self.registry.fallbacks['some.module.SomeService'] = RegisteredService
+
+        self.registry.invalidate()
+
+        self.assertEqual(self.registry.fallbacks, {})
+
+    def test_should_return_none_for_unknown_class(self):
+        self.assertEqual(self.registry.lookup('NoSuchClass'), None)
+
+    @patch('yadtshell.service_registry._entry_points')
+    def test_should_register_classes_from_entry_points(self, entry_points):
+        entry_points.return_value = [create_entry_point('PluginService', RegisteredService)]
+        self.registry.entry_points_loaded = False
+
+        self.assertEqual(self.registry.lookup('PluginService'), RegisteredService)
+
+    @patch('yadtshell.service_registry._entry_points')
+    def test_should_keep_index_while_plugins_are_the_same(self, entry_points):
+        entry_points.return_value = [create_entry_point('PluginService', RegisteredService)]
+        self.registry.entry_points_loaded = False
+        self.registry.lookup('RegisteredService')
+
+        self.registry.invalidate_if_plugins_changed()
+
+        self.assertTrue(self.registry.entry_points_loaded)
+        self.assertEqual(self.registry.index.get('RegisteredService'), RegisteredService)
+
+    @patch('yadtshell.service_registry._entry_points')
+    def test_should_invalidate_when_plugins_changed(self, entry_points):
+        entry_points.return_value = [create_entry_point('PluginService', RegisteredService)]
+        self.registry.entry_points_loaded = False
+        self.registry.lookup('RegisteredService')
+        entry_points.return_value = [create_entry_point('PluginService', RegisteredService, 'plugin 2.0')]
+
+        self.registry.invalidate_if_plugins_changed()
+
+        self.assertFalse(self.registry.entry_points_loaded)
+        self.assertEqual(self.registry.index, {})
+
+    def test_should_know_standard_service_classes(self):
+        registry = yadtshell.service_registry.registry
+
+        self.assertEqual(registry.registered['Service'], yadtshell.components.Service)
+        self.assertEqual(registry.registered['ReadonlyService'], yadtshell.components.ReadonlyService)
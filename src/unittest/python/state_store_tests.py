@@ -0,0 +1,183 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mock import patch
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import yadtshell
+from yadtshell.components import ComponentDict, Host, Service, Artefact
+from yadtshell.dependency_graph import dependency_graph
+from yadtshell.state_store import (StateStore,
+                                   StateJournal,
+                                   StateStoreError,
+                                   migrate_legacy_state)
+
+
+def build_components():
+    components = ComponentDict()
+    for fqdn in ['foo.acme.com', 'bar.acme.com']:
+        host = Host(fqdn)
+        host.logger = None
+        service = Service(host, 'app', {})
+        artefact = Artefact(host, 'lib', '1.0')
+        host.defined_services = [service]
+        components[host.uri] = host
+        components[service.uri] = service
+        components[artefact.uri] = artefact
+        components[artefact.revision_uri] = artefact
+    return components
+
+
+class StateStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        yadtshell.settings.OUT_DIR = self.out_dir
+        self.components = build_components()
+        self.store = StateStore(os.path.join(self.out_dir, 'current_state.db'))
+        self.store.save(self.components)
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_should_load_all_components(self):
+        components = self.store.load()
+
+        self.assertTrue(isinstance(components, ComponentDict))
+        self.assertEqual(sorted(components.keys()), sorted(self.components.keys()))
+
+    def test_should_load_components_of_given_hosts_only(self):
+        components = self.store.load(hosts=['foo'])
+
+        self.assertEqual(sorted(components.keys()),
+                         ['artefact://foo/lib/1.0', 'artefact://foo/lib/current',
+                          'host://foo', 'service://foo/app'])
+
+    def test_should_keep_identity_of_components_within_a_host(self):
+        components = self.store.load(hosts=['foo'])
+
+        self.assertTrue(components['artefact://foo/lib/1.0'] is
+                        components['artefact://foo/lib/current'])
+        self.assertTrue(components['service://foo/app'] in
+                        components['host://foo'].defined_services)
+
+    def test_should_load_dependency_graph_with_all_components(self):
+        graph = self.store.load().dependency_graph
+
+        self.assertEqual(sorted(graph.uris_of(graph.nodes_on_host('host://foo'))),
+                         ['artefact://foo/lib/1.0', 'host://foo', 'service://foo/app'])
+        self.assertEqual(graph.uris_of(graph.needs(graph.node('service://bar/app'))), ['host://bar'])
+        self.assertFalse(hasattr(self.store.load(hosts=['foo']), 'dependency_graph'))
+
+    @patch('yadtshell._info.calculate_info_view_settings')
+    @patch('yadtshell._info._render_services_matrix')
+    def test_should_store_graph_of_all_components_after_partial_status(self, render, _):
+        # like the real matrix, fall back to the graph kept with the components
+        render.side_effect = lambda components, hosts, settings, graph=None: (
+            graph if graph is not None else dependency_graph(components))
+        components = ComponentDict()
+        for uri, component in self.components.items():
+            if component.host == 'foo':
+                components[uri] = component
+        yadtshell._status.render_partial_info(components, ['foo.acme.com'], 1)
+        components.update(self.components)
+
+        self.store.save(components)
+
+        graph = self.store.load().dependency_graph
+        self.assertTrue('service://bar/app' in graph)
+        self.assertEqual(graph.uris_of(graph.needs(graph.node('service://bar/app'))), ['host://bar'])
+
+    def test_should_answer_uris_from_index(self):
+        self.assertEqual(sorted(self.store.uris(types=['service'])),
+                         ['service://bar/app', 'service://foo/app'])
+        self.assertEqual(sorted(self.store.uris(hosts=['bar'], types=['host'])),
+                         ['host://bar'])
+
+    def test_should_return_hosts_of_uris(self):
+        self.assertEqual(self.store.hosts_of(['service://foo/app', 'host://foo']), set(['foo']))
+
+    def test_should_replace_stored_state(self):
+        del self.components['host://bar']
+
+        self.store.save(self.components)
+
+        self.assertFalse('host://bar' in self.store.uris())
+
+    def test_should_raise_without_stored_state(self):
+        self.assertRaises(StateStoreError, StateStore('/does/not/exist').load)
+        self.assertRaises(IOError, StateStore('/does/not/exist').load)
+
+
+class LegacyStateMigrationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        yadtshell.settings.OUT_DIR = self.out_dir
+        self.legacy_filename = os.path.join(self.out_dir, 'current_state.components')
+        self.store = StateStore(os.path.join(self.out_dir, 'current_state.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_should_migrate_pickled_state_and_keep_its_age(self):
+        with open(self.legacy_filename, 'w') as f:
+            pickle.dump(build_components(), f, pickle.HIGHEST_PROTOCOL)
+        mtime = time.time() - 42
+        os.utime(self.legacy_filename, (mtime, mtime))
+
+        self.assertTrue(migrate_legacy_state(self.store))
+
+        self.assertEqual(len(self.store.load()), 8)
+        self.assertAlmostEqual(os.path.getmtime(self.store.filename), mtime, 0)
+        self.assertFalse(os.path.exists(self.legacy_filename))
+
+    def test_should_not_migrate_without_pickled_state(self):
+        self.assertFalse(migrate_legacy_state(self.store))
+
+
+class StateJournalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        self.journal = StateJournal(os.path.join(self.out_dir, 'current_state.journal'))
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_should_replay_changes_in_order(self):
+        components = build_components()
+        self.journal.append('service://foo/app', 'state', 'down')
+        self.journal.append('service://foo/app', 'state', 'up')
+        self.journal.append('host://bar', 'state', 'uptodate')
+
+        self.journal.replay(components)
+
+        self.assertEqual(components['service://foo/app'].state, 'up')
+        self.assertEqual(components['host://bar'].state, 'uptodate')
+
+    def test_should_skip_changes_of_absent_components(self):
+        self.journal.append('service://other/app', 'state', 'down')
+
+        self.assertEqual(self.journal.replay(ComponentDict()), {})
+
+    def test_should_skip_incomplete_entry(self):
+        self.journal.append('service://foo/app', 'state', 'down')
+        with open(self.journal.filename, 'a') as f:
+            f.write('{"uri": "service://foo/ap')
+
+        self.assertEqual(len(self.journal.entries()), 1)
+
+    def test_should_be_empty_after_clear(self):
+        self.journal.append('service://foo/app', 'state', 'down')
+
+        self.journal.clear()
+
+        self.assertEqual(self.journal.entries(), [])
@@ -0,0 +1,269 @@
+import unittest
+
+from twisted.internet import defer
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from mock import Mock
+
+from yadtshell.constants import STATUS_INITIAL_IN_FLIGHT
+from yadtshell.status_scheduler import (StatusHistory,
+                                        StatusScheduler,
+                                        StatusDeadlineExceeded)
+
+
+def unreachable():
+    return Failure(Mock(exitCode=255))
+
+
+class StatusHistoryTests(unittest.TestCase):
+
+    def test_should_estimate_mean_latency(self):
+        history = StatusHistory()
+        history.record('foo', 1.0)
+        history.record('foo', 3.0)
+
+        self.assertEqual(history.estimate('foo'), 2.0)
+        self.assertEqual(history.estimate('bar'), None)
+
+    def test_should_only_keep_latest_latencies(self):
+        history = StatusHistory()
+        for latency in range(100):
+            history.record('foo', float(latency))
+
+        self.assertEqual(len(history.latencies['foo']), 20)
+        self.assertEqual(history.latencies['foo'][-1], 99.0)
+
+    def test_should_compute_percentile_latency(self):
+        history = StatusHistory({'foo': [float(i) for i in range(1, 21)]})
+
+        self.assertEqual(history.percentile('foo', 95), 19.0)
+        self.assertEqual(history.percentile('foo', 50), 10.0)
+
+    def test_should_not_compute_percentile_without_enough_samples(self):
+        history = StatusHistory({'foo': [1.0, 2.0]})
+
+        self.assertEqual(history.percentile('foo', 95), None)
+        self.assertEqual(history.percentile('bar', 95), None)
+
+    def test_should_order_unknown_and_slow_hosts_first(self):
+        history = StatusHistory({'fast': [0.1], 'slow': [5.0]})
+
+        self.assertEqual(history.slowest_first(['fast', 'slow', 'new']),
+                         ['new', 'slow', 'fast'])
+
+
+class StatusSchedulerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.queries = {}
+
+    def query(self, hostname):
+        self.queries[hostname] = defer.Deferred()
+        return self.queries[hostname]
+
+    def create_scheduler(self, **kwargs):
+        kwargs.setdefault('clock', self.clock)
+        return StatusScheduler(self.query, **kwargs)
+
+    def test_should_not_exceed_initial_window(self):
+        scheduler = self.create_scheduler(initial_in_flight=2, min_in_flight=1)
+
+        scheduler.schedule(['a', 'b', 'c'])
+
+        self.assertEqual(sorted(self.queries.keys()), ['a', 'b'])
+        self.assertEqual(scheduler.in_flight, 2)
+
+    def test_should_return_deferreds_in_order_of_hosts(self):
+        scheduler = self.create_scheduler(
+            history=StatusHistory({'a': [0.1], 'b': [9.0]}))
+
+        deferreds = scheduler.schedule(['a', 'b'])
+
+        self.assertEqual([d.name for d in deferreds], ['a', 'b'])
+
+    def test_should_dispatch_historically_slow_hosts_first(self):
+        started = []
+        scheduler = StatusScheduler(
+            lambda hostname: started.append(hostname) or defer.Deferred(),
+            history=StatusHistory({'a': [0.1], 'b': [9.0]}),
+            initial_in_flight=1, min_in_flight=1, clock=self.clock)
+
+        scheduler.schedule(['a', 'b'])
+
+        self.assertEqual(started, ['b'])
+
+    def test_should_pass_results_to_host_deferred_and_dispatch_next_host(self):
+        scheduler = self.create_scheduler(initial_in_flight=1, min_in_flight=1)
+        results = []
+        deferreds = scheduler.schedule(['a', 'b'])
+        deferreds[0].addCallback(results.append)
+
+        self.queries['a'].callback('protocol-of-a')
+
+        self.assertEqual(results, ['protocol-of-a'])
+        self.assertTrue('b' in self.queries)
+
+    def test_should_grow_window_on_clean_answers(self):
+        scheduler = self.create_scheduler(initial_in_flight=2, min_in_flight=1)
+        scheduler.schedule(['a', 'b', 'c', 'd'])
+
+        self.queries['a'].callback(None)
+        self.assertEqual(scheduler.window, 2.5)
+        self.assertEqual(sorted(self.queries.keys()), ['a', 'b', 'c'])
+
+        self.queries['b'].callback(None)
+        self.assertEqual(scheduler.window, 2.9)
+        self.assertEqual(sorted(self.queries.keys()), ['a', 'b', 'c', 'd'])
+
+    def test_should_halve_window_once_per_round_on_unreachable_hosts(self):
+        scheduler = self.create_scheduler(initial_in_flight=8, min_in_flight=1)
+        deferreds = scheduler.schedule(['a', 'b', 'c'])
+        for d in deferreds:
+            d.addErrback(lambda _: None)
+
+        self.queries['a'].errback(unreachable())
+        self.queries['b'].errback(unreachable())
+
+        self.assertEqual(scheduler.window, 4)
+
+    def test_should_shrink_window_when_answer_is_much_slower_than_usual(self):
+        scheduler = self.create_scheduler(
+            initial_in_flight=8, min_in_flight=1,
+            history=StatusHistory({'a': [1.0]}))
+        scheduler.schedule(['a'])
+
+        self.clock.advance(10)
+        self.queries['a'].callback(None)
+
+        self.assertEqual(scheduler.window, 4)
+
+    def test_should_not_shrink_window_below_minimum(self):
+        scheduler = self.create_scheduler(initial_in_flight=4, min_in_flight=4)
+        deferreds = scheduler.schedule(['a'])
+        deferreds[0].addErrback(lambda _: None)
+
+        self.queries['a'].errback(unreachable())
+
+        self.assertEqual(scheduler.window, 4)
+
+    def test_should_record_latency_of_reachable_hosts_only(self):
+        history = StatusHistory()
+        scheduler = self.create_scheduler(history=history)
+        deferreds = scheduler.schedule(['a', 'b'])
+        deferreds[1].addErrback(lambda _: None)
+
+        self.clock.advance(2)
+        self.queries['a'].callback(None)
+        self.queries['b'].errback(unreachable())
+
+        self.assertEqual(history.latencies, {'a': [2]})
+
+    def test_should_fail_host_past_deadline(self):
+        scheduler = self.create_scheduler(deadline=30)
+        failures = []
+        deferreds = scheduler.schedule(['a'])
+        deferreds[0].addErrback(failures.append)
+        query = self.queries['a']
+
+        self.clock.advance(30)
+
+        self.assertTrue(failures[0].check(StatusDeadlineExceeded))
+        self.assertEqual(failures[0].value.component, 'a')
+        self.assertTrue(query.called)
+        self.assertEqual(scheduler.in_flight, 0)
+        self.assertEqual(scheduler.history.latencies, {})
+        self.assertEqual(scheduler.window, STATUS_INITIAL_IN_FLIGHT)
+
+    def test_should_not_fail_host_answering_before_deadline(self):
+        scheduler = self.create_scheduler(deadline=30)
+        results = []
+        deferreds = scheduler.schedule(['a'])
+        deferreds[0].addBoth(results.append)
+
+        self.clock.advance(10)
+        self.queries['a'].callback('protocol-of-a')
+        self.clock.advance(30)
+
+        self.assertEqual(results, ['protocol-of-a'])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+class HedgedStatusQueryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.queries = []
+        self.scheduler = StatusScheduler(
+            self.query, history=StatusHistory({'a': [1.0] * 19 + [2.0]}),
+            hedging=True, clock=self.clock)
+
+    def query(self, hostname):
+        self.queries.append(defer.Deferred())
+        return self.queries[-1]
+
+    def test_should_not_hedge_before_p95_latency(self):
+        self.scheduler.schedule(['a'])
+
+        self.clock.advance(0.5)
+
+        self.assertEqual(len(self.queries), 1)
+
+    def test_should_hedge_host_slower_than_p95_latency(self):
+        self.scheduler.schedule(['a'])
+
+        self.clock.advance(1)
+
+        self.assertEqual(len(self.queries), 2)
+
+    def test_should_take_first_answer_and_cancel_the_other_query(self):
+        results = []
+        deferreds = self.scheduler.schedule(['a'])
+        deferreds[0].addBoth(results.append)
+        self.clock.advance(1)
+
+        self.queries[1].callback('hedged answer')
+
+        self.assertEqual(results, ['hedged answer'])
+        self.assertTrue(self.queries[0].called)
+        self.queries[0].addErrback(lambda _: None)
+
+    def test_should_wait_for_other_query_when_one_fails(self):
+        results = []
+        deferreds = self.scheduler.schedule(['a'])
+        deferreds[0].addBoth(results.append)
+        self.clock.advance(1)
+
+        self.queries[0].errback(unreachable())
+        self.assertEqual(results, [])
+        self.queries[1].callback('hedged answer')
+
+        self.assertEqual(results, ['hedged answer'])
+
+    def test_should_count_hedged_query_in_flight_until_it_is_cancelled(self):
+        self.scheduler.schedule(['a'])
+        self.clock.advance(1)
+        self.assertEqual(self.scheduler.in_flight, 2)
+
+        self.queries[1].addErrback(lambda _: None)
+        self.queries[0].callback('first answer')
+
+        self.assertEqual(self.scheduler.in_flight, 0)
+
+    def test_should_not_hedge_when_window_is_full(self):
+        scheduler = StatusScheduler(
+            self.query, history=StatusHistory({'a': [1.0] * 20, 'b': [1.0] * 20}),
+            initial_in_flight=2, min_in_flight=1, hedging=True, clock=self.clock)
+        scheduler.schedule(['a', 'b'])
+
+        self.clock.advance(1)
+
+        self.assertEqual(len(self.queries), 2)
+        self.assertEqual(scheduler.in_flight, 2)
+
+    def test_should_not_hedge_hosts_without_history(self):
+        self.scheduler.schedule(['new'])
+
+        self.clock.advance(100)
+
+        self.assertEqual(len(self.queries), 1)
@@ -8,8 +8,13 @@ from twisted.python.failure import Failure
 import yadtshell
 from yadtshell.status import (handle_readonly_service_states,
                               fetch_missing_services_as_readonly,
+                              known_components_outside_of,
+                              record_snapshot,
                               write_host_data_to_file)
-from yadtshell.components import MissingComponent
+from yadtshell.components import (ComponentDict, Host, Service,
+                                  ReadonlyService, MissingComponent)
+from yadtshell.dependency_tree import DependencyTreeBuilder
+from yadtshell.status_scheduler import StatusDeadlineExceeded
 
 
 class ReadonlyStateTests(unittest.TestCase):
@@ -67,6 +72,26 @@ class ReadonlyStateTests(unittest.TestCase):
         fetch_missing_services_as_readonly('', components)
         deferred_list_mock.assert_called_with(['foo', 'foo'], consumeErrors=True)
 
+    @patch('yadtshell.components.readonly_services_status')
+    @patch('yadtshell.components.ReadonlyService.status')
+    @patch('yadtshell._status.defer.DeferredList')
+    def test_fetch_missing_services_as_readonly_should_group_services_by_host(
+            self, deferred_list_mock, status_mock, readonly_services_status):
+        components = {
+            'service://foo/missing': MissingComponent('service://foo/missing'),
+            'service://foo/other': MissingComponent('service://foo/other'),
+            'service://bar/missing': MissingComponent('service://bar/missing'),
+        }
+        status_mock.return_value = 'bar'
+        readonly_services_status.return_value = ['foo', 'foo']
+
+        fetch_missing_services_as_readonly('', components)
+
+        grouped_services = readonly_services_status.call_args[0][0]
+        self.assertEqual(sorted([s.uri for s in grouped_services]),
+                         ['service://foo/missing', 'service://foo/other'])
+        deferred_list_mock.assert_called_with(['bar', 'foo', 'foo'], consumeErrors=True)
+
 
 class MyCustomService(yadtshell.components.Service):
     pass
@@ -129,15 +154,36 @@ class StatusTests(unittest.TestCase):
         os.path.join.assert_called_with(yadtshell.settings.OUT_DIR, 'current_state_foobar42.yaml')
         os.remove.assert_called_with(os.path.join.return_value)
 
+    @patch('yadtshell._status.IgnoredHostsSnapshot')
     @patch('yadtshell.twisted.ProgressIndicator')
     @patch('yadtshell._status.query_status')
     @patch('yadtshell._status.os')
-    def test_should_setup_deferred_list_with_two_hosts(self, _, query_status, pi):
+    def test_should_setup_deferred_list_with_two_hosts(self, _, query_status, pi, ignored_hosts):
         yadtshell.status(hosts=['foobar42', 'foobar43'])
 
         self.assertEqual(query_status.call_args_list, [
-            call('foobar42', {}, pi.return_value),
-            call('foobar43', {}, pi.return_value)])
+            call('foobar42', {}, pi.return_value, ignored_hosts.return_value, None),
+            call('foobar43', {}, pi.return_value, ignored_hosts.return_value, None)])
+
+    @patch('yadtshell._status.IgnoredHostsSnapshot')
+    @patch('yadtshell._status.query_status')
+    @patch('yadtshell._status.os')
+    def test_should_prefetch_ignored_hosts_once_per_target(self, _, query_status, ignored_hosts):
+        yadtshell.status(hosts=['foobar42', 'foobar43'])
+
+        ignored_hosts.assert_called_once_with(yadtshell.settings.ybc, 'test')
+        ignored_hosts.return_value.fetch.assert_called_once_with()
+
+    def test_query_status_should_look_up_ignore_state_in_snapshot(self):
+        ignored_hosts = Mock()
+        ignored_hosts.status_ignored.return_value = defer.succeed('maintenance')
+        components = {}
+
+        yadtshell._status.query_status('foobar42.domain.tld', components,
+                                       ignored_hosts=ignored_hosts)
+
+        ignored_hosts.status_ignored.assert_called_with('foobar42')
+        self.assertTrue(components['host://foobar42'].is_ignored)
 
     @patch('yadtshell._status.os.environ')
     @patch('yadtshell._status.reactor.spawnProcess')
@@ -150,6 +196,20 @@ class StatusTests(unittest.TestCase):
         spawn_process.assert_called_with(
             protocol.return_value, 'ssh', ['ssh', 'host://foobar42'], environment)
 
+    @patch('yadtshell._status.os.environ')
+    @patch('yadtshell._status.reactor.spawnProcess')
+    @patch('yadtshell.twisted.YadtProcessProtocol')
+    def test_query_status_should_pass_hash_of_known_payload(self, protocol, spawn_process, environment):
+        result_or_failure = Failure(Exception())
+        yadtshell._status.handle_ignored_status(
+            result_or_failure, component_name='host://foobar42',
+            components={"host://foobar42": Mock()}, pi=None, status_hash='cafe')
+        protocol.assert_called_with(
+            'host://foobar42', '/usr/bin/yadt-status', None, out_log_level=logging.NOTSET)
+        spawn_process.assert_called_with(
+            protocol.return_value, 'ssh',
+            ['ssh', 'host://foobar42', 'YADT_STATUS_IF_NONE_MATCH=cafe sh'], environment)
+
     @patch('yadtshell._status.logger')
     def test_handle_unreachable_host_ignored(self, _):
         failure = Mock()
@@ -166,6 +226,28 @@ class StatusTests(unittest.TestCase):
         self.assertTrue('host://foobar42' in components)
         self.assertEqual(components['host://foobar42'], result, "components.keys() = %s" % components.keys())
 
+    @patch('yadtshell._status.logger')
+    def test_handle_host_past_deadline_as_unreachable_host(self, _):
+        failure = Failure(StatusDeadlineExceeded('foobar42.domain.tld', 300))
+        components = {}
+        yadtshell.settings.ignore_unreachable_hosts = False
+
+        result = yadtshell._status.handle_failing_status(failure, components, True)
+
+        self.assertTrue(isinstance(result, yadtshell.components.UnreachableHost))
+        self.assertEqual(components['host://foobar42'], result)
+
+    @patch('yadtshell._status.logger')
+    def test_handle_host_past_deadline_not_ignored(self, _):
+        failure = Failure(StatusDeadlineExceeded('foobar42.domain.tld', 300))
+        components = {}
+        yadtshell.settings.ignore_unreachable_hosts = False
+
+        result = yadtshell._status.handle_failing_status(failure, components)
+
+        self.assertTrue(result is failure)
+        self.assertEqual(components, {})
+
     @patch('yadtshell._status.logger')
     def test_handle_unreachable_host_not_ignored(self, _):
         failure = Mock()
@@ -213,6 +295,52 @@ class StatusTests(unittest.TestCase):
 
         self.assertEqual(result_host.is_update_needed(), True)
 
+    @patch("yadtshell._status.write_host_data_to_file")
+    def test_should_build_changed_host_and_cache_it(self, _):
+        host_cache = Mock()
+        host_cache.restore.return_value = None
+        components = yadtshell.components.ComponentDict()
+        protocol = Mock(component='foobar42.acme.com',
+                        data='{"fqdn": "foobar42.acme.com", "current_artefacts": ["foo/1.0"]}')
+
+        host = yadtshell._status.create_host_with_components(protocol, components, host_cache)
+
+        self.assertTrue('artefact://foobar42/foo/1.0' in components)
+        host_cache.store.assert_called_with(
+            'foobar42.acme.com', protocol.data, host, components, None)
+
+    @patch("yadtshell._status.spawn_status_query")
+    @patch("yadtshell._status.write_host_data_to_file")
+    def test_should_query_full_status_when_conditional_answer_is_unresolvable(
+            self, _, spawn_status_query):
+        host_cache = Mock()
+        host_cache.payload.return_value = None
+        host_cache.restore.return_value = None
+        components = yadtshell.components.ComponentDict()
+        protocol = Mock(component='foobar42.acme.com',
+                        data='{"yadt_status": "unchanged", "hash": "unknown"}')
+        full_protocol = Mock(component='foobar42.acme.com',
+                             data='{"fqdn": "foobar42.acme.com", "current_artefacts": ["foo/1.0"]}')
+        spawn_status_query.return_value = defer.succeed(full_protocol)
+
+        d = yadtshell._status.create_host_with_components(protocol, components, host_cache)
+
+        spawn_status_query.assert_called_with('foobar42.acme.com')
+        self.assertEqual(d.result.fqdn, 'foobar42.acme.com')
+        self.assertTrue('artefact://foobar42/foo/1.0' in components)
+
+    @patch("yadtshell._status.create_host")
+    @patch("yadtshell._status.write_host_data_to_file")
+    def test_should_restore_unchanged_host_from_cache(self, write_host_data_to_file, create_host):
+        host_cache = Mock()
+        protocol = Mock(component='foobar42.acme.com', data='{}')
+
+        host = yadtshell._status.create_host_with_components(protocol, {}, host_cache)
+
+        self.assertTrue(host is host_cache.restore.return_value)
+        self.assertFalse(create_host.called)
+        write_host_data_to_file.assert_called_with('foobar42.acme.com', '{}')
+
     @patch("yadtshell._status.write_host_data_to_file")
     def test_should_create_host_from_yaml(self, _):
         components = {}
@@ -276,6 +404,18 @@ some_attribute: some-value
         result_class = yadtshell._status.get_service_class_from_fallbacks(myhost, "module_for_class_loading.Example")
         self.assertEqual(result_class.__name__, "Example")
 
+    @patch('yadtshell._status.service_registry')
+    def test_get_service_class_from_fallbacks_should_be_memoized(self, service_registry):
+        service_registry.fallbacks = {}
+        myhost = Mock()
+        first_class = yadtshell._status.get_service_class_from_fallbacks(myhost, "module_for_class_loading.Example")
+        myhost.reset_mock()
+
+        second_class = yadtshell._status.get_service_class_from_fallbacks(myhost, "module_for_class_loading.Example")
+
+        self.assertEqual(first_class, second_class)
+        self.assertFalse(myhost.logger.debug.called)
+
     def test_initialize_artefacts(self):
         host = yadtshell.components.Host("foo.bar.com")
         host.current_artefacts = ["arte/0", "fact/2"]
@@ -335,3 +475,160 @@ class HostStatusToFileTests(unittest.TestCase):
 
         mock_open.assert_called_with('/tmp/yadtshell-logs/yadtshell.log.somehost.status', 'w')
         fake_file.write.assert_called_with("{'key': 'value',\n}")
+
+
+class ScopedStatusTests(unittest.TestCase):
+
+    def setUp(self):
+        yadtshell.settings.TARGET_SETTINGS = {
+            'name': 'test',
+            'hosts': ['foo.acme.com', 'bar.acme.com', 'baz.acme.com']}
+        self.components = ComponentDict()
+        for fqdn, services in [('foo.acme.com', [('app', {'needs_services': ['service://bar/db']})]),
+                               ('bar.acme.com', [('db', {'needs_services': ['service://ro/queue']})]),
+                               ('baz.acme.com', [('cron', {})])]:
+            host = Host(fqdn)
+            host.current_artefacts = host.next_artefacts = []
+            host.defined_services = []
+            self.components[host.uri] = host
+            for name, settings in services:
+                service = Service(host, name, settings)
+                host.defined_services.append(service)
+                self.components[service.uri] = service
+        self.components['service://ro/queue'] = ReadonlyService(Host('ro'), 'queue')
+        DependencyTreeBuilder(self.components).finish()
+
+    @patch('yadtshell._status.status')
+    @patch('yadtshell.util.restore_current_state')
+    def test_should_query_hosts_of_dependency_closure_only(self, restore_current_state, status):
+        restore_current_state.return_value = self.components
+
+        yadtshell.scoped_status(['service://bar/db'], ignore_unreachable_hosts=True)
+
+        self.assertEqual(status.call_args[1]['hosts'], ['foo.acme.com', 'bar.acme.com'])
+        self.assertEqual(status.call_args[1]['ignore_unreachable_hosts'], True)
+        self.assertEqual(sorted(status.call_args[1]['known_components'].keys()),
+                         ['host://baz', 'service://baz/cron'])
+
+    @patch('yadtshell._status.status')
+    @patch('yadtshell.util.restore_current_state')
+    def test_should_scope_host_uri_to_needs_of_its_services(self, restore_current_state, status):
+        restore_current_state.return_value = self.components
+
+        yadtshell.scoped_status(['host://foo'])
+
+        self.assertEqual(status.call_args[1]['hosts'], ['foo.acme.com', 'bar.acme.com'])
+
+    @patch('yadtshell._status.status')
+    @patch('yadtshell.util.restore_current_state')
+    def test_should_query_all_hosts_without_stored_state(self, restore_current_state, status):
+        restore_current_state.side_effect = IOError('Serialized state is too old')
+
+        yadtshell.scoped_status(['service://bar/db'])
+
+        status.assert_called_with()
+
+    @patch('yadtshell._status.status')
+    @patch('yadtshell.util.restore_current_state')
+    def test_should_query_all_hosts_when_scope_covers_target(self, restore_current_state, status):
+        restore_current_state.return_value = self.components
+
+        yadtshell.scoped_status(['service://bar/db', 'host://baz'])
+
+        status.assert_called_with()
+
+    @patch('yadtshell._status.status')
+    def test_should_query_all_hosts_without_uris(self, status):
+        yadtshell.scoped_status([])
+
+        status.assert_called_with()
+
+    def test_should_keep_components_of_other_hosts_unwired(self):
+        known = known_components_outside_of(self.components, ['foo.acme.com'], set())
+
+        self.assertFalse('service://foo/app' in known)
+        self.assertEqual(known['service://bar/db'].needed_by, set())
+        self.assertTrue('service://ro/queue' in known)
+
+    def test_should_drop_readonly_services_to_be_rescanned(self):
+        known = known_components_outside_of(self.components, ['foo.acme.com'],
+                                            set(['service://ro/queue']))
+
+        self.assertFalse('service://ro/queue' in known)
+
+
+class SnapshotTests(unittest.TestCase):
+
+    def setUp(self):
+        yadtshell.settings.TARGET_SETTINGS = {
+            'name': 'test', 'hosts': ['foo.acme.com', 'bar.acme.com']}
+        self.components = ComponentDict()
+        for fqdn in ['foo.acme.com', 'bar.acme.com']:
+            host = Host(fqdn)
+            host.current_artefacts = host.next_artefacts = []
+            service = Service(host, 'app', {})
+            host.defined_services = [service]
+            self.components[host.uri] = host
+            self.components[service.uri] = service
+            record_snapshot(host, self.components, status_time=100.0)
+        DependencyTreeBuilder(self.components).finish()
+
+    def test_should_record_snapshot_on_host_and_its_services(self):
+        host_cache = Mock(entries={'foo.acme.com': ('digest', 'blob', 'payload', 'hash')})
+
+        record_snapshot(self.components['host://foo'], self.components, host_cache, 200.0)
+
+        self.assertEqual(self.components['service://foo/app'].status_time, 200.0)
+        self.assertEqual(self.components['service://foo/app'].status_snapshot, 'digest')
+        self.assertEqual(self.components['service://bar/app'].status_time, 100.0)
+
+    @patch('yadtshell._status.status')
+    @patch('yadtshell._status.time.time')
+    @patch('yadtshell.util.restore_current_state')
+    def test_should_query_only_hosts_older_than_max_age(self, restore_current_state, now, status):
+        restore_current_state.return_value = self.components
+        self.components['host://bar'].status_time = 90.0
+        now.return_value = 105.0
+
+        yadtshell.status(max_age=10, ignore_unreachable_hosts=True)
+
+        self.assertEqual(status.call_args[1]['hosts'], ['bar.acme.com'])
+        self.assertEqual(status.call_args[1]['ignore_unreachable_hosts'], True)
+        self.assertEqual(sorted(status.call_args[1]['known_components'].keys()),
+                         ['host://foo', 'service://foo/app'])
+
+    @patch('yadtshell._status.status')
+    @patch('yadtshell._status.time.time')
+    @patch('yadtshell.util.restore_current_state')
+    def test_should_query_unreachable_hosts_again(self, restore_current_state, now, status):
+        unreachable = yadtshell.components.UnreachableHost('bar.acme.com')
+        unreachable.status_time = 100.0
+        self.components['host://bar'] = unreachable
+        restore_current_state.return_value = self.components
+        now.return_value = 105.0
+
+        yadtshell.status(max_age=10)
+
+        self.assertEqual(status.call_args[1]['hosts'], ['bar.acme.com'])
+
+    @patch('yadtshell.info')
+    @patch('yadtshell._status.status')
+    @patch('yadtshell._status.time.time')
+    @patch('yadtshell.util.restore_current_state')
+    def test_should_not_query_when_all_hosts_are_fresh(self, restore_current_state, now, status, info):
+        restore_current_state.return_value = self.components
+        now.return_value = 105.0
+
+        yadtshell.status(max_age=10)
+
+        self.assertFalse(status.called)
+        info.assert_called_with(components=self.components)
+
+    @patch('yadtshell._status.status')
+    @patch('yadtshell.util.restore_current_state')
+    def test_should_query_all_hosts_without_stored_state(self, restore_current_state, status):
+        restore_current_state.side_effect = IOError()
+
+        yadtshell.status(max_age=10)
+
+        status.assert_called_with(hosts=None)
@@ -0,0 +1,238 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+import simplejson as json
+from mock import Mock, patch
+from twisted.internet import defer
+from twisted.test.proto_helpers import StringTransport
+
+import yadtshell
+from yadtshell.statusd import (StatusDaemon, StatusdFactory,
+                               capture_output, request, socket_path)
+
+
+def serve_once(path, answer):
+    """Answers the next request on `path` with `answer`, returns the
+    thread collecting the request.
+    """
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+    received = []
+
+    def run():
+        connection, _ = server.accept()
+        received.append(connection.recv(65536))
+        connection.sendall(answer)
+        connection.close()
+        server.close()
+
+    thread = threading.Thread(target=run)
+    thread.received = received
+    thread.start()
+    return thread
+
+
+class StatusdClientTests(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.settings = patch.multiple(yadtshell.settings,
+                                       OUTPUT_DIR=self.output_dir,
+                                       OUT_DIR='/some/target')
+        self.settings.start()
+
+    def tearDown(self):
+        self.settings.stop()
+        shutil.rmtree(self.output_dir)
+
+    def test_should_place_socket_per_target_in_output_dir(self):
+        path = socket_path()
+
+        self.assertEqual(os.path.dirname(path), self.output_dir)
+        with patch.object(yadtshell.settings, 'OUT_DIR', '/other/target'):
+            self.assertNotEqual(socket_path(), path)
+
+    def test_should_return_none_without_daemon(self):
+        self.assertEqual(request('info'), None)
+
+    def test_should_return_none_when_socket_is_stale(self):
+        open(socket_path(), 'w').close()
+
+        self.assertEqual(request('info'), None)
+
+    def test_should_send_request_and_return_answer(self):
+        server = serve_once(socket_path(), '{"output": "target status"}')
+
+        answer = request('dump', args=['host://'])
+        server.join()
+
+        self.assertEqual(answer, {'output': 'target status'})
+        self.assertEqual(json.loads(server.received[0]),
+                         {'request': 'dump', 'arguments': {'args': ['host://']}})
+
+    def test_should_return_none_when_daemon_cannot_answer(self):
+        server = serve_once(socket_path(), '{"error": "no status available"}')
+
+        self.assertEqual(request('info'), None)
+        server.join()
+
+
+class StatusDaemonTests(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = StatusDaemon()
+        self.daemon.current_components = Mock(return_value={'host://foo': Mock()})
+        self.answers = []
+
+    def handle(self, name, **arguments):
+        self.daemon.handle(name, arguments).addCallback(self.answers.append)
+        return self.answers[-1] if self.answers else None
+
+    def test_should_answer_ping(self):
+        answer = self.handle('ping')
+
+        self.assertEqual(answer['pid'], os.getpid())
+
+    def test_should_render_info_from_resident_components(self):
+        def info(components, **kwargs):
+            print('%i components' % len(components))
+
+        with patch('yadtshell.info', info):
+            answer = self.handle('info')
+
+        self.assertEqual(answer, {'output': '1 components\n'})
+
+    def test_should_pass_arguments_to_info(self):
+        with patch('yadtshell.info') as info:
+            self.handle('info', full=True, verbose=False)
+
+        info.assert_called_with(components=self.daemon.current_components.return_value,
+                                full=True, verbose=False)
+
+    def test_should_pass_arguments_to_dump(self):
+        with patch('yadtshell.dump') as dump:
+            self.handle('dump', args=['host://'], attribute=True)
+
+        dump.assert_called_with(components=self.daemon.current_components.return_value,
+                                args=['host://'], attribute=True)
+
+    def test_should_refuse_to_answer_without_status(self):
+        self.daemon.current_components.return_value = None
+
+        self.assertTrue('error' in self.handle('info'))
+
+    def test_should_refuse_unknown_requests(self):
+        self.assertTrue('error' in self.handle('plan'))
+
+    def test_should_refuse_to_answer_after_target_changed(self):
+        self.daemon.target_mtime = -1
+
+        self.assertTrue('error' in self.handle('ping'))
+
+    def test_should_turn_errors_into_error_answers(self):
+        with patch('yadtshell.info', Mock(side_effect=SystemExit(1))):
+            self.assertTrue('error' in self.handle('info'))
+        with patch('yadtshell.info', Mock(side_effect=IOError('gone'))):
+            self.assertEqual(self.handle('info'), {'error': 'gone'})
+
+    @patch('yadtshell.info')
+    @patch('yadtshell.status')
+    def test_should_let_concurrent_status_requests_share_one_status(self, status, _):
+        status.return_value = defer.Deferred()
+
+        self.daemon.handle('status', {}).addCallback(self.answers.append)
+        self.daemon.handle('status', {}).addCallback(self.answers.append)
+        self.assertEqual(status.call_count, 1)
+        self.assertEqual(self.answers, [])
+
+        status.return_value.callback(None)
+
+        self.assertEqual(self.answers, [{'output': ''}, {'output': ''}])
+        self.assertEqual(self.daemon.pending_status, None)
+
+    @patch('yadtshell.info')
+    @patch('yadtshell.status')
+    def test_should_pass_arguments_to_status(self, status, _):
+        status.return_value = defer.succeed(None)
+
+        self.handle('status', hosts=['foo'], max_age=60)
+
+        status.assert_called_with(hosts=['foo'], max_age=60, ignore_unreachable_hosts=True)
+
+    @patch('yadtshell.statusd.service_registry')
+    @patch('yadtshell.info')
+    @patch('yadtshell.status')
+    def test_should_resolve_service_classes_anew_only_when_plugins_changed(self, status, _, registry):
+        status.return_value = defer.succeed(None)
+
+        self.handle('status')
+
+        registry.invalidate_if_plugins_changed.assert_called_with()
+        self.assertFalse(registry.invalidate.called)
+
+    @patch('yadtshell.info')
+    @patch('yadtshell.status')
+    def test_should_answer_status_despite_unreachable_host(self, status, _):
+        def status_with_unreachable_host(ignore_unreachable_hosts=False, **kwargs):
+            if not ignore_unreachable_hosts:
+                return defer.fail(Exception('errors occured during status'))
+            return defer.succeed(None)
+        status.side_effect = status_with_unreachable_host
+
+        answer = self.handle('status', ignore_unreachable_hosts=False)
+
+        self.assertEqual(answer, {'output': ''})
+
+    @patch('yadtshell.status')
+    def test_should_refuse_status_request_with_other_arguments_while_status_runs(self, status):
+        status.return_value = defer.Deferred()
+
+        self.daemon.handle('status', {}).addCallback(self.answers.append)
+        answer = self.handle('status', max_age=60)
+
+        self.assertEqual(status.call_count, 1)
+        self.assertTrue('error' in answer)
+
+    @patch('yadtshell.status')
+    def test_should_answer_error_when_status_fails(self, status):
+        status.return_value = defer.fail(Exception('errors occured during status'))
+
+        answer = self.handle('status')
+
+        self.assertEqual(answer, {'error': 'status failed: errors occured during status'})
+
+
+class StatusdProtocolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = Mock()
+        self.daemon.handle.return_value = defer.succeed({'output': 'ok'})
+        self.protocol = StatusdFactory(self.daemon).buildProtocol(None)
+        self.transport = StringTransport()
+        self.protocol.makeConnection(self.transport)
+
+    def test_should_answer_request_and_close_connection(self):
+        self.protocol.dataReceived('{"request": "info", "arguments": {"full": true}}\r\n')
+
+        self.daemon.handle.assert_called_with('info', {'full': True})
+        self.assertEqual(json.loads(self.transport.value()), {'output': 'ok'})
+        self.assertTrue(self.transport.disconnecting)
+
+    def test_should_answer_invalid_requests_with_error(self):
+        self.protocol.dataReceived('info\r\n')
+
+        self.assertTrue('error' in json.loads(self.transport.value()))
+
+
+class CaptureOutputTests(unittest.TestCase):
+
+    def test_should_return_printed_output(self):
+        def fun(text):
+            print(text)
+
+        self.assertEqual(capture_output(fun, 'hello'), 'hello\n')
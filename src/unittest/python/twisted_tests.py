@@ -91,3 +91,22 @@ class TwistedTests(unittest.TestCase):
         YadtProcessProtocol.errReceived(mock_process_protocol, 'data')
 
         mock_progress_indicator.update.assert_called_with(('command', 'component'))
+
+    def test_cancel_should_kill_process(self):
+        protocol = YadtProcessProtocol('component', 'command')
+        protocol.transport = Mock()
+        protocol.deferred.addErrback(lambda _: None)
+
+        protocol.deferred.cancel()
+
+        protocol.transport.signalProcess.assert_called_with('KILL')
+
+    def test_finish_should_not_fire_cancelled_deferred_again(self):
+        protocol = YadtProcessProtocol('component', 'command')
+        protocol.transport = Mock()
+        protocol.deferred.addErrback(lambda _: None)
+        protocol.deferred.cancel()
+
+        protocol.finish(Mock(value=Mock(exitCode=-9)))
+
+        self.assertEqual(protocol.exitcode, -9)
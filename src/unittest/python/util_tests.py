@@ -9,8 +9,10 @@ from yadtshell.util import (inbound_deps_on_same_host,
                             calculate_max_tries_for_interval_and_delay,
                             render_state,
                             restore_current_state,
+                            store_current_state,
                             get_mtime_of_current_state,
                             get_age_of_current_state_in_seconds,
+                            get_age_of_status_in_seconds,
                             filter_missing_services,
                             first_error_line,
                             log_exceptions)
@@ -171,6 +173,21 @@ class ServiceOrderingTests(unittest.TestCase):
 
         self.assertEqual(self.bar_service.dependency_score, -1)
 
+    def test_should_count_dependencies_once_per_path_in_diamonds(self):
+        self.components['service://foobar42/topservice'] = Service(Host('foo.bar.com'), 'topservice', {})
+        top_service = self.components['service://foobar42/topservice']
+        top_service.needs = ['service://foobar42/barservice', 'service://foobar42/bazservice']
+        self.bar_service.needs = ['service://foobar42/ackservice']
+        self.baz_service.needs = ['service://foobar42/ackservice']
+        self.ack_service.needed_by = ['service://foobar42/barservice', 'service://foobar42/bazservice']
+        self.bar_service.needed_by = self.baz_service.needed_by = ['service://foobar42/topservice']
+
+        compute_dependency_scores(self.components)
+
+        self.assertEqual(top_service.dependency_score, -4)
+        self.assertEqual(self.ack_service.dependency_score, 4)
+        self.assertEqual(self.bar_service.dependency_score, 0)
+
     def test_should_ignore_cross_host_inward_dependencies(self):
         self.components['service://otherhost/foo'] = Service(self.otherhost, 'foo', {})
         self.bar_service.needed_by = ['service://otherhost/foo']
@@ -247,26 +264,53 @@ class CurrentStateTests(unittest.TestCase):
 
         self.assertEqual(get_mtime_of_current_state(), 42)
 
-        mtime_function.assert_called_with('/out/dir/current_state.components')
+        mtime_function.assert_called_with('/out/dir/current_state.db')
+
+    @patch('yadtshell.util.get_age_of_current_state_in_seconds')
+    @patch('yadtshell.util.StateJournal')
+    @patch('yadtshell.util.migrate_legacy_state')
+    @patch('yadtshell.util.StateStore')
+    def test_should_restore_current_state(self, state_store, migrate, journal, age_of_state):
+        age_of_state.return_value = 0
+
+        restored = restore_current_state()
+
+        state_store.assert_called_with('/out/dir/current_state.db')
+        migrate.assert_called_with(state_store.return_value)
+        state_store.return_value.load.assert_called_with(None)
+        journal.return_value.replay.assert_called_with(state_store.return_value.load.return_value)
+        self.assertEqual(restored, journal.return_value.replay.return_value)
+
+    @patch('yadtshell.util.StateJournal')
+    @patch('yadtshell.util.StateStore')
+    def test_should_clear_journal_when_storing_current_state(self, state_store, journal):
+        components = Mock()
+
+        store_current_state(components)
+
+        state_store.return_value.save.assert_called_with(components)
+        self.assertTrue(journal.return_value.clear.called)
 
     @patch('yadtshell.util.get_age_of_current_state_in_seconds')
-    @patch('yadtshell.util.restore')
-    def test_should_restore_current_state(self, restore_function, age_of_state):
+    @patch('yadtshell.util.StateJournal')
+    @patch('yadtshell.util.migrate_legacy_state')
+    @patch('yadtshell.util.StateStore')
+    def test_should_restore_components_of_given_hosts_only(self, state_store, _, journal, age_of_state):
         age_of_state.return_value = 0
 
-        restore_current_state()
+        restore_current_state(hosts=['foo'])
 
-        restore_function.assert_called_with('/out/dir/current_state.components')
+        state_store.return_value.load.assert_called_with(['foo'])
 
     @patch('yadtshell.util.get_age_of_current_state_in_seconds')
-    @patch('yadtshell.util.restore')
+    @patch('yadtshell.util.current_state_store')
     def test_should_raise_when_restored_state_is_too_old_and_must_be_fresh(self, _, age_of_state):
         age_of_state.return_value = 1337  # the limit is 600 for 10 minutes
 
         self.assertRaises(IOError, restore_current_state, must_be_fresh=True)
 
     @patch('yadtshell.util.get_age_of_current_state_in_seconds')
-    @patch('yadtshell.util.restore')
+    @patch('yadtshell.util.current_state_store')
     def test_should_not_raise_when_restored_state_is_too_old_and_must_not_be_fresh(self, _, age_of_state):
         age_of_state.return_value = 1337  # the limit is 600 for 10 minutes
 
@@ -280,6 +324,22 @@ class CurrentStateTests(unittest.TestCase):
 
         self.assertEqual(get_age_of_current_state_in_seconds(), 42)
 
+    @patch('yadtshell.util.time.time')
+    @patch('yadtshell.util.get_age_of_current_state_in_seconds')
+    def test_should_return_age_of_oldest_host_status(self, age_of_state, time):
+        age_of_state.return_value = 2
+        time.return_value = 144
+        components = {'host://foo': Mock(status_time=100.0),
+                      'host://bar': Mock(status_time=140.0)}
+
+        self.assertEqual(get_age_of_status_in_seconds(components), 44)
+
+    @patch('yadtshell.util.get_age_of_current_state_in_seconds')
+    def test_should_return_age_of_state_without_host_status_times(self, age_of_state):
+        age_of_state.return_value = 2
+
+        self.assertEqual(get_age_of_status_in_seconds({'host://foo': Mock()}), 2)
+
 
 class LogExceptionsTests(unittest.TestCase):
 
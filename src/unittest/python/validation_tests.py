@@ -28,6 +28,18 @@ class ServiceValidationTests(TestCase):
                           ServiceDefinitionValidator(self.servicedefs).assert_no_cycles_present
                           )
 
+    def test_should_name_edge_closing_the_cycle(self):
+        self.servicedefs['service://foo_host/foo'].needs = [
+            'service://bar_host/bar']
+        self.servicedefs['service://bar_host/bar'].needs = [
+            'service://foo_host/foo']
+
+        try:
+            ServiceDefinitionValidator(self.servicedefs).assert_no_cycles_present()
+            self.fail('cycle not found')
+        except EnvironmentError as e:
+            self.assertTrue(' -> ' in str(e))
+
 
 class TarjanSCCTests(TestCase):
 
@@ -66,3 +78,22 @@ class TarjanSCCTests(TestCase):
         strongly_connected_components = tarjan_scc(graph_with_cycle)
         self.assertEqual(strongly_connected_components, [
                          ('baz', 'bar', 'foo', 'abc'), ('g',), ('f',), ('k',), ('j',)])
+
+    def test_should_find_components_of_chains_longer_than_the_recursion_limit(self):
+        chain = dict(('node%i' % i, ['node%i' % (i + 1)]) for i in range(5000))
+        chain['node5000'] = ['node0']
+
+        strongly_connected_components = tarjan_scc(chain)
+
+        self.assertEqual(len(strongly_connected_components), 1)
+        self.assertEqual(len(strongly_connected_components[0]), 5001)
+
+    def test_should_report_edges_closing_cycles(self):
+        graph_with_cycle = {'foo': ['bar'],
+                            'bar': ['foo'],
+                            'baz': ['foo']}
+        closing_edges = []
+
+        tarjan_scc(graph_with_cycle, closing_edges)
+
+        self.assertEqual(closing_edges, [('bar', 'foo')])